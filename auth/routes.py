@@ -7,18 +7,24 @@ from typing import Optional
 
 import aiomysql
 from fastapi import APIRouter, Request, HTTPException, Depends, status, Form, UploadFile, File
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse
 import aiofiles
 from passlib.context import CryptContext 
 
 from db.dependencies import get_db_connection
+from settings.config import Config
 from common_deps import get_current_user, templates 
 from auth.models import UserRegister, UserLogin, VerifyCode 
 
 from utils.email_sender import send_verification_link_email 
+from utils.responses import FastJSONResponse
+from utils.rate_limit import rate_limit
+from utils.server_sessions import invalidate_user_sessions
+from chat.llm_config import prewarm_conversation_state
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
+config = Config()
 pwd_context = CryptContext(schemes=["argon2"], deprecated="auto") 
 
 
@@ -139,7 +145,7 @@ async def verify_email_link(
     finally:
         await cursor.close()
 
-@router.post("/register", response_class=JSONResponse)
+@router.post("/register", response_class=FastJSONResponse, dependencies=[Depends(rate_limit("register", config.RATE_LIMIT_REGISTER))])
 async def register_user(
     request: Request,
     user_data: UserRegister,
@@ -197,7 +203,7 @@ async def register_user(
         logger.info(f"Novo usuário registrado (e logado, não verificado): {user_data.email}")
         
 
-        return JSONResponse(
+        return FastJSONResponse(
             content={"message": "Cadastro concluído. Verifique seu email. Caso não receba, vefifique sua caixa de SPAM", "redirect_url": "/sucesso"},
             status_code=status.HTTP_201_CREATED
         )
@@ -215,7 +221,7 @@ async def register_user(
     finally:
         await cursor.close()
 
-@router.post("/login", response_class=JSONResponse)
+@router.post("/login", response_class=FastJSONResponse, dependencies=[Depends(rate_limit("login", config.RATE_LIMIT_LOGIN))])
 async def login_user(
     user_data: UserLogin,
     request: Request,
@@ -245,7 +251,7 @@ async def login_user(
             logger.warning(f"Tentativa de login falha para {user_data.email}: Email não verificado.")
 
 
-            return JSONResponse(
+            return FastJSONResponse(
                 content={
                     "message": "Sua conta não está verificada. Por favor, verifique seu email e tente novamente.",
 
@@ -255,10 +261,12 @@ async def login_user(
 
         request.session["user_id"] = user_record['id']
         request.session.pop("session_id", None)
+        # Carrega o estado da conversa em segundo plano enquanto o navegador vai para /chat.
+        prewarm_conversation_state(user_record['id'])
 
         logger.info(f"Usuário {user_record['id']} logado com sucesso.")
 
-        return JSONResponse(
+        return FastJSONResponse(
             content={"message": "Login realizado com sucesso!", "user_id": user_record['id'], "redirect_url": "/chat"},
             status_code=status.HTTP_200_OK
         )
@@ -275,7 +283,7 @@ async def get_verified_page(request: Request):
     """Serve a página de sucesso após a verificação por link."""
     return templates.TemplateResponse("verificado.html", {"request": request})
 
-@router.post("/resend_verification_code", response_class=JSONResponse)
+@router.post("/resend_verification_code", response_class=FastJSONResponse, dependencies=[Depends(rate_limit("resend_verification", config.RATE_LIMIT_RESEND_VERIFICATION))])
 async def resend_verification_link(
     request: Request,
     email: str = Form(...),
@@ -313,7 +321,7 @@ async def resend_verification_link(
 
         logger.info(f"Novo link de verificação enviado para {email}.")
 
-        return JSONResponse(
+        return FastJSONResponse(
             content={"message": "Novo link de verificação enviado para seu email."},
             status_code=status.HTTP_200_OK
         )
@@ -328,18 +336,19 @@ async def resend_verification_link(
     finally:
         await cursor.close()
         
-@router.post("/logout", response_class=JSONResponse)
+@router.post("/logout", response_class=FastJSONResponse)
 async def logout_user(request: Request):
     """Rota para deslogar o usuário."""
     user_id = request.session.get("user_id")
     request.session.pop("user_id", None)
     request.session.pop("session_id", None)
     logger.info(f"Usuário {user_id if user_id else 'não logado'} deslogado com sucesso.")
-    return JSONResponse(content={"message": "Logout realizado com sucesso!", "redirect_url": "/login"}, status_code=status.HTTP_200_OK)
+    return FastJSONResponse(content={"message": "Logout realizado com sucesso!", "redirect_url": "/login"}, status_code=status.HTTP_200_OK)
 
 
-@router.put("/profile/update", response_class=JSONResponse)
+@router.put("/profile/update", response_class=FastJSONResponse, dependencies=[Depends(rate_limit("profile_update", config.RATE_LIMIT_PROFILE_UPDATE))])
 async def update_profile(
+    request: Request,
     nome_completo: Optional[str] = Form(None), 
     email: Optional[str] = Form(None),
     senha: Optional[str] = Form(None), 
@@ -428,13 +437,17 @@ async def update_profile(
             params.append(profile_pic_url)
         
         if not update_fields:
-            return JSONResponse(content={"message": "Nenhuma alteração detectada."}, status_code=status.HTTP_200_OK)
+            return FastJSONResponse(content={"message": "Nenhuma alteração detectada."}, status_code=status.HTTP_200_OK)
 
         query = f"UPDATE usuarios SET {', '.join(update_fields)} WHERE id = %s"
         params.append(user_id) 
 
         await cursor.execute(query, tuple(params))
         await conn.commit()
+
+        if "senha = %s" in update_fields or "email = %s" in update_fields:
+            # Credenciais mudaram: encerra as sessões do usuário nos outros dispositivos (modo SESSION_BACKEND=server).
+            await invalidate_user_sessions(user_id, keep_session_id=request.scope.get("session_id"))
         
         response_content = {"message": "Perfil atualizado com sucesso!"}
         if "profile_pic_url = %s" in update_fields:
@@ -444,7 +457,7 @@ async def update_profile(
             response_content["redirect_url"] = "/login"
             response_content["message"] = "Email atualizado! Por favor, verifique seu novo email para continuar logado. Caso não receba, verifique a caixa de SPAM."
 
-        return JSONResponse(content=response_content, status_code=status.HTTP_200_OK)
+        return FastJSONResponse(content=response_content, status_code=status.HTTP_200_OK)
 
     except HTTPException as e:
         await conn.rollback()
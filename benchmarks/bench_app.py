@@ -0,0 +1,48 @@
+"""
+Aplicação `main:app` configurada para benchmarks: o pool do aiomysql é trocado
+por um SQLite local (benchmarks.fake_db) e o Gemini por um modelo falso
+(benchmarks.fake_llm). Uso: `uvicorn benchmarks.bench_app:app`.
+"""
+import os
+import logging
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+# Todos os usuários virtuais saem do mesmo IP: o limite de taxa das rotas de auth distorceria a carga.
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import main
+import db.dependencies as db_dependencies
+import chat.llm_config as llm_config
+from benchmarks.fake_db import FakePool
+from benchmarks.fake_llm import FakeGeminiChatModel
+
+logger = logging.getLogger(__name__)
+
+BENCH_DB_PATH = os.getenv("BENCH_DB_PATH", "bench.sqlite3")
+BENCH_POOL_SIZE = int(os.getenv("BENCH_POOL_SIZE", 10))
+BENCH_LLM_LATENCY = float(os.getenv("BENCH_LLM_LATENCY", 0.2))
+
+
+async def startup_fake_db_pool(config):
+    """Substitui `startup_db_pool`: cria o pool falso sobre o SQLite do benchmark."""
+    db_dependencies.db_pool = FakePool(BENCH_DB_PATH, maxsize=BENCH_POOL_SIZE)
+    logger.info(f"Pool falso (SQLite em {BENCH_DB_PATH}, maxsize={BENCH_POOL_SIZE}) criado para benchmark.")
+
+
+def initialize_fake_llms():
+    """Substitui `initialize_llms`: usa o modelo falso no lugar do Gemini, com as mesmas proteções (llm_guard)."""
+    if llm_config._llm is not None:
+        return
+    config = main.config
+    llm_config._llm_title_generator = llm_config.guard_llms(FakeGeminiChatModel(
+        latency_seconds=BENCH_LLM_LATENCY, response_text="Conversa de Benchmark"
+    ), "title", config.LLM_TITLE_TIMEOUT_SECONDS)
+    llm_config._llm = llm_config.guard_llms(
+        FakeGeminiChatModel(latency_seconds=BENCH_LLM_LATENCY), "chat", config.LLM_TIMEOUT_SECONDS
+    )
+
+
+main.startup_db_pool = startup_fake_db_pool
+llm_config.initialize_llms = initialize_fake_llms
+
+app = main.app
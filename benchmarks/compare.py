@@ -0,0 +1,49 @@
+"""
+Compara dois resultados do benchmark de carga.
+
+Exemplo:
+    python -m benchmarks.compare benchmarks/results/antes.json benchmarks/results/depois.json
+"""
+import sys
+import json
+
+METRICS = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "errors")
+
+
+def _load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _delta(before: float, after: float) -> str:
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    if len(argv) != 2:
+        print("Uso: python -m benchmarks.compare <antes.json> <depois.json>")
+        return 2
+
+    before, after = _load(argv[0]), _load(argv[1])
+    print(f"{before['label']} ({before['git_commit']}) -> {after['label']} ({after['git_commit']})")
+
+    sections = [("total", before["total"], after["total"])]
+    for name, stats in after["operations"].items():
+        if name in before["operations"]:
+            sections.append((name, before["operations"][name], stats))
+
+    for name, old, new in sections:
+        print(f"[{name}]")
+        for metric in METRICS:
+            print(f"  {metric:<15} {old[metric]:>10} -> {new[metric]:>10}  {_delta(old[metric], new[metric])}")
+
+    old_rss, new_rss = before["rss"]["peak_total_mb"], after["rss"]["peak_total_mb"]
+    print(f"[rss]\n  peak_total_mb   {old_rss:>10} -> {new_rss:>10}  {_delta(old_rss, new_rss)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+import re
+import sqlite3
+import asyncio
+import datetime
+import logging
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS usuarios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nome TEXT NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    senha TEXT NOT NULL,
+    termos_registro BOOLEAN NOT NULL,
+    data_registro TIMESTAMP NOT NULL,
+    email_verified BOOLEAN DEFAULT FALSE,
+    verification_code TEXT NULL,
+    code_expiration TIMESTAMP NULL,
+    profile_pic_url TEXT DEFAULT '/static/images/default_profile.png'
+);
+
+CREATE TABLE IF NOT EXISTS conversas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    id_usuario INTEGER NOT NULL,
+    titulo_conversa TEXT DEFAULT 'Nova Conversa',
+    data_criacao TIMESTAMP NOT NULL,
+    data_atualizacao TIMESTAMP NOT NULL,
+    total_mensagens INTEGER NULL DEFAULT 0,
+    total_caracteres INTEGER NULL DEFAULT 0,
+    previa_ultima_mensagem TEXT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversas_usuario ON conversas (id_usuario, data_atualizacao);
+
+CREATE TABLE IF NOT EXISTS mensagens (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    id_conversa INTEGER NOT NULL,
+    remetente TEXT NOT NULL,
+    conteudo TEXT NOT NULL,
+    data_envio TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_mensagens_conversa ON mensagens (id_conversa, data_envio);
+
+CREATE TABLE IF NOT EXISTS uso_tokens (
+    sujeito TEXT NOT NULL,
+    dia DATE NOT NULL,
+    tokens_prompt INTEGER NOT NULL DEFAULT 0,
+    tokens_resposta INTEGER NOT NULL DEFAULT 0,
+    tokens_resumo INTEGER NOT NULL DEFAULT 0,
+    chamadas INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (sujeito, dia)
+);
+"""
+
+# Traduções mínimas do dialeto MySQL usado pelas rotas para o SQLite.
+_SQL_TRANSLATIONS = [
+    (re.compile(r"DATE_SUB\(\s*NOW\(\)\s*,\s*INTERVAL\s+(\d+)\s+DAY\s*\)", re.IGNORECASE),
+     r"datetime('now', 'localtime', '-\1 day')"),
+    (re.compile(r"NOW\(\)", re.IGNORECASE), "datetime('now', 'localtime')"),
+    (re.compile(r"ON\s+DUPLICATE\s+KEY\s+UPDATE", re.IGNORECASE), "ON CONFLICT DO UPDATE SET"),
+    (re.compile(r"VALUES\((\w+)\)", re.IGNORECASE), r"excluded.\1"),
+    (re.compile(r"\s+FOR\s+UPDATE\b", re.IGNORECASE), ""),
+    (re.compile(r"%s"), "?"),
+]
+
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("TIMESTAMP", lambda raw: datetime.datetime.fromisoformat(raw.decode()))
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+sqlite3.register_converter("DATE", lambda raw: datetime.date.fromisoformat(raw.decode()))
+
+
+def translate_sql(sql: str) -> str:
+    """Converte uma consulta no dialeto MySQL (aiomysql) para o SQLite."""
+    for pattern, replacement in _SQL_TRANSLATIONS:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def open_database(path: str) -> sqlite3.Connection:
+    """Abre (e cria, se necessário) o banco SQLite usado como substituto do MySQL."""
+    db = sqlite3.connect(
+        path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        isolation_level=None,
+        check_same_thread=False,
+        timeout=30,
+    )
+    db.row_factory = sqlite3.Row
+    db.create_function("CHAR_LENGTH", 1, lambda text: None if text is None else len(text), deterministic=True)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript(SCHEMA_SQL)
+    return db
+
+
+class FakeCursor:
+    """Cursor compatível com o subconjunto da API do aiomysql.DictCursor usado pela aplicação."""
+
+    def __init__(self, db: sqlite3.Connection):
+        self._db = db
+        self._rows: list = []
+        self.rowcount = -1
+        self.lastrowid: Optional[int] = None
+
+    async def execute(self, sql: str, args: Any = None):
+        cur = self._db.execute(translate_sql(sql), tuple(args or ()))
+        self._rows = [dict(row) for row in cur.fetchall()] if cur.description else []
+        self.rowcount = cur.rowcount if cur.description is None else len(self._rows)
+        self.lastrowid = cur.lastrowid
+        return self.rowcount
+
+    async def executemany(self, sql: str, args):
+        cur = self._db.executemany(translate_sql(sql), [tuple(a) for a in args])
+        self.rowcount = cur.rowcount
+        self.lastrowid = cur.lastrowid
+        return self.rowcount
+
+    async def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    async def fetchmany(self, size: int = 1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    async def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    async def close(self):
+        self._rows = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class _CursorContext:
+    """Permite `await conn.cursor()` e `async with conn.cursor()`, como no aiomysql."""
+
+    def __init__(self, cursor: FakeCursor):
+        self._cursor = cursor
+
+    def __await__(self):
+        async def _coro():
+            return self._cursor
+        return _coro().__await__()
+
+    async def __aenter__(self):
+        return self._cursor
+
+    async def __aexit__(self, *exc):
+        await self._cursor.close()
+
+
+class FakeConnection:
+    """Conexão em modo autocommit sobre o SQLite compartilhado."""
+
+    def __init__(self, db: sqlite3.Connection):
+        self._db = db
+
+    def cursor(self, *cursor_classes):
+        return _CursorContext(FakeCursor(self._db))
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+    async def begin(self):
+        pass
+
+
+class _AcquireContext:
+    def __init__(self, pool: "FakePool"):
+        self._pool = pool
+
+    async def __aenter__(self) -> FakeConnection:
+        await self._pool._semaphore.acquire()
+        return FakeConnection(self._pool._db)
+
+    async def __aexit__(self, *exc):
+        self._pool._semaphore.release()
+
+
+class FakePool:
+    """
+    Substituto do pool do aiomysql para benchmarks.
+    Respeita `maxsize` para reproduzir a disputa por conexões do pool real.
+    """
+
+    def __init__(self, path: str, maxsize: int = 10):
+        self._db = open_database(path)
+        self._semaphore = asyncio.Semaphore(maxsize)
+        self.maxsize = maxsize
+
+    def acquire(self) -> _AcquireContext:
+        return _AcquireContext(self)
+
+    def close(self):
+        self._db.close()
+
+    async def wait_closed(self):
+        pass
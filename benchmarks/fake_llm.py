@@ -0,0 +1,61 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeGeminiChatModel(BaseChatModel):
+    """
+    Modelo de chat falso com latência configurável, usado no lugar do Gemini nos benchmarks.
+    Responde com um texto fixo e reporta `usage_metadata` como o provedor real.
+    """
+
+    latency_seconds: float = 0.2
+    response_text: str = "Olá! Sou o Fala Aí, uma resposta simulada para benchmark."
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    def get_num_tokens(self, text: str) -> int:
+        return max(1, len(text) // 4)
+
+    def _build_result(self, messages: List[BaseMessage]) -> ChatResult:
+        prompt_tokens = sum(self.get_num_tokens(str(m.content)) for m in messages)
+        completion_tokens = self.get_num_tokens(self.response_text)
+        message = AIMessage(
+            content=self.response_text,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency_seconds)
+        return self._build_result(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency_seconds)
+        return self._build_result(messages)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        words = self.response_text.split(" ")
+        for index, word in enumerate(words):
+            await asyncio.sleep(self.latency_seconds / len(words))
+            token = word if index == 0 else " " + word
+            if run_manager:
+                await run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+        # Como o Gemini, o consumo de tokens chega num chunk final.
+        usage = self._build_result(messages).generations[0].message.usage_metadata
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usage))
@@ -0,0 +1,64 @@
+"""
+Mede o custo de importação (cold start) de um módulo em um processo Python novo.
+
+Usa `python -X importtime` e lista os módulos com maior tempo cumulativo.
+
+Exemplo:
+    python -m benchmarks.import_time main --top 15 --repeat 5
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List, Tuple
+
+
+def measure_once(module: str) -> Tuple[float, Dict[str, int]]:
+    """Importa `module` em um subprocesso e retorna (tempo total em s, {módulo: µs cumulativos})."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    cumulative: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if cumulative_us.isdigit():
+            cumulative[name] = max(cumulative.get(name, 0), int(cumulative_us))
+    return cumulative.get(module, 0) / 1e6, cumulative
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mede o tempo de importação de um módulo.")
+    parser.add_argument("module", nargs="?", default="main")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="Imprime o resultado em JSON.")
+    args = parser.parse_args(argv)
+
+    totals: List[float] = []
+    last: Dict[str, int] = {}
+    for _ in range(args.repeat):
+        total, last = measure_once(args.module)
+        totals.append(total)
+
+    heaviest = sorted(last.items(), key=lambda item: item[1], reverse=True)[1:args.top + 1]
+    report = {
+        "module": args.module,
+        "median_s": round(statistics.median(totals), 3),
+        "runs_s": [round(t, 3) for t in totals],
+        "heaviest_ms": {name: round(us / 1000, 1) for name, us in heaviest},
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"import {args.module}: mediana {report['median_s']}s em {args.repeat} execuções")
+    for name, ms in report["heaviest_ms"].items():
+        print(f"  {ms:>9.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
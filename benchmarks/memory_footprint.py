@@ -0,0 +1,136 @@
+"""
+Mede a memória ocupada pelos estados de conversa em cache (`user_conversations_instances`).
+
+Para cada representação e quantidade de sessões, um processo novo monta N estados de conversa
+(ConversationChain + memória + histórico) com M mensagens cada e mede o crescimento do RSS.
+- langchain: histórico como lista de HumanMessage/AIMessage (ChatMessageHistory), como antes.
+- compact: CompactChatMessageHistory, usado por build_conversation_state.
+
+Exemplo:
+    python -m benchmarks.memory_footprint --sessions 10000,100000 --messages 10
+"""
+import os
+import gc
+import sys
+import json
+import random
+import argparse
+import subprocess
+from typing import Dict, List
+
+from benchmarks.run_benchmark import _rss_bytes
+
+REPRESENTATIONS = ("langchain", "compact")
+
+_WORDS = (
+    "como posso melhorar meu currículo para uma vaga de desenvolvedor python que dicas você tem sobre "
+    "entrevistas técnicas também gostaria de saber quais tecnologias estudar primeiro claro aqui estão "
+    "algumas sugestões importantes destaque seus projetos pessoais descreva resultados concretos use "
+    "verbos de ação pratique algoritmos estruturas de dados banco sql testes automatizados git docker"
+).split()
+
+
+def _text(rng: random.Random, chars: int) -> str:
+    words: List[str] = []
+    size = 0
+    while size < chars:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words).capitalize() + "."
+
+
+def _history(rng: random.Random, messages: int, user_chars: int, ai_chars: int) -> List[tuple]:
+    return [(position % 2 == 0, _text(rng, user_chars if position % 2 == 0 else ai_chars)) for position in range(messages)]
+
+
+def _build_langchain_state(history: List[tuple], llm, prompt) -> Dict:
+    from langchain.chains import ConversationChain
+    from langchain.memory import ConversationSummaryBufferMemory
+    from langchain_community.chat_message_histories import ChatMessageHistory
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    messages = [HumanMessage(content=text) if is_user else AIMessage(content=text) for is_user, text in history]
+    memory = ConversationSummaryBufferMemory(
+        llm=llm, max_token_limit=4000, return_messages=True,
+        chat_memory=ChatMessageHistory(messages=messages), memory_key="history"
+    )
+    return {"chain": ConversationChain(llm=llm, memory=memory, prompt=prompt, input_key="input"), "current_conversation_id": None}
+
+
+def measure(representation: str, sessions: int, messages: int, user_chars: int, ai_chars: int) -> Dict:
+    """Executado no processo filho: monta os estados e devolve o crescimento do RSS."""
+    import benchmarks.bench_app  # noqa: F401  (troca o Gemini pelo modelo falso)
+    import chat.llm_config as llm_config
+
+    llm_config.initialize_llms()
+    prompt = llm_config.templates_by_lang["pt"]
+    rng = random.Random(42)
+
+    # Aquece imports e caches de classe do pydantic antes da medição.
+    warm = _history(rng, messages, user_chars, ai_chars)
+    llm_config.build_conversation_state(warm, 0)
+    _build_langchain_state(warm, llm_config._llm, prompt)
+
+    gc.collect()
+    before = _rss_bytes(os.getpid())
+    states = {}
+    text_bytes = 0
+    for session in range(sessions):
+        history = _history(rng, messages, user_chars, ai_chars)
+        text_bytes += sum(len(text.encode("utf-8")) for _, text in history)
+        if representation == "compact":
+            states[session] = llm_config.build_conversation_state(history, session)
+        else:
+            states[session] = _build_langchain_state(history, llm_config._llm, prompt)
+    gc.collect()
+    after = _rss_bytes(os.getpid())
+
+    return {
+        "representation": representation,
+        "sessions": sessions,
+        "messages_per_conversation": messages,
+        "rss_growth_mb": round((after - before) / 2**20, 1),
+        "bytes_per_conversation": round((after - before) / sessions),
+        "text_bytes_per_conversation": round(text_bytes / sessions),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mede a memória por conversa em cache.")
+    parser.add_argument("--sessions", default="10000,100000", help="Quantidades de sessões, separadas por vírgula.")
+    parser.add_argument("--messages", type=int, default=10, help="Mensagens por conversa.")
+    parser.add_argument("--user-chars", type=int, default=120)
+    parser.add_argument("--ai-chars", type=int, default=700)
+    parser.add_argument("--representations", default=",".join(REPRESENTATIONS))
+    parser.add_argument("--json", action="store_true", help="Imprime o resultado em JSON.")
+    parser.add_argument("--child", nargs=2, metavar=("REPRESENTATION", "SESSIONS"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        representation, sessions = args.child
+        print(json.dumps(measure(representation, int(sessions), args.messages, args.user_chars, args.ai_chars)))
+        return
+
+    results = []
+    for sessions in (int(value) for value in args.sessions.split(",")):
+        for representation in args.representations.split(","):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.memory_footprint", "--child", representation, str(sessions),
+                 "--messages", str(args.messages), "--user-chars", str(args.user_chars), "--ai-chars", str(args.ai_chars)],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+            results.append(json.loads(output))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'representação':<12} {'sessões':>8} {'RSS (MB)':>9} {'bytes/conversa':>15} {'texto/conversa':>15}")
+    for result in results:
+        print(f"{result['representation']:<12} {result['sessions']:>8} {result['rss_growth_mb']:>9} "
+              f"{result['bytes_per_conversation']:>15} {result['text_bytes_per_conversation']:>15}")
+
+
+if __name__ == "__main__":
+    main()
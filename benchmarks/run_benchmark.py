@@ -0,0 +1,348 @@
+"""
+Benchmark de carga do caminho completo de requisição.
+
+Sobe `benchmarks.bench_app:app` (SQLite local + LLM falso) em um processo uvicorn,
+executa uma mistura de login, /chat/message, /conversations, /conversation/{id} e
+/profile/update com concorrência controlada e grava throughput, latências
+p50/p95/p99 e RSS dos workers em JSON.
+
+Exemplo:
+    python -m benchmarks.run_benchmark --duration 30 --concurrency 50 --label baseline
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import datetime
+import platform
+import tempfile
+import subprocess
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.fake_db import open_database
+
+BENCH_PASSWORD = "benchmark123"
+DEFAULT_MIX = "login=5,chat=45,conversations=20,conversation=20,profile=10"
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    """Converte 'chat=45,conversations=20' em um dicionário de pesos."""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = int(weight)
+    return mix
+
+
+def seed_database(path: str, users: int, conversations_per_user: int, messages_per_conversation: int):
+    """Popula o SQLite com usuários verificados e um histórico de conversas."""
+    from auth.routes import hash_password
+
+    db = open_database(path)
+    hashed = hash_password(BENCH_PASSWORD)
+    now = datetime.datetime.now()
+    db.execute("BEGIN")
+    for n in range(users):
+        cur = db.execute(
+            "INSERT INTO usuarios (nome, email, senha, termos_registro, data_registro, email_verified, profile_pic_url) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (f"Bench User {n}", f"bench{n}@example.com", hashed, True, now, True, "/static/images/default_profile.png"),
+        )
+        user_id = cur.lastrowid
+        for c in range(conversations_per_user):
+            cur = db.execute(
+                # Colunas de resumo em NULL, como linhas anteriores à migração: o backfill as preenche.
+                "INSERT INTO conversas (id_usuario, titulo_conversa, data_criacao, data_atualizacao, total_mensagens, total_caracteres) VALUES (?, ?, ?, ?, NULL, NULL)",
+                (user_id, f"Conversa {c}", now, now),
+            )
+            conversation_id = cur.lastrowid
+            db.executemany(
+                "INSERT INTO mensagens (id_conversa, remetente, conteudo, data_envio) VALUES (?, ?, ?, ?)",
+                [
+                    (conversation_id, "usuario" if m % 2 == 0 else "ia",
+                     f"Mensagem {m} da conversa {c}: " + "texto de exemplo " * 8, now)
+                    for m in range(messages_per_conversation)
+                ],
+            )
+    db.execute("COMMIT")
+    db.close()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _process_tree(pid: int) -> List[int]:
+    """Lista o processo e seus descendentes via /proc (Linux)."""
+    pids = [pid]
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                for child in f.read().split():
+                    pids.extend(_process_tree(int(child)))
+    except OSError:
+        pass
+    return pids
+
+
+def _rss_bytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def worker_rss(server_pid: int) -> Dict[int, int]:
+    """RSS de cada processo do servidor (master e workers)."""
+    return {pid: _rss_bytes(pid) for pid in _process_tree(server_pid)}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], errors: int, duration: float) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "errors": errors,
+        "throughput_rps": round(len(ordered) / duration, 2) if duration else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+    }
+
+
+class LoadRunner:
+    """Executa a mistura de operações com um cliente HTTP (e cookie de sessão) por usuário virtual."""
+
+    def __init__(self, base_url: str, users: int, mix: Dict[str, int], seed: int):
+        self.base_url = base_url
+        self.users = users
+        self.mix = mix
+        self.seed = seed
+        self.latencies: Dict[str, List[float]] = {name: [] for name in mix}
+        self.errors: Dict[str, int] = {name: 0 for name in mix}
+
+    async def _timed(self, name: str, coro):
+        start = time.perf_counter()
+        try:
+            response = await coro
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response, ok = None, False
+        self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return response
+
+    async def _login(self, client: httpx.AsyncClient, user_index: int):
+        return await self._timed("login", client.post(
+            "/login", json={"email": f"bench{user_index}@example.com", "senha": BENCH_PASSWORD}
+        ))
+
+    async def virtual_user(self, index: int, deadline: float):
+        rng = random.Random(self.seed + index)
+        user_index = index % self.users
+        names, weights = list(self.mix), list(self.mix.values())
+        conversation_ids: List[int] = []
+
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=60) as client:
+            await self._login(client, user_index)
+            response = await client.get("/conversations")
+            if response.status_code == 200:
+                conversation_ids = [c["id"] for c in response.json()]
+
+            while time.perf_counter() < deadline:
+                op = rng.choices(names, weights)[0]
+                if op == "login":
+                    await self._login(client, user_index)
+                elif op == "chat":
+                    await self._timed("chat", client.post(
+                        "/chat/message", json={"message": f"Pergunta de benchmark {rng.randint(0, 10**6)}", "language": "pt"}
+                    ))
+                elif op == "conversations":
+                    response = await self._timed("conversations", client.get("/conversations"))
+                    if response is not None and response.status_code == 200:
+                        conversation_ids = [c["id"] for c in response.json()] or conversation_ids
+                elif op == "conversation" and conversation_ids:
+                    await self._timed("conversation", client.get(f"/conversation/{rng.choice(conversation_ids)}"))
+                elif op == "profile":
+                    await self._timed("profile", client.put(
+                        "/profile/update", data={"nome_completo": f"Bench User {user_index} {rng.randint(0, 9)}"}
+                    ))
+
+    async def run(self, concurrency: int, duration: float):
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(self.virtual_user(i, deadline) for i in range(concurrency)))
+
+
+async def _sample_rss(server_pid: int, samples: List[Dict[int, int]], stop: asyncio.Event, interval: float = 0.5):
+    while not stop.is_set():
+        samples.append(worker_rss(server_pid))
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def _wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("O servidor de benchmark encerrou durante a inicialização.")
+        try:
+            if httpx.get(f"{base_url}/login", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Tempo esgotado aguardando o servidor de benchmark.")
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def _drive(args, base_url: str, server_pid: int):
+    runner = LoadRunner(base_url, args.users, parse_mix(args.mix), args.seed)
+    samples: List[Dict[int, int]] = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(_sample_rss(server_pid, samples, stop))
+
+    if args.warmup > 0:
+        await LoadRunner(base_url, args.users, runner.mix, args.seed + 1).run(min(args.concurrency, args.users), args.warmup)
+
+    start = time.perf_counter()
+    await runner.run(args.concurrency, args.duration)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await sampler
+    return runner, samples, elapsed
+
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="falaai-bench-")
+    db_path = os.path.join(workdir, "bench.sqlite3")
+    seed_database(db_path, args.users, args.conversations, args.messages)
+
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(
+        os.environ,
+        BENCH_DB_PATH=db_path,
+        BENCH_POOL_SIZE=str(args.pool_size),
+        BENCH_LLM_LATENCY=str(args.llm_latency),
+    )
+    command = [
+        sys.executable, "-m", "uvicorn", "benchmarks.bench_app:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(args.workers), "--log-level", "warning",
+    ]
+    process = subprocess.Popen(command, env=env)
+    try:
+        _wait_until_ready(base_url, process)
+        runner, samples, elapsed = asyncio.run(_drive(args, base_url, process.pid))
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    all_latencies = [value for values in runner.latencies.values() for value in values]
+    peak_by_pid: Dict[int, int] = {}
+    for sample in samples:
+        for pid, rss in sample.items():
+            peak_by_pid[pid] = max(peak_by_pid.get(pid, 0), rss)
+
+    return {
+        "label": args.label,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "config": {
+            "duration_s": args.duration,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "workers": args.workers,
+            "pool_size": args.pool_size,
+            "llm_latency_s": args.llm_latency,
+            "mix": parse_mix(args.mix),
+            "seed": args.seed,
+            "conversations_per_user": args.conversations,
+            "messages_per_conversation": args.messages,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "total": summarize(all_latencies, sum(runner.errors.values()), elapsed),
+        "operations": {
+            name: summarize(values, runner.errors.get(name, 0), elapsed)
+            for name, values in runner.latencies.items() if values
+        },
+        "rss": {
+            "peak_total_mb": round(max((sum(s.values()) for s in samples), default=0) / 2**20, 1),
+            "peak_per_process_mb": {str(pid): round(rss / 2**20, 1) for pid, rss in peak_by_pid.items()},
+            "final_total_mb": round(sum(samples[-1].values()) / 2**20, 1) if samples else 0.0,
+        },
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark de carga do FalaAI com banco e LLM simulados.")
+    parser.add_argument("--duration", type=float, default=20, help="Duração da medição em segundos.")
+    parser.add_argument("--warmup", type=float, default=3, help="Aquecimento (não medido) em segundos.")
+    parser.add_argument("--concurrency", type=int, default=20, help="Usuários virtuais simultâneos.")
+    parser.add_argument("--users", type=int, default=20, help="Usuários cadastrados no banco de teste.")
+    parser.add_argument("--conversations", type=int, default=5, help="Conversas pré-existentes por usuário.")
+    parser.add_argument("--messages", type=int, default=40, help="Mensagens por conversa pré-existente.")
+    parser.add_argument("--workers", type=int, default=1, help="Workers do uvicorn.")
+    parser.add_argument("--pool-size", type=int, default=10, help="maxsize do pool de conexões simulado.")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Latência simulada do LLM em segundos.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Pesos das operações (padrão: {DEFAULT_MIX}).")
+    parser.add_argument("--seed", type=int, default=42, help="Semente da sequência de operações.")
+    parser.add_argument("--label", default="run", help="Rótulo gravado no resultado.")
+    parser.add_argument("--output-dir", default=os.path.join("benchmarks", "results"), help="Diretório dos JSONs.")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    result = run(args)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    output_path = os.path.join(args.output_dir, f"{stamp}-{args.label}.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+    total = result["total"]
+    print(f"{total['count']} requisições, {total['throughput_rps']} req/s, "
+          f"p50={total['p50_ms']}ms p95={total['p95_ms']}ms p99={total['p99_ms']}ms, "
+          f"RSS pico={result['rss']['peak_total_mb']}MB")
+    for name, stats in result["operations"].items():
+        print(f"  {name:<14} n={stats['count']:<6} err={stats['errors']:<4} "
+              f"p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms")
+    print(f"Resultado salvo em {output_path}")
+
+
+if __name__ == "__main__":
+    main()
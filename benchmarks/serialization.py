@@ -0,0 +1,104 @@
+"""
+Mede a serialização e o tamanho da resposta de /conversation/{id} para uma conversa longa.
+
+Compara o caminho anterior (JSONResponse da biblioteca padrão, com `isoformat()` e o mapeamento do
+remetente feitos linha a linha em Python) com a FastJSONResponse (orjson, datetime nativo), e os
+bytes enviados sem compressão, com gzip e com brotli nos níveis usados pelo CompressionMiddleware.
+
+Exemplo:
+    python -m benchmarks.serialization --messages 1000
+"""
+import json
+import gzip
+import random
+import timeit
+import argparse
+import datetime
+from typing import Any, Dict, List
+
+from fastapi.responses import JSONResponse
+
+from settings.config import Config
+from utils.responses import FastJSONResponse
+from utils.compression import brotli
+from benchmarks.memory_footprint import _text
+
+config = Config()
+
+
+def build_rows(messages: int, user_chars: int, ai_chars: int) -> List[Dict[str, Any]]:
+    """Linhas como chegam do DictCursor: remetente 'usuario'/'ia' e data_envio como datetime."""
+    rng = random.Random(42)
+    start = datetime.datetime(2025, 1, 1, 12, 0, 0)
+    rows = []
+    for position in range(messages):
+        is_user = position % 2 == 0
+        rows.append({
+            "id": position + 1,
+            "remetente": "usuario" if is_user else "ia",
+            "conteudo": _text(rng, user_chars if is_user else ai_chars),
+            "data_envio": start + datetime.timedelta(seconds=position * 7),
+        })
+    return rows
+
+
+def legacy_render(rows: List[Dict[str, Any]]) -> bytes:
+    """Caminho anterior: conversão manual de cada linha + encoder da biblioteca padrão."""
+    messages = [dict(row) for row in rows]
+    for msg in messages:
+        if isinstance(msg.get('data_envio'), datetime.datetime):
+            msg['data_envio'] = msg['data_envio'].isoformat()
+        msg['remetente'] = 'usuario' if msg['remetente'] == 'usuario' else 'bot'
+    return JSONResponse(content=messages).body
+
+
+def fast_render(rows: List[Dict[str, Any]]) -> bytes:
+    """Caminho atual: o SQL já devolve 'bot' e a FastJSONResponse serializa o datetime."""
+    messages = [dict(row, remetente='usuario' if row['remetente'] == 'usuario' else 'bot') for row in rows]
+    return FastJSONResponse(content=messages).body
+
+
+def _best_ms(function, repeat: int) -> float:
+    return min(timeit.repeat(function, number=1, repeat=repeat)) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serialização e compressão de uma conversa longa.")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--user-chars", type=int, default=120)
+    parser.add_argument("--ai-chars", type=int, default=700)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="Imprime o resultado em JSON.")
+    args = parser.parse_args(argv)
+
+    rows = build_rows(args.messages, args.user_chars, args.ai_chars)
+    body = fast_render(rows)
+    report: Dict[str, Any] = {
+        "messages": args.messages,
+        "serialization_ms": {
+            "json": round(_best_ms(lambda: legacy_render(rows), args.repeat), 2),
+            "orjson": round(_best_ms(lambda: fast_render(rows), args.repeat), 2),
+        },
+        "bytes": {"identity": len(body)},
+        "compression_ms": {},
+    }
+
+    report["bytes"]["gzip"] = len(gzip.compress(body, compresslevel=config.COMPRESSION_GZIP_LEVEL))
+    report["compression_ms"]["gzip"] = round(_best_ms(lambda: gzip.compress(body, compresslevel=config.COMPRESSION_GZIP_LEVEL), args.repeat), 2)
+    if brotli is not None:
+        report["bytes"]["br"] = len(brotli.compress(body, quality=config.COMPRESSION_BROTLI_QUALITY))
+        report["compression_ms"]["br"] = round(_best_ms(lambda: brotli.compress(body, quality=config.COMPRESSION_BROTLI_QUALITY), args.repeat), 2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"Conversa com {args.messages} mensagens")
+    print(f"  serialização  json: {report['serialization_ms']['json']} ms   orjson: {report['serialization_ms']['orjson']} ms")
+    for encoding, size in report["bytes"].items():
+        spent = report["compression_ms"].get(encoding)
+        print(f"  {encoding:<9} {size / 1024:>8.1f} KiB" + (f"   ({spent} ms para comprimir)" if spent is not None else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+Camada de arquivamento das conversas expiradas.
+
+Cada conversa arquivada vira um membro gzip independente (uma linha JSON) anexado ao
+segmento atual em ARCHIVE_DIR/segments/. Um índice por usuário (ARCHIVE_DIR/index/<id>.jsonl,
+também só de acréscimo) guarda segmento, offset e tamanho de cada conversa, permitindo ler
+uma única conversa sem descomprimir o segmento inteiro. Restaurações são registradas no
+índice como uma nova linha com "restored": true (a última linha de cada conversa vale).
+"""
+
+import os
+import io
+import gzip
+import json
+import asyncio
+import logging
+import datetime
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+import aiomysql
+
+from settings.config import Config
+from db.dependencies import acquire_db_connection
+from chat.conversation_stats import refresh_conversation_stats
+from chat.search import invalidate_user_index
+from utils.file_lock import try_lock_file, unlock_file
+
+logger = logging.getLogger(__name__)
+
+config = Config()
+
+_SEGMENT_PREFIX = "segment-"
+_SEGMENT_SUFFIX = ".jsonl.gz"
+
+
+def _segments_dir() -> str:
+    return os.path.join(config.ARCHIVE_DIR, "segments")
+
+
+def _index_path(user_id: int) -> str:
+    return os.path.join(config.ARCHIVE_DIR, "index", f"{user_id}.jsonl")
+
+
+def json_default(value: Any):
+    """`default` do json.dumps para datas (ISO 8601); usado também pela exportação."""
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(value)!r}")
+
+
+def parse_datetime(value: Optional[str]) -> Optional[datetime.datetime]:
+    return datetime.datetime.fromisoformat(value) if value else None
+
+
+def to_epoch_ms(value: Union[datetime.datetime, str, None]) -> Optional[int]:
+    """Formato de data das listas de conversas (/conversations e /conversations/archived): milissegundos desde a época."""
+    parsed = parse_datetime(value) if isinstance(value, str) else value
+    return int(parsed.timestamp() * 1000) if parsed else None
+
+
+@contextmanager
+def _archive_lock():
+    """Lock de arquivo não bloqueante: só um processo por máquina arquiva por vez."""
+    os.makedirs(config.ARCHIVE_DIR, exist_ok=True)
+    with open(os.path.join(config.ARCHIVE_DIR, ".lock"), "w") as lock_file:
+        if not try_lock_file(lock_file):
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            unlock_file(lock_file)
+
+
+def _current_segment() -> str:
+    """Segmento aberto para acréscimo; cria um novo quando o atual passa de ARCHIVE_SEGMENT_MAX_BYTES."""
+    directory = _segments_dir()
+    os.makedirs(directory, exist_ok=True)
+    segments = sorted(name for name in os.listdir(directory) if name.startswith(_SEGMENT_PREFIX))
+    if segments:
+        last = segments[-1]
+        if os.path.getsize(os.path.join(directory, last)) < config.ARCHIVE_SEGMENT_MAX_BYTES:
+            return last
+        number = int(last[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)]) + 1
+    else:
+        number = 1
+    return f"{_SEGMENT_PREFIX}{number:06d}{_SEGMENT_SUFFIX}"
+
+
+def _write_batch(records: List[Dict[str, Any]]):
+    """Anexa as conversas ao segmento atual e registra os offsets no índice de cada usuário (síncrona)."""
+    segment = _current_segment()
+    index_lines: Dict[int, List[str]] = {}
+
+    with open(os.path.join(_segments_dir(), segment), "ab") as segment_file:
+        for record in records:
+            payload = json.dumps(record, default=json_default, ensure_ascii=False).encode("utf-8") + b"\n"
+            member = gzip.compress(payload, compresslevel=6)
+            offset = segment_file.tell()
+            segment_file.write(member)
+
+            conversa = record["conversa"]
+            index_lines.setdefault(conversa["id_usuario"], []).append(json.dumps({
+                "conversation_id": conversa["id"],
+                "titulo_conversa": conversa["titulo_conversa"],
+                "data_criacao": conversa["data_criacao"],
+                "data_atualizacao": conversa["data_atualizacao"],
+                "message_count": len(record["mensagens"]),
+                "segment": segment,
+                "offset": offset,
+                "length": len(member),
+            }, default=json_default, ensure_ascii=False))
+        segment_file.flush()
+        os.fsync(segment_file.fileno())
+
+    os.makedirs(os.path.join(config.ARCHIVE_DIR, "index"), exist_ok=True)
+    for user_id, lines in index_lines.items():
+        with open(_index_path(user_id), "a", encoding="utf-8") as index_file:
+            index_file.write("\n".join(lines) + "\n")
+            index_file.flush()
+            os.fsync(index_file.fileno())
+
+
+def read_user_index(user_id: int) -> Dict[int, Dict[str, Any]]:
+    """Conversas arquivadas (e ainda não restauradas) do usuário, por ID."""
+    entries: Dict[int, Dict[str, Any]] = {}
+    try:
+        with open(_index_path(user_id), encoding="utf-8") as index_file:
+            for line in index_file:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[entry["conversation_id"]] = entry
+    except FileNotFoundError:
+        return {}
+    return {cid: entry for cid, entry in entries.items() if not entry.get("restored")}
+
+
+def read_record(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Lê uma conversa arquivada (conversa + mensagens) a partir da sua entrada no índice."""
+    with open(os.path.join(_segments_dir(), entry["segment"]), "rb") as segment_file:
+        segment_file.seek(entry["offset"])
+        member = segment_file.read(entry["length"])
+    return json.loads(gzip.GzipFile(fileobj=io.BytesIO(member)).read())
+
+
+def _mark_restored(user_id: int, conversation_id: int):
+    with open(_index_path(user_id), "a", encoding="utf-8") as index_file:
+        index_file.write(json.dumps({"conversation_id": conversation_id, "restored": True}) + "\n")
+
+
+def _mark_batch_restored(records: List[Dict[str, Any]]):
+    """Anula no índice as entradas de um lote gravado cuja remoção das tabelas quentes não foi confirmada."""
+    for record in records:
+        _mark_restored(record["conversa"]["id_usuario"], record["conversa"]["id"])
+
+
+async def _fetch_expired_batch(conn: aiomysql.Connection, cutoff: datetime.datetime, after_id: int) -> List[Dict[str, Any]]:
+    cursor = await conn.cursor(aiomysql.DictCursor)
+    try:
+        await cursor.execute(
+            """
+            SELECT id, id_usuario, titulo_conversa, data_criacao, data_atualizacao
+            FROM conversas
+            WHERE data_atualizacao < %s AND id > %s
+            ORDER BY id
+            LIMIT %s
+            """,
+            (cutoff, after_id, config.ARCHIVE_BATCH_SIZE)
+        )
+        conversations = await cursor.fetchall()
+        if not conversations:
+            return []
+
+        ids = [conv['id'] for conv in conversations]
+        placeholders = ", ".join(["%s"] * len(ids))
+        await cursor.execute(
+            f"SELECT id, id_conversa, remetente, conteudo, data_envio FROM mensagens WHERE id_conversa IN ({placeholders}) ORDER BY id_conversa, data_envio, id",
+            tuple(ids)
+        )
+        messages_by_conversation: Dict[int, List[Dict[str, Any]]] = {cid: [] for cid in ids}
+        for message in await cursor.fetchall():
+            messages_by_conversation[message.pop('id_conversa')].append(message)
+    finally:
+        await cursor.close()
+
+    return [{"conversa": conv, "mensagens": messages_by_conversation[conv['id']]} for conv in conversations]
+
+
+async def _archive_batch(conn: aiomysql.Connection, records: List[Dict[str, Any]], cutoff: datetime.datetime) -> Tuple[int, int]:
+    """
+    Trava as conversas do lote que continuam expiradas (as que receberam mensagens desde a leitura
+    ficam de fora), grava só essas no arquivo e as remove, tudo dentro da mesma transação. Se a
+    remoção falhar depois da gravação, as entradas do índice são anuladas com "restored": true.
+    """
+    ids = [record["conversa"]["id"] for record in records]
+    placeholders = ", ".join(["%s"] * len(ids))
+    cursor = await conn.cursor(aiomysql.DictCursor)
+    written: List[Dict[str, Any]] = []
+    try:
+        await conn.begin()
+        await cursor.execute(
+            f"SELECT id FROM conversas WHERE id IN ({placeholders}) AND data_atualizacao < %s FOR UPDATE",
+            (*ids, cutoff)
+        )
+        locked = [row['id'] for row in await cursor.fetchall()]
+        if not locked:
+            await conn.rollback()
+            return 0, 0
+
+        locked_set = set(locked)
+        written = [record for record in records if record["conversa"]["id"] in locked_set]
+        await asyncio.to_thread(_write_batch, written)
+
+        locked_placeholders = ", ".join(["%s"] * len(locked))
+        await cursor.execute(f"DELETE FROM mensagens WHERE id_conversa IN ({locked_placeholders})", tuple(locked))
+        messages_count = cursor.rowcount
+        await cursor.execute(f"DELETE FROM conversas WHERE id IN ({locked_placeholders})", tuple(locked))
+        conversations_count = cursor.rowcount
+        await conn.commit()
+        return messages_count, conversations_count
+    except Exception:
+        await conn.rollback()
+        if written:
+            await asyncio.to_thread(_mark_batch_restored, written)
+        raise
+    finally:
+        await cursor.close()
+
+
+async def archive_expired_conversations():
+    """
+    Move as conversas sem atualização há mais de CONVERSATION_RETENTION_DAYS dias para os
+    segmentos comprimidos, em lotes; cada lote é gravado e removido das tabelas quentes sob lock.
+    """
+    with _archive_lock() as acquired:
+        if not acquired:
+            logger.info("Arquivamento já em execução em outro processo; pulando esta rodada.")
+            return
+
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=config.CONVERSATION_RETENTION_DAYS)
+        total_conversations = 0
+        total_messages = 0
+        after_id = 0
+        while True:
+            async with acquire_db_connection() as conn:
+                records = await _fetch_expired_batch(conn, cutoff, after_id)
+                if not records:
+                    break
+
+                messages_count, conversations_count = await _archive_batch(conn, records, cutoff)
+
+            after_id = records[-1]["conversa"]["id"]
+            total_conversations += conversations_count
+            total_messages += messages_count
+
+        logger.info(f"Arquivamento concluído: {total_messages} mensagens e {total_conversations} conversas movidas para {config.ARCHIVE_DIR}.")
+
+
+async def list_archived_conversations(user_id: int) -> List[Dict[str, Any]]:
+    """Conversas arquivadas do usuário, mais recentes primeiro."""
+    entries = await asyncio.to_thread(read_user_index, user_id)
+    conversations = [{
+        "id": entry["conversation_id"],
+        "titulo_conversa": entry["titulo_conversa"],
+        "data_criacao": to_epoch_ms(entry["data_criacao"]),
+        "data_atualizacao": to_epoch_ms(entry["data_atualizacao"]),
+        "message_count": entry["message_count"],
+        "arquivada": True,
+    } for entry in entries.values()]
+    conversations.sort(key=lambda conv: conv["data_atualizacao"] or 0, reverse=True)
+    return conversations
+
+
+async def _is_live_conversation(conn: aiomysql.Connection, user_id: int, conversation_id: int) -> bool:
+    cursor = await conn.cursor()
+    try:
+        await cursor.execute("SELECT id FROM conversas WHERE id = %s AND id_usuario = %s", (conversation_id, user_id))
+        return await cursor.fetchone() is not None
+    finally:
+        await cursor.close()
+
+
+async def restore_archived_conversation(conn: aiomysql.Connection, user_id: int, conversation_id: int) -> bool:
+    """
+    Reidrata uma conversa arquivada em `conversas`/`mensagens`, mantendo os IDs originais.
+    A data de atualização passa a ser agora, para que ela não volte ao arquivo na próxima rodada.
+    """
+    entries = await asyncio.to_thread(read_user_index, user_id)
+    entry = entries.get(conversation_id)
+    if entry is None:
+        return False
+
+    record = await asyncio.to_thread(read_record, entry)
+    conversa = record["conversa"]
+    cursor = await conn.cursor()
+    try:
+        await conn.begin()
+        await cursor.execute(
+            "INSERT INTO conversas (id, id_usuario, titulo_conversa, data_criacao, data_atualizacao) VALUES (%s, %s, %s, %s, %s)",
+            (conversa["id"], user_id, conversa["titulo_conversa"], parse_datetime(conversa["data_criacao"]), datetime.datetime.now())
+        )
+        if record["mensagens"]:
+            await cursor.executemany(
+                "INSERT INTO mensagens (id, id_conversa, remetente, conteudo, data_envio) VALUES (%s, %s, %s, %s, %s)",
+                [(m["id"], conversa["id"], m["remetente"], m["conteudo"], parse_datetime(m["data_envio"])) for m in record["mensagens"]]
+            )
+            await refresh_conversation_stats(conn, [conversa["id"]])
+        await conn.commit()
+    except Exception as e:
+        await conn.rollback()
+        if await _is_live_conversation(conn, user_id, conversation_id):
+            # Entrada de um lote cuja remoção não chegou a ser confirmada: a conversa nunca saiu das tabelas quentes.
+            await asyncio.to_thread(_mark_restored, user_id, conversation_id)
+            return True
+        logger.error(f"Erro ao restaurar a conversa arquivada {conversation_id}: {e}", exc_info=True)
+        return False
+    finally:
+        await cursor.close()
+
+    await asyncio.to_thread(_mark_restored, user_id, conversation_id)
+    invalidate_user_index(user_id)
+    logger.info(f"Conversa {conversation_id} restaurada do arquivo para o usuário {user_id} ({len(record['mensagens'])} mensagens).")
+    return True
@@ -0,0 +1,126 @@
+"""
+Histórico de mensagens compacto para os estados de conversa em cache.
+
+Em vez de uma lista de HumanMessage/AIMessage (objetos pydantic com várias centenas de bytes de
+overhead cada), guarda um bytearray com o papel de cada mensagem e uma lista com os textos;
+textos longos ficam comprimidos com zlib. Os objetos do LangChain só são criados quando a memória
+monta o prompt (`messages`). Importado apenas por build_conversation_state (depende do LangChain).
+"""
+import zlib
+from typing import Iterable, List, Sequence, Tuple, Union
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from settings.config import Config
+
+config = Config()
+
+HUMAN = 0
+AI = 1
+
+# Só guarda a versão comprimida se ela economizar pelo menos 10%.
+_MIN_COMPRESSION_GAIN = 0.9
+
+HistoryEntry = Tuple[bool, str]
+
+
+def _pack(text: str) -> Union[str, bytes]:
+    min_chars = config.HISTORY_COMPRESS_MIN_CHARS
+    if min_chars <= 0 or len(text) < min_chars:
+        return text
+    compressed = zlib.compress(text.encode("utf-8"))
+    return compressed if len(compressed) < len(text) * _MIN_COMPRESSION_GAIN else text
+
+
+def _unpack(stored: Union[str, bytes]) -> str:
+    return zlib.decompress(stored).decode("utf-8") if isinstance(stored, bytes) else stored
+
+
+class _MessageList(list):
+    """
+    Lista materializada de `messages`. Remoções feitas nela (ex.: o `prune` da
+    ConversationSummaryBufferMemory, que faz `pop(0)` no buffer) são repassadas ao histórico.
+    """
+
+    def __init__(self, history: "CompactChatMessageHistory", messages: List[BaseMessage]):
+        super().__init__(messages)
+        self._history = history
+
+    def pop(self, index: int = -1) -> BaseMessage:
+        position = index if index >= 0 else len(self) + index
+        message = super().pop(position)
+        self._history._delete(slice(position, position + 1))
+        return message
+
+    def __delitem__(self, index) -> None:
+        positions = index if isinstance(index, slice) else slice(index, index + 1 if index != -1 else None)
+        super().__delitem__(index)
+        self._history._delete(positions)
+
+
+class CompactChatMessageHistory(BaseChatMessageHistory):
+    """Histórico em memória com papéis em um bytearray e textos (comprimidos quando longos) em uma lista."""
+
+    def __init__(self, entries: Iterable[HistoryEntry] = ()):
+        self._roles = bytearray()
+        self._texts: List[Union[str, bytes]] = []
+        # Número sequencial da primeira mensagem guardada: cresce quando mensagens antigas são removidas.
+        self._head = 0
+        for is_user, text in entries:
+            self._append(HUMAN if is_user else AI, text)
+
+    def _append(self, role: int, text: str) -> None:
+        self._roles.append(role)
+        self._texts.append(_pack(text))
+
+    def _delete(self, positions: slice) -> None:
+        start, stop, _ = positions.indices(len(self._texts))
+        if start == 0:
+            self._head += max(0, stop - start)
+        del self._roles[positions]
+        del self._texts[positions]
+
+    @property
+    def head(self) -> int:
+        """Número sequencial da primeira mensagem; identifica as mensagens entre remoções."""
+        return self._head
+
+    def __len__(self) -> int:
+        return len(self._roles)
+
+    def entries(self) -> List[HistoryEntry]:
+        """(é do usuário, texto) de cada mensagem, sem criar objetos do LangChain."""
+        return [(role == HUMAN, _unpack(text)) for role, text in zip(self._roles, self._texts)]
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        built = [
+            HumanMessage(content=text) if is_user else AIMessage(content=text)
+            for is_user, text in self.entries()
+        ]
+        return _MessageList(self, built)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        for message in messages:
+            self._append(HUMAN if isinstance(message, HumanMessage) else AI, str(message.content))
+
+    def add_user_message(self, message) -> None:
+        if isinstance(message, str):
+            self._append(HUMAN, message)
+        else:
+            self.add_messages([message])
+
+    def add_ai_message(self, message) -> None:
+        if isinstance(message, str):
+            self._append(AI, message)
+        else:
+            self.add_messages([message])
+
+    def remove_oldest(self, count: int) -> None:
+        self._delete(slice(0, count))
+
+    def clear(self) -> None:
+        self._head += len(self._roles)
+        self._roles = bytearray()
+        self._texts = []
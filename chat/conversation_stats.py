@@ -0,0 +1,127 @@
+"""
+Colunas desnormalizadas de `conversas` usadas pela barra lateral do histórico.
+
+`total_mensagens`, `total_caracteres` e `previa_ultima_mensagem` são mantidas incrementalmente na
+mesma transação que grava cada turno (chat.routes.persist_chat_turn), para que a lista de conversas
+continue sendo uma única varredura pelo índice (id_usuario, data_atualizacao), sem agregar
+`mensagens`. Conversas gravadas por outros caminhos (importação, restauração do arquivo) e as linhas
+anteriores às colunas são recalculadas a partir de `mensagens` por `refresh_conversation_stats`.
+
+Nas linhas anteriores às colunas, `total_mensagens` e `total_caracteres` ficam NULL ("não calculado"):
+o incremento de um turno mantém o NULL (NULL + 2 é NULL), então o preenchimento ainda as encontra,
+mesmo que a conversa tenha recebido mensagens depois da migração.
+"""
+import asyncio
+import logging
+from typing import Dict, List
+
+import aiomysql
+
+from settings.config import Config
+from db.dependencies import acquire_db_connection
+
+logger = logging.getLogger(__name__)
+
+config = Config()
+
+PREVIEW_CHARS = 120
+# Pausa entre os lotes do preenchimento, para não disputar o pool com as requisições.
+BACKFILL_PAUSE_SECONDS = 0.05
+
+
+def make_preview(text: str) -> str:
+    """Prévia de uma mensagem: espaços colapsados e no máximo PREVIEW_CHARS caracteres."""
+    preview = " ".join(str(text).split())
+    if len(preview) > PREVIEW_CHARS:
+        preview = preview[:PREVIEW_CHARS - 1].rstrip() + "…"
+    return preview
+
+
+async def refresh_conversation_stats(conn: aiomysql.Connection, conversation_ids: List[int]) -> int:
+    """
+    Recalcula as colunas das conversas a partir de `mensagens`. Não controla a transação:
+    quem chama decide se roda dentro de uma (ex.: a restauração do arquivo) ou em autocommit.
+    """
+    if not conversation_ids:
+        return 0
+
+    placeholders = ", ".join(["%s"] * len(conversation_ids))
+    cursor = await conn.cursor(aiomysql.DictCursor)
+    try:
+        await cursor.execute(
+            f"""
+            SELECT id_conversa, COUNT(*) AS total, SUM(CHAR_LENGTH(conteudo)) AS caracteres, MAX(id) AS ultima_id
+            FROM mensagens
+            WHERE id_conversa IN ({placeholders})
+            GROUP BY id_conversa
+            """,
+            tuple(conversation_ids)
+        )
+        aggregates = {row['id_conversa']: row for row in await cursor.fetchall()}
+
+        previews: Dict[int, str] = {}
+        if aggregates:
+            last_ids = [row['ultima_id'] for row in aggregates.values()]
+            await cursor.execute(
+                f"SELECT id_conversa, conteudo FROM mensagens WHERE id IN ({', '.join(['%s'] * len(last_ids))})",
+                tuple(last_ids)
+            )
+            previews = {row['id_conversa']: make_preview(row['conteudo']) for row in await cursor.fetchall()}
+
+        rows = []
+        for conversation_id in conversation_ids:
+            aggregate = aggregates.get(conversation_id)
+            if aggregate is None:
+                rows.append((0, 0, None, conversation_id))
+            else:
+                rows.append((aggregate['total'], int(aggregate['caracteres'] or 0), previews.get(conversation_id), conversation_id))
+        await cursor.executemany(
+            "UPDATE conversas SET total_mensagens = %s, total_caracteres = %s, previa_ultima_mensagem = %s WHERE id = %s",
+            rows
+        )
+    finally:
+        await cursor.close()
+    return len(rows)
+
+
+async def _backfill_batch(conn: aiomysql.Connection, after_id: int) -> List[int]:
+    """Preenche um lote dentro de uma transação que trava as linhas de `conversas`."""
+    cursor = await conn.cursor(aiomysql.DictCursor)
+    try:
+        await conn.begin()
+        # O FOR UPDATE faz um turno concorrente esperar o recálculo e só então somar o seu incremento;
+        # turnos anteriores ao SELECT deixaram o NULL e já estão em `mensagens`, contados pelo recálculo.
+        await cursor.execute(
+            "SELECT id FROM conversas WHERE total_mensagens IS NULL AND id > %s ORDER BY id LIMIT %s FOR UPDATE",
+            (after_id, config.CONVERSATION_STATS_BACKFILL_BATCH_SIZE)
+        )
+        ids = [row['id'] for row in await cursor.fetchall()]
+        await refresh_conversation_stats(conn, ids)
+        await conn.commit()
+        return ids
+    except Exception:
+        await conn.rollback()
+        raise
+    finally:
+        await cursor.close()
+
+
+async def backfill_conversation_stats() -> int:
+    """
+    Preenche as colunas das conversas ainda não calculadas (NULL: linhas anteriores à migração), em lotes
+    percorridos por ID. Idempotente: pode rodar em vários workers ao mesmo tempo.
+    """
+    total = 0
+    after_id = 0
+    while True:
+        async with acquire_db_connection() as conn:
+            ids = await _backfill_batch(conn, after_id)
+        if not ids:
+            break
+        total += len(ids)
+        after_id = ids[-1]
+        await asyncio.sleep(BACKFILL_PAUSE_SECONDS)
+
+    if total:
+        logger.info(f"Colunas de resumo preenchidas para {total} conversas.")
+    return total
@@ -0,0 +1,105 @@
+"""
+Wrapper de modelo de chat que aplica as políticas de chat.llm_guard (prazo, hedge e circuit breaker).
+
+Fica no nível do modelo, e não da ConversationChain, para que uma requisição de hedge não
+grave o turno duas vezes na memória. Importado apenas junto com os LLMs (depende do LangChain).
+"""
+import time
+import asyncio
+from typing import Any, AsyncIterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from chat.llm_guard import LatencyTracker, LLMUnavailableError, guarded_call, check_breaker, record_outcome
+from chat.usage import record_llm_usage
+
+
+class GuardedChatModel(BaseChatModel):
+    """Delega ao modelo `inner` com prazo por chamada, hedge após o p95 e circuit breaker compartilhado."""
+
+    inner: BaseChatModel
+    model_name: str
+    timeout_seconds: float
+    hedge: bool = True
+
+    _latencies: LatencyTracker = PrivateAttr(default_factory=LatencyTracker)
+
+    @property
+    def _llm_type(self) -> str:
+        return f"guarded-{self.inner._llm_type}"
+
+    def get_num_tokens(self, text: str) -> int:
+        return self.inner.get_num_tokens(text)
+
+    def get_num_tokens_from_messages(self, messages: List[BaseMessage], tools: Optional[Any] = None) -> int:
+        return self.inner.get_num_tokens_from_messages(messages)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        # Caminho síncrono (não usado pelas rotas): apenas respeita o circuit breaker.
+        check_breaker(self.model_name)
+        started_at = time.monotonic()
+        try:
+            result = self.inner._generate(messages, stop=stop, **kwargs)
+        except Exception as e:
+            record_outcome(self.model_name, started_at, e)
+            raise
+        record_outcome(self.model_name, started_at, None)
+        self._record_usage(result)
+        return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        result = await guarded_call(
+            self.model_name,
+            lambda: self.inner._agenerate(messages, stop=stop, **kwargs),
+            timeout=self.timeout_seconds,
+            tracker=self._latencies,
+            hedge=self.hedge,
+        )
+        self._record_usage(result)
+        return result
+
+    def _record_usage(self, result: ChatResult):
+        for generation in result.generations:
+            record_llm_usage(self.model_name, getattr(generation.message, "usage_metadata", None))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        # Sem hedge: os tokens já enviados ao cliente não podem ser trocados pelos de outra chamada.
+        check_breaker(self.model_name)
+        loop = asyncio.get_running_loop()
+        started_at = time.monotonic()
+        deadline = loop.time() + self.timeout_seconds
+        iterator = self.inner._astream(messages, stop=stop, **kwargs).__aiter__()
+        usage = {"input_tokens": 0, "output_tokens": 0}
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), timeout=remaining)
+                except StopAsyncIteration:
+                    break
+                chunk_usage = getattr(chunk.message, "usage_metadata", None)
+                if chunk_usage:
+                    usage["input_tokens"] += chunk_usage.get("input_tokens", 0)
+                    usage["output_tokens"] += chunk_usage.get("output_tokens", 0)
+                yield chunk
+        except asyncio.TimeoutError as e:
+            record_outcome(self.model_name, started_at, e)
+            raise LLMUnavailableError(f"O LLM '{self.model_name}' não respondeu em {self.timeout_seconds}s.")
+        except (asyncio.CancelledError, GeneratorExit):
+            raise
+        except Exception as e:
+            record_outcome(self.model_name, started_at, e)
+            raise
+        finally:
+            await iterator.aclose()
+            record_llm_usage(self.model_name, usage)
+
+        record_outcome(self.model_name, started_at, None)
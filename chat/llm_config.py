@@ -1,50 +1,139 @@
 import os
+import asyncio
 import logging
 import uuid
 import datetime
-from typing import Dict, Any, Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, TYPE_CHECKING
 
-from langchain_google_genai import ChatGoogleGenerativeAI 
-from langchain.chains import ConversationChain
-from langchain.memory import ConversationSummaryBufferMemory
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain_community.chat_message_histories import ChatMessageHistory
-from langchain.prompts import PromptTemplate
-from fastapi import Request, Depends
+from fastapi import Request
 
 import aiomysql 
 
+from db.dependencies import acquire_db_connection
+from settings.config import Config
+
+# A árvore de imports do LangChain/Gemini é pesada (centenas de ms por worker).
+# Os módulos abaixo só são importados no primeiro uso ou pelo aquecimento do lifespan.
+if TYPE_CHECKING:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
 
 logger = logging.getLogger(__name__)
 
+config = Config()
+
 _llm = None
 _llm_title_generator = None
+_llm_init_lock = threading.Lock()
+# LangChain importado e LLMs criados: build_conversation_state já não bloqueia o event loop.
+_llm_stack_ready = False
+# Estado ativo por chave (ID do usuário ou session_id anônimo): o que a próxima mensagem usa.
 user_conversations_instances: Dict[Any, Dict[str, Any]] = {}
+# Estados já ligados a uma conversa no DB, por usuário e conversa (LRU de CONVERSATION_STATES_PER_USER),
+# com os usuários também em LRU (CONVERSATION_STATE_MAX_USERS).
+_recent_conversation_states: "OrderedDict[int, OrderedDict[int, Dict[str, Any]]]" = OrderedDict()
+# Cargas de estado em andamento por chave (prewarm ou requisição), para que não sejam duplicadas.
+_conversation_state_loads: Dict[Any, "asyncio.Task"] = {}
+
+# Conversa ativa no navegador (espelho do localStorage do script.js), enviada em toda requisição.
+ACTIVE_CONVERSATION_COOKIE = "falaai_active_conversation"
+
+# Versão de uma conversa em cache: leitura por chave primária, comparada com o "synced_total" do estado.
+# Todo turno persistido soma 2 a total_mensagens, em qualquer worker; NULL (ainda não preenchido pelo
+# backfill de chat.conversation_stats) não serve de versão, e o estado é recarregado.
+CONVERSATION_STATE_VERSION_SQL = "SELECT total_mensagens FROM conversas WHERE id = %s AND id_usuario = %s"
 
 def initialize_llms():
-    """Inicializa os LLMs de forma segura e única."""
+    """Inicializa os LLMs de forma segura e única (importa o LangChain no primeiro uso)."""
     global _llm, _llm_title_generator
     if _llm is not None:
         return
 
+    with _llm_init_lock:
+        if _llm is not None:
+            return
+        _create_llms()
+
+
+def _create_llms():
+    global _llm, _llm_title_generator
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
     gemini_api_key = os.getenv("GEMINI_API_KEY")
     if not gemini_api_key:
         logger.error("GEMINI_API_KEY não encontrada nas variáveis de ambiente.")
         raise RuntimeError("GEMINI_API_KEY não encontrada.")
 
-    _llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash", 
-        temperature=0.2,
-        google_api_key=gemini_api_key
-    )
-    _llm_title_generator = ChatGoogleGenerativeAI(
+    _llm_title_generator = guard_llms(ChatGoogleGenerativeAI(
         model="gemini-2.5-flash", 
         temperature=0, 
-        google_api_key=gemini_api_key
-    )
+        google_api_key=gemini_api_key,
+        timeout=config.LLM_TITLE_TIMEOUT_SECONDS,
+        max_retries=config.LLM_MAX_RETRIES
+    ), "title", config.LLM_TITLE_TIMEOUT_SECONDS)
+    _llm = guard_llms(ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash", 
+        temperature=0.2,
+        google_api_key=gemini_api_key,
+        timeout=config.LLM_TIMEOUT_SECONDS,
+        max_retries=config.LLM_MAX_RETRIES
+    ), "chat", config.LLM_TIMEOUT_SECONDS)
     logger.info("LLMs inicializados com sucesso.")
 
-def get_llm_title_generator() -> ChatGoogleGenerativeAI:
+
+def guard_llms(llm, model_name: str, timeout_seconds: float):
+    """Envolve o modelo com prazo por chamada, hedge e o circuit breaker do Gemini (chat.llm_guard)."""
+    from chat.guarded_model import GuardedChatModel
+
+    return GuardedChatModel(inner=llm, model_name=model_name, timeout_seconds=timeout_seconds)
+
+
+def import_llm_modules():
+    """
+    Só importa os módulos do LangChain/Gemini, sem criar clientes nem threads: seguro antes do fork
+    (server.py pré-carrega assim no processo mestre).
+    """
+    import langchain.chains  # noqa: F401
+    import langchain.memory  # noqa: F401
+    import langchain_google_genai  # noqa: F401
+    import chat.compact_history  # noqa: F401
+    import chat.guarded_model  # noqa: F401
+
+def _load_llm_stack():
+    """Importa os módulos do LangChain e inicializa os LLMs (síncrona; roda em um thread)."""
+    global _llm_stack_ready
+    import_llm_modules()
+    initialize_llms()
+    _llm_stack_ready = True
+
+
+async def ensure_llm_stack():
+    """
+    Garante o LangChain importado e os LLMs criados antes de montar um estado de conversa, sem
+    bloquear o event loop: se o aquecimento do lifespan ainda segura o lock, a espera fica no thread.
+    """
+    if not _llm_stack_ready:
+        await asyncio.to_thread(_load_llm_stack)
+
+
+def warm_up_llm_stack():
+    """
+    Importa o LangChain, inicializa os LLMs e compila o prompt antecipadamente.
+    Síncrona: deve rodar em um thread (asyncio.to_thread) a partir do lifespan.
+    """
+    start = time.perf_counter()
+    try:
+        _load_llm_stack()
+        templates_by_lang["pt"]
+    except Exception as e:
+        logger.error(f"Falha no aquecimento do LangChain: {e}", exc_info=True)
+        return
+    logger.info(f"Aquecimento do LangChain concluído em {time.perf_counter() - start:.2f}s.")
+
+def get_llm_title_generator() -> "ChatGoogleGenerativeAI":
     """Retorna a instância do LLM para geração de títulos, inicializando se necessário."""
     initialize_llms()
     if _llm_title_generator is None:
@@ -52,10 +141,8 @@ def get_llm_title_generator() -> ChatGoogleGenerativeAI:
     return _llm_title_generator
 
 
-templates_by_lang = {
-    "pt": PromptTemplate(
-        input_variables=["history", "input"], 
-        template="""**Você é o Fala Aí, um assistente de IA amigável, prestativo e otimista, construído com a tecnologia Gemini da Google.**
+PROMPT_TEMPLATE_TEXTS = {
+    "pt": """**Você é o Fala Aí, um assistente de IA amigável, prestativo e otimista, construído com a tecnologia Gemini da Google.**
 
 **Sua Missão e Estilo:**
 1. **Seja cortês e acessível:** Responda de forma clara, direta e com um tom positivo e encorajador.
@@ -71,10 +158,23 @@ Histórico da Conversa:
 Pergunta do Usuário:
 {input}
 
-Sua Resposta:"""
-    ),
+Sua Resposta:""",
 }
 
+
+class _LazyPromptTemplates(dict):
+    """Dicionário de PromptTemplate por idioma, construídos apenas no primeiro acesso."""
+
+    def __missing__(self, lang: str):
+        from langchain.prompts import PromptTemplate
+
+        template = PromptTemplate(input_variables=["history", "input"], template=PROMPT_TEMPLATE_TEXTS[lang])
+        self[lang] = template
+        return template
+
+
+templates_by_lang = _LazyPromptTemplates()
+
 TITLE_GENERATION_PROMPT = """Você é um especialista em sumarização. Receberá a primeira mensagem de uma conversa. Sua tarefa é criar um título muito conciso e descritivo (máximo de 5 palavras) para essa conversa. O título deve ser em Português do Brasil.
 
 Primeira mensagem: {first_message}
@@ -82,107 +182,356 @@ Título:"""
 
 
 
-async def get_user_conversation_instance(
-    request: Request,
-    user_id: Optional[int] = Depends(lambda: None),
-    conn = Depends(lambda: None) 
+def get_conversation_key(request: Request, user_id: Optional[int]):
+    """Chave do cache de conversas: o ID do usuário logado ou o session_id anônimo (criado se necessário)."""
+    if user_id is not None:
+        return user_id
+
+    session_id = request.session.get("session_id")
+    if not session_id:
+        session_id = str(uuid.uuid4())
+        request.session["session_id"] = session_id
+    return session_id
+
+
+def build_conversation_state(
+    history: Optional[list] = None,
+    conversation_id: Optional[int] = None,
+    synced_total: Optional[int] = 0
 ) -> Dict[str, Any]:
     """
-    Obtém ou cria uma instância de ConversationChain para o usuário (logado ou anônimo).
-    Retorna o dicionário contendo a 'chain' e o 'current_conversation_id'.
+    Cria o estado de conversa (ConversationChain + memória) a partir de um histórico já carregado,
+    dado como pares (é do usuário, texto) e guardado em um CompactChatMessageHistory.
+    `synced_total` é o total_mensagens da conversa que o histórico reflete. Síncrona: a partir do
+    event loop, chame `await ensure_llm_stack()` antes.
     """
-
     initialize_llms() 
-    
+    from langchain.chains import ConversationChain
+    from chat.compact_history import CompactChatMessageHistory
 
-    global _llm
     llm = _llm 
- 
-    key = None
-    if user_id is None:
-        session_id = request.session.get("session_id")
-        if not session_id:
-            session_id = str(uuid.uuid4())
-            request.session["session_id"] = session_id
-        key = session_id
-    else:
-        key = user_id
 
-    if key in user_conversations_instances:
-        return user_conversations_instances[key]
+    if config.MEMORY_MODE == "retrieval":
+        from chat.memory import RetrievalWindowMemory
 
+        memory = RetrievalWindowMemory(
+            chat_memory=CompactChatMessageHistory(history or []),
+            recent_turns=config.MEMORY_RECENT_TURNS,
+            retrieved_turns=config.MEMORY_RETRIEVED_TURNS,
+            memory_key="history"
+        )
+    elif config.MEMORY_MODE == "background_summary":
+        from chat.memory import BackgroundSummaryBufferMemory
 
-    if user_id is None:
+        memory = BackgroundSummaryBufferMemory(
+            llm=llm,
+            max_token_limit=4000,
+            return_messages=True,
+            chat_memory=CompactChatMessageHistory(history or []),
+            memory_key="history"
+        )
+    else:
+        from langchain.memory import ConversationSummaryBufferMemory
 
         memory = ConversationSummaryBufferMemory(
             llm=llm, 
             max_token_limit=4000, 
-            return_messages=True, 
+            return_messages=True,
+            chat_memory=CompactChatMessageHistory(history or []), 
             memory_key="history"
         )
-        
-        user_conversations_instances[key] = {
-            "chain": ConversationChain(
-                llm=llm, 
-                memory=memory, 
-                prompt=templates_by_lang["pt"],
-                input_key="input"
-            ), 
-            "current_conversation_id": None
-        }
-        
+    return {
+        "chain": ConversationChain(
+            llm=llm, 
+            memory=memory, 
+            prompt=templates_by_lang["pt"], 
+            input_key="input"
+        ), 
+        "current_conversation_id": conversation_id,
+        "synced_total": synced_total
+    }
+
+
+def active_conversation_from_cookie(request: Request) -> Optional[int]:
+    """ID da conversa ativa no navegador (cookie ACTIVE_CONVERSATION_COOKIE), se houver."""
+    value = request.cookies.get(ACTIVE_CONVERSATION_COOKIE, "")
+    return int(value) if value.isdigit() else None
+
+
+def remember_conversation_state(user_id: int, state: Dict[str, Any]):
+    """Guarda o estado no LRU do usuário (como o mais recente), se ele já tiver uma conversa no DB."""
+    conversation_id = state.get("current_conversation_id")
+    if conversation_id is None:
+        return
+    recent = _recent_conversation_states.get(user_id)
+    if recent is None:
+        recent = _recent_conversation_states[user_id] = OrderedDict()
+    else:
+        _recent_conversation_states.move_to_end(user_id)
+    recent[conversation_id] = state
+    recent.move_to_end(conversation_id)
+    while len(recent) > config.CONVERSATION_STATES_PER_USER:
+        recent.popitem(last=False)
+    while len(_recent_conversation_states) > config.CONVERSATION_STATE_MAX_USERS:
+        # Usuário menos recente: descarta o LRU e o estado ativo dele (a próxima mensagem recarrega do DB).
+        evicted_user_id, _ = _recent_conversation_states.popitem(last=False)
+        user_conversations_instances.pop(evicted_user_id, None)
+
+
+def record_persisted_turn(state: Dict[str, Any]):
+    """Registra no estado o turno que acabou de ser persistido (2 mensagens), mantendo a versão em dia."""
+    if state.get("synced_total") is not None:
+        state["synced_total"] += 2
+
+
+async def start_new_conversation_state(key: Any) -> Dict[str, Any]:
+    """Instala um estado vazio como o ativo da chave: a próxima troca cria uma conversa nova no DB."""
+    await ensure_llm_stack()
+    state = build_conversation_state()
+    user_conversations_instances[key] = state
+    return state
+
+
+def _forget_conversation_state(user_id: int, conversation_id: int, state: Dict[str, Any]):
+    """Tira do cache um estado cuja conversa não existe mais no DB (apagada ou arquivada)."""
+    recent = _recent_conversation_states.get(user_id)
+    if recent is not None and recent.get(conversation_id) is state:
+        del recent[conversation_id]
+    if user_conversations_instances.get(user_id) is state:
+        del user_conversations_instances[user_id]
+
+
+async def refresh_conversation_state(
+    user_id: int,
+    state: Dict[str, Any],
+    conn: Optional[aiomysql.Connection] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Confere a versão de um estado em cache com uma leitura por chave primária e o recarrega do DB
+    se outro worker escreveu na conversa. Devolve o estado em dia, ou None se a conversa não existe
+    mais. Estados sem conversa no DB não são conferidos. Sem `conn`, usa uma conexão curta do pool.
+    """
+    conversation_id = state.get("current_conversation_id")
+    if conversation_id is None:
+        return state
+    if conn is None:
+        async with acquire_db_connection() as conn:
+            return await refresh_conversation_state(user_id, state, conn)
+
+    cursor = await conn.cursor(aiomysql.DictCursor)
+    try:
+        await cursor.execute(CONVERSATION_STATE_VERSION_SQL, (conversation_id, user_id))
+        version = await cursor.fetchone()
+    finally:
+        await cursor.close()
+
+    if version is None:
+        _forget_conversation_state(user_id, conversation_id, state)
+        return None
+    if version['total_mensagens'] is not None and version['total_mensagens'] == state.get("synced_total"):
+        return state
+
+    logger.info(f"Conversa {conversation_id} do usuário {user_id} mudou fora deste worker; recarregando o histórico.")
+    fresh = await _load_conversation_state(conn, user_id, conversation_id, reload=True)
+    if fresh is not None and user_conversations_instances.get(user_id) is state:
+        user_conversations_instances[user_id] = fresh
+    return fresh
+
+
+def cached_conversation_state_count() -> int:
+    """Estados de conversa distintos em memória (ativos + LRUs)."""
+    states = {id(state) for state in user_conversations_instances.values()}
+    for recent in _recent_conversation_states.values():
+        states.update(id(state) for state in recent.values())
+    return len(states)
+
+
+async def load_user_conversation_instance(
+    request: Request,
+    user_id: Optional[int],
+    conn: Optional[aiomysql.Connection] = None,
+    conversation_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Obtém ou cria uma instância de ConversationChain para o usuário (logado ou anônimo).
+    Retorna o dicionário contendo a 'chain' e o 'current_conversation_id'.
+    Com `conversation_id` (usuário logado), ativa essa conversa antes; se ela não existir, segue com
+    o estado ativo. Também aceita um WebSocket no lugar do Request (ambos expõem `.session`). Sem
+    `conn`, adquire uma conexão do pool apenas para conferir a versão ou carregar o histórico.
+    """
+    key = get_conversation_key(request, user_id)
+
+    if user_id is not None and conversation_id is not None:
+        state = await activate_conversation_state(user_id, conversation_id, conn)
+        if state is not None:
+            return state
+
+    if key in user_conversations_instances:
+        if user_id is None:
+            return user_conversations_instances[key]
+        state = await refresh_conversation_state(user_id, user_conversations_instances[key], conn)
+        if state is not None:
+            return state
+
+
+    if user_id is None:
+        await ensure_llm_stack()
+        user_conversations_instances[key] = build_conversation_state()
         return user_conversations_instances[key]
-        
+
+    in_flight = _conversation_state_loads.get(key)
+    if in_flight is not None:
+        # Um prewarm (login ou /chat) já está carregando este estado: aproveita o resultado.
+        return await asyncio.shield(in_flight)
+
+    if conn is not None:
+        return await _load_latest_conversation_state(conn, key, user_id)
+    return await asyncio.shield(_start_conversation_state_load(key, user_id))
+
+
+async def activate_conversation_state(
+    user_id: int,
+    conversation_id: int,
+    conn: Optional[aiomysql.Connection] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Torna `conversation_id` a conversa ativa do usuário e devolve o estado dela. Conversas no LRU do
+    usuário são reativadas sem recarregar o histórico (só a versão é conferida, por chave primária);
+    as demais têm o histórico carregado (conferindo o dono).
+    Devolve None se a conversa não existir ou não pertencer ao usuário.
+    """
+    active = user_conversations_instances.get(user_id)
+    if active is not None and active.get("current_conversation_id") == conversation_id:
+        state = active
     else:
-        if conn is None:
-             raise RuntimeError("Conexão de banco de dados não injetada para usuário logado.")
-        
-        cursor = await conn.cursor(aiomysql.DictCursor)
-        
-        await cursor.execute(
-            "SELECT id, titulo_conversa FROM conversas WHERE id_usuario = %s ORDER BY data_atualizacao DESC LIMIT 1",
-            (user_id,)
-        )
-        last_conversation = await cursor.fetchone()
-        
-        conversation_id = None
-        history_messages = []
-        
-        if last_conversation:
-            conversation_id = last_conversation['id']
-            await cursor.execute(
-                "SELECT remetente, conteudo FROM mensagens WHERE id_conversa = %s ORDER BY data_envio ASC",
-                (conversation_id,)
-            )
-            messages_data = await cursor.fetchall()
-            
-            for msg_data in messages_data:
-                if msg_data['remetente'] == 'usuario':
-                    history_messages.append(HumanMessage(content=msg_data['conteudo']))
-                else:
-                    history_messages.append(AIMessage(content=msg_data['conteudo']))
-            
-            logger.info(f"Carregada conversa {conversation_id} para o usuário {user_id}")
+        state = _recent_conversation_states.get(user_id, {}).get(conversation_id)
+
+    if state is not None:
+        state = await refresh_conversation_state(user_id, state, conn)
+        if state is None:
+            return None
+    else:
+        load_key = (user_id, conversation_id)
+        in_flight = _conversation_state_loads.get(load_key)
+        if in_flight is not None:
+            state = await asyncio.shield(in_flight)
+        elif conn is not None:
+            state = await _load_conversation_state(conn, user_id, conversation_id)
         else:
-            logger.info(f"Nenhuma conversa encontrada para o usuário {user_id}. Será criada na primeira mensagem.")
-            
+            state = await asyncio.shield(_start_conversation_state_load(load_key, user_id, conversation_id))
+        if state is None:
+            return None
+
+    remember_conversation_state(user_id, state)
+    user_conversations_instances[user_id] = state
+    return state
+
+
+def _start_conversation_state_load(key: Any, user_id: int, conversation_id: Optional[int] = None) -> "asyncio.Task":
+    """Dispara a carga do estado em uma tarefa própria, registrada para deduplicação."""
+
+    async def _load():
+        await ensure_llm_stack()
+        async with acquire_db_connection() as conn:
+            if conversation_id is not None:
+                return await _load_conversation_state(conn, user_id, conversation_id)
+            return await _load_latest_conversation_state(conn, key, user_id)
+
+    def _done(task: "asyncio.Task"):
+        if _conversation_state_loads.get(key) is task:
+            del _conversation_state_loads[key]
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Erro ao carregar o estado de conversa de {key}: {task.exception()}")
+
+    task = asyncio.create_task(_load())
+    _conversation_state_loads[key] = task
+    task.add_done_callback(_done)
+    return task
+
+
+def prewarm_conversation_state(user_id: int, conversation_id: Optional[int] = None):
+    """
+    Carrega em segundo plano o estado de conversa do usuário (histórico + LLMs), para que a
+    primeira mensagem não pague por isso: a conversa `conversation_id` (só entra no LRU, sem
+    mudar a ativa) ou, sem ela, a mais recente. Não faz nada se o estado já está em cache ou carregando.
+    """
+    if conversation_id is not None:
+        load_key = (user_id, conversation_id)
+        if conversation_id in _recent_conversation_states.get(user_id, {}) or load_key in _conversation_state_loads:
+            return
+        _start_conversation_state_load(load_key, user_id, conversation_id)
+        return
+    if user_id in user_conversations_instances or user_id in _conversation_state_loads:
+        return
+    _start_conversation_state_load(user_id, user_id)
+
+
+async def _fetch_history(cursor, conversation_id: int) -> list:
+    await cursor.execute(
+        "SELECT remetente, conteudo FROM mensagens WHERE id_conversa = %s ORDER BY data_envio ASC",
+        (conversation_id,)
+    )
+    messages_data = await cursor.fetchall()
+    return [(msg_data['remetente'] == 'usuario', msg_data['conteudo']) for msg_data in messages_data]
+
+
+async def _load_conversation_state(
+    conn: aiomysql.Connection,
+    user_id: int,
+    conversation_id: int,
+    reload: bool = False
+) -> Optional[Dict[str, Any]]:
+    """
+    Carrega uma conversa do usuário e guarda o estado no LRU dele (sem torná-la ativa).
+    Com `reload`, substitui o estado em cache (desatualizado) em vez de reaproveitá-lo.
+    """
+    cursor = await conn.cursor(aiomysql.DictCursor)
+    try:
+        await cursor.execute("SELECT id, total_mensagens FROM conversas WHERE id = %s AND id_usuario = %s", (conversation_id, user_id))
+        conversation = await cursor.fetchone()
+        if not conversation:
+            return None
+        history = await _fetch_history(cursor, conversation_id)
+    finally:
         await cursor.close()
 
-        memory = ConversationSummaryBufferMemory(
-            llm=llm, 
-            max_token_limit=4000, 
-            return_messages=True,
-            chat_memory=ChatMessageHistory(messages=history_messages), 
-            memory_key="history"
-        )
-        user_conversations_instances[key] = {
-            "chain": ConversationChain(
-                llm=llm, 
-                memory=memory, 
-                prompt=templates_by_lang["pt"], 
-                input_key="input"
-            ), 
-            "current_conversation_id": conversation_id
-        }
+    logger.info(f"Carregada conversa {conversation_id} para o usuário {user_id}")
+    await ensure_llm_stack()
+    state = None if reload else _recent_conversation_states.get(user_id, {}).get(conversation_id)
+    if state is None:
+        state = build_conversation_state(history, conversation_id, conversation['total_mensagens'])
+        remember_conversation_state(user_id, state)
+    return state
+
+
+async def _load_latest_conversation_state(conn: aiomysql.Connection, key: Any, user_id: int) -> Dict[str, Any]:
+    """Carrega a conversa mais recente do usuário e a torna ativa, se nenhuma outra foi ativada durante a carga."""
+    cursor = await conn.cursor(aiomysql.DictCursor)
+    
+    await cursor.execute(
+        "SELECT id, titulo_conversa, total_mensagens FROM conversas WHERE id_usuario = %s ORDER BY data_atualizacao DESC LIMIT 1",
+        (user_id,)
+    )
+    last_conversation = await cursor.fetchone()
+    
+    conversation_id = None
+    history = []
+    synced_total = 0
+    
+    if last_conversation:
+        conversation_id = last_conversation['id']
+        synced_total = last_conversation['total_mensagens']
+        history = await _fetch_history(cursor, conversation_id)
+        
+        logger.info(f"Carregada conversa {conversation_id} para o usuário {user_id}")
+    else:
+        logger.info(f"Nenhuma conversa encontrada para o usuário {user_id}. Será criada na primeira mensagem.")
         
-        return user_conversations_instances[key]
\ No newline at end of file
+    await cursor.close()
+
+    await ensure_llm_stack()
+    if key not in user_conversations_instances:
+        state = _recent_conversation_states.get(user_id, {}).get(conversation_id) or build_conversation_state(history, conversation_id, synced_total)
+        remember_conversation_state(user_id, state)
+        user_conversations_instances[key] = state
+    return user_conversations_instances[key]
@@ -0,0 +1,215 @@
+"""
+Proteções das chamadas ao Gemini: prazo por chamada, requisição de hedge e circuit breaker.
+
+Este módulo não importa o LangChain (é usado pelas rotas); o wrapper do modelo que aplica
+estas políticas fica em chat.guarded_model e só é importado junto com os LLMs.
+"""
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, Set, Tuple, TypeVar
+
+from settings.config import Config
+from utils.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+config = Config()
+
+T = TypeVar("T")
+
+LLM_UNAVAILABLE_MESSAGE = "O Fala Aí está com instabilidade no momento. Por favor, tente novamente em alguns instantes."
+
+llm_calls = Counter("falaai_llm_calls_total", "Chamadas ao LLM por resultado (success, timeout, error, rejected).", ["model", "outcome"])
+llm_call_seconds = Histogram("falaai_llm_call_seconds", "Duração das chamadas bem-sucedidas ao LLM.", ["model"])
+llm_hedges = Counter("falaai_llm_hedges_total", "Requisições de hedge disparadas e vencedoras.", ["model", "outcome"])
+
+_CIRCUIT_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class LLMUnavailableError(RuntimeError):
+    """O provedor de LLM não respondeu a tempo ou o circuito está aberto."""
+
+
+class CircuitBreaker:
+    """
+    Abre quando a taxa de falhas na janela recente passa do limite (com um mínimo de chamadas),
+    rejeita chamadas durante o resfriamento e depois libera uma única chamada de teste.
+    """
+
+    def __init__(self, name: str, failure_rate: float, min_calls: int, window_seconds: float, cooldown_seconds: float):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.state = "closed"
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def _prune(self, now: float):
+        while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+            self._outcomes.popleft()
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        if self.state == "open" and now - self._opened_at >= self.cooldown_seconds:
+            self.state = "half_open"
+            self._probe_in_flight = False
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.state == "half_open":
+            logger.info(f"Circuit breaker '{self.name}' fechado: o provedor voltou a responder.")
+            self._outcomes.clear()
+        self.state = "closed"
+        self._probe_in_flight = False
+        now = time.monotonic()
+        self._outcomes.append((now, True))
+        self._prune(now)
+
+    def record_failure(self):
+        now = time.monotonic()
+        if self.state == "half_open":
+            self._open(now)
+            return
+        self._outcomes.append((now, False))
+        self._prune(now)
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+            self._open(now)
+
+    def _open(self, now: float):
+        if self.state != "open":
+            logger.warning(f"Circuit breaker '{self.name}' aberto por {self.cooldown_seconds}s após falhas do provedor.")
+        self.state = "open"
+        self._opened_at = now
+        self._probe_in_flight = False
+
+
+gemini_breaker = CircuitBreaker(
+    "gemini",
+    failure_rate=config.LLM_BREAKER_FAILURE_RATE,
+    min_calls=config.LLM_BREAKER_MIN_CALLS,
+    window_seconds=config.LLM_BREAKER_WINDOW_SECONDS,
+    cooldown_seconds=config.LLM_BREAKER_COOLDOWN_SECONDS,
+)
+
+Gauge("falaai_llm_circuit_state", "Estado do circuit breaker do Gemini (0 fechado, 1 meio-aberto, 2 aberto).",
+      function=lambda: _CIRCUIT_STATE_VALUES[gemini_breaker.state])
+
+
+class LatencyTracker:
+    """Latências recentes das chamadas bem-sucedidas, para derivar o atraso do hedge (p95)."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+def hedge_delay(tracker: LatencyTracker) -> Optional[float]:
+    """Atraso antes do hedge: o p95 observado (ou o valor configurado, sem amostras suficientes)."""
+    if not config.LLM_HEDGE_ENABLED:
+        return None
+    return max(tracker.p95() or config.LLM_HEDGE_DELAY_SECONDS, 0.05)
+
+
+async def _hedged(model_name: str, make_call: Callable[[], Awaitable[T]], delay: Optional[float]) -> T:
+    primary = asyncio.ensure_future(make_call())
+    if delay is None:
+        return await primary
+
+    tasks: Set[asyncio.Future] = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return primary.result()
+
+        hedge = asyncio.ensure_future(make_call())
+        tasks.add(hedge)
+        llm_hedges.inc(model=model_name, outcome="fired")
+
+        pending = set(tasks)
+        last_error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        llm_hedges.inc(model=model_name, outcome="won")
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+def check_breaker(model_name: str, breaker: CircuitBreaker = gemini_breaker):
+    """Levanta LLMUnavailableError (e conta a rejeição) se o circuito não permitir a chamada."""
+    if not breaker.allow():
+        llm_calls.inc(model=model_name, outcome="rejected")
+        raise LLMUnavailableError(f"Circuito '{breaker.name}' aberto; chamada ao LLM rejeitada.")
+
+
+async def guarded_call(model_name: str, make_call: Callable[[], Awaitable[T]], timeout: float,
+                       tracker: LatencyTracker, hedge: bool = True, breaker: CircuitBreaker = gemini_breaker) -> T:
+    """
+    Executa `make_call` com prazo total `timeout`, hedge opcional após o p95 e o circuit breaker.
+    Levanta LLMUnavailableError quando o circuito está aberto ou o prazo estoura.
+    """
+    check_breaker(model_name, breaker)
+
+    start = time.monotonic()
+    try:
+        result = await asyncio.wait_for(_hedged(model_name, make_call, hedge_delay(tracker) if hedge else None), timeout=timeout)
+    except asyncio.TimeoutError:
+        breaker.record_failure()
+        llm_calls.inc(model=model_name, outcome="timeout")
+        logger.warning(f"Chamada ao LLM '{model_name}' excedeu o prazo de {timeout}s.")
+        raise LLMUnavailableError(f"O LLM '{model_name}' não respondeu em {timeout}s.")
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        breaker.record_failure()
+        llm_calls.inc(model=model_name, outcome="error")
+        raise
+
+    elapsed = time.monotonic() - start
+    breaker.record_success()
+    tracker.add(elapsed)
+    llm_calls.inc(model=model_name, outcome="success")
+    llm_call_seconds.observe(elapsed, model=model_name)
+    return result
+
+
+def record_outcome(model_name: str, started_at: float, error: Optional[BaseException], breaker: CircuitBreaker = gemini_breaker):
+    """Contabiliza no breaker e nas métricas uma chamada feita fora de guarded_call (streaming ou síncrona)."""
+    if error is None:
+        elapsed = time.monotonic() - started_at
+        breaker.record_success()
+        llm_calls.inc(model=model_name, outcome="success")
+        llm_call_seconds.observe(elapsed, model=model_name)
+    elif isinstance(error, (asyncio.TimeoutError, LLMUnavailableError)):
+        breaker.record_failure()
+        llm_calls.inc(model=model_name, outcome="timeout")
+    else:
+        breaker.record_failure()
+        llm_calls.inc(model=model_name, outcome="error")
@@ -0,0 +1,241 @@
+"""
+Memórias de conversa alternativas à ConversationSummaryBufferMemory síncrona.
+
+- MEMORY_MODE=retrieval: mantém as últimas trocas (pergunta + resposta) na íntegra e indexa as
+  mais antigas num índice BM25 em memória; a cada turno só as trocas antigas mais relevantes para
+  a pergunta atual entram no `{history}` do prompt. Não faz chamadas extras ao modelo.
+- MEMORY_MODE=background_summary: o resumo do histórico é feito numa tarefa em segundo plano,
+  fora do turno que o usuário está esperando.
+
+Importado apenas por build_conversation_state (depende do LangChain).
+"""
+import math
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain.memory import ConversationSummaryBufferMemory
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.chat_history import BaseChatMessageHistory, InMemoryChatMessageHistory
+from langchain_core.memory import BaseMemory
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.runnables.config import var_child_runnable_config
+from pydantic import Field, PrivateAttr
+
+from chat.compact_history import CompactChatMessageHistory
+from chat.search import tokenize, BM25_K1, BM25_B
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRIEVED_CHARS_PER_MESSAGE = 1200
+
+
+class _TurnIndex:
+    """Índice BM25 incremental sobre as trocas antigas de uma única conversa."""
+
+    __slots__ = ("postings", "lengths", "total_length")
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.lengths: List[int] = []
+        self.total_length = 0
+
+    def add(self, text: str) -> None:
+        turn = len(self.lengths)
+        tokens = tokenize(text)
+        self.lengths.append(len(tokens))
+        self.total_length += len(tokens)
+        for token in tokens:
+            postings = self.postings.setdefault(token, {})
+            postings[turn] = postings.get(turn, 0) + 1
+
+    def search(self, query_terms: List[str], limit: int) -> List[int]:
+        """Índices das `limit` trocas mais relevantes, em ordem cronológica."""
+        total_turns = len(self.lengths)
+        if not total_turns or not query_terms:
+            return []
+        avg_length = self.total_length / total_turns or 1.0
+
+        scores: Dict[int, float] = {}
+        for term in set(query_terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total_turns - len(postings) + 0.5) / (len(postings) + 0.5))
+            for turn, tf in postings.items():
+                norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[turn] / avg_length))
+                scores[turn] = scores.get(turn, 0.0) + idf * norm
+
+        best = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:limit]
+        return sorted(turn for turn, _ in best)
+
+
+def _group_turns(messages: List[BaseMessage]) -> List[Tuple[int, int]]:
+    """Agrupa as mensagens em trocas [início, fim): cada mensagem do usuário abre uma nova troca."""
+    turns: List[Tuple[int, int]] = []
+    start = 0
+    for position, message in enumerate(messages):
+        if isinstance(message, HumanMessage) and position > start:
+            turns.append((start, position))
+            start = position
+    if start < len(messages):
+        turns.append((start, len(messages)))
+    return turns
+
+
+def _format_message(message: BaseMessage, max_chars: int = 0) -> str:
+    speaker = "Usuário" if isinstance(message, HumanMessage) else "Fala Aí"
+    content = str(message.content)
+    if max_chars and len(content) > max_chars:
+        content = content[:max_chars] + "…"
+    return f"{speaker}: {content}"
+
+
+class RetrievalWindowMemory(BaseMemory):
+    """Janela das trocas recentes + trocas antigas recuperadas por BM25 para o `{history}`."""
+
+    chat_memory: BaseChatMessageHistory = Field(default_factory=InMemoryChatMessageHistory)
+    memory_key: str = "history"
+    input_key: str = "input"
+    output_key: str = "response"
+    recent_turns: int = 4
+    retrieved_turns: int = 3
+
+    _index: _TurnIndex = PrivateAttr(default_factory=_TurnIndex)
+    _turns: List[Tuple[int, int]] = PrivateAttr(default_factory=list)
+    _indexed_message_count: int = PrivateAttr(default=-1)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def _refresh_index(self, messages: List[BaseMessage]) -> None:
+        """Reagrupa as trocas quando o histórico muda e indexa as que saíram da janela recente."""
+        if len(messages) == self._indexed_message_count:
+            return
+        if len(messages) < self._indexed_message_count:
+            self._index = _TurnIndex()
+
+        self._turns = _group_turns(messages)
+        older_count = max(0, len(self._turns) - self.recent_turns)
+        for start, end in self._turns[len(self._index.lengths):older_count]:
+            self._index.add(" ".join(str(message.content) for message in messages[start:end]))
+        self._indexed_message_count = len(messages)
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, str]:
+        messages = self.chat_memory.messages
+        self._refresh_index(messages)
+
+        older_count = len(self._index.lengths)
+        sections = []
+        if older_count:
+            query_terms = tokenize(str(inputs.get(self.input_key, "")))
+            retrieved = self._index.search(query_terms, self.retrieved_turns)
+            if retrieved:
+                lines = []
+                for turn in retrieved:
+                    start, end = self._turns[turn]
+                    lines.extend(_format_message(message, MAX_RETRIEVED_CHARS_PER_MESSAGE) for message in messages[start:end])
+                sections.append("Trechos relevantes de partes anteriores da conversa:\n" + "\n".join(lines))
+
+        recent_start = self._turns[older_count][0] if older_count < len(self._turns) else len(messages)
+        if recent_start < len(messages):
+            recent = "\n".join(_format_message(message) for message in messages[recent_start:])
+            sections.append(("Mensagens recentes:\n" if sections else "") + recent)
+
+        return {self.memory_key: "\n\n".join(sections)}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        self.chat_memory.add_user_message(str(inputs[self.input_key]))
+        self.chat_memory.add_ai_message(str(outputs[self.output_key]))
+
+    def clear(self) -> None:
+        self.chat_memory.clear()
+        self._index = _TurnIndex()
+        self._turns = []
+        self._indexed_message_count = -1
+
+
+class BackgroundSummaryBufferMemory(ConversationSummaryBufferMemory):
+    """
+    ConversationSummaryBufferMemory que não resume dentro do turno: `asave_context` só anexa as
+    mensagens e agenda uma tarefa que conta os tokens (numa thread, pois o Gemini conta pela API)
+    e, acima de `max_token_limit`, resume as mensagens mais antigas. Até o novo resumo ficar pronto,
+    o prompt usa o resumo anterior mais as mensagens excedentes na íntegra.
+    """
+
+    chat_memory: CompactChatMessageHistory = Field(default_factory=CompactChatMessageHistory)
+
+    _summary_task: Optional[asyncio.Task] = PrivateAttr(default=None)
+    _recheck: bool = PrivateAttr(default=False)
+    # Tokens por número sequencial da mensagem (CompactChatMessageHistory.head + posição).
+    _token_counts: Dict[int, int] = PrivateAttr(default_factory=dict)
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        BaseChatMemory.save_context(self, inputs, outputs)
+        self._schedule_summary()
+
+    async def asave_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        await BaseChatMemory.asave_context(self, inputs, outputs)
+        self._schedule_summary()
+
+    def _schedule_summary(self) -> None:
+        if self._summary_task is not None and not self._summary_task.done():
+            # Um resumo já está em andamento: ele reavalia o buffer ao terminar.
+            self._recheck = True
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.prune()
+            return
+        self._summary_task = loop.create_task(self._summarize_in_background())
+
+    def _message_token_counts(self, head: int, messages: List[BaseMessage]) -> List[int]:
+        """Tokens de cada mensagem, contados uma única vez por mensagem (síncrona, roda numa thread)."""
+        counts = []
+        for sequence, message in enumerate(messages, start=head):
+            count = self._token_counts.get(sequence)
+            if count is None:
+                count = self._token_counts[sequence] = self.llm.get_num_tokens_from_messages([message])
+            counts.append(count)
+        return counts
+
+    async def _summarize_in_background(self) -> None:
+        # A tarefa herda o contexto do turno; sem isto, os callbacks do turno (ex.: astream_events)
+        # receberiam os eventos do resumo depois de encerrados.
+        var_child_runnable_config.set(None)
+        try:
+            while True:
+                self._recheck = False
+                head = self.chat_memory.head
+                messages = list(self.chat_memory.messages)
+                counts = await asyncio.to_thread(self._message_token_counts, head, messages)
+
+                total = sum(counts)
+                prune_count = 0
+                while total > self.max_token_limit and prune_count < len(messages):
+                    total -= counts[prune_count]
+                    prune_count += 1
+
+                if prune_count:
+                    pruned = messages[:prune_count]
+                    new_summary = await self.apredict_new_summary(pruned, self.moving_summary_buffer)
+
+                    if self.chat_memory.head == head and len(self.chat_memory) >= prune_count:
+                        self.chat_memory.remove_oldest(prune_count)
+                        self.moving_summary_buffer = new_summary
+                        for sequence in range(head, head + prune_count):
+                            self._token_counts.pop(sequence, None)
+                        logger.info(f"Resumo da conversa atualizado em segundo plano ({prune_count} mensagens resumidas).")
+                    else:
+                        logger.info("Histórico alterado durante o resumo em segundo plano; resultado descartado.")
+
+                if not self._recheck:
+                    break
+        except Exception as e:
+            logger.error(f"Erro ao resumir a conversa em segundo plano: {e}", exc_info=True)
+
+    def clear(self) -> None:
+        super().clear()
+        self._token_counts.clear()
@@ -1,5 +1,11 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 class Message(BaseModel):
     message: str
-    language: str = "pt"
\ No newline at end of file
+    language: str = "pt"
+    # Conversa em que a mensagem continua (a ativa no navegador); sem ela, vale a conversa ativa no servidor.
+    conversation_id: Optional[int] = None
+    # Começa uma conversa nova (botão "Novo Chat"), em vez de continuar a ativa; vale sobre conversation_id.
+    new_conversation: bool = False
\ No newline at end of file
@@ -0,0 +1,249 @@
+"""
+Exportação e importação em massa do histórico de um usuário.
+
+Formato NDJSON (uma linha por registro, na ordem conversa -> suas mensagens):
+    {"type": "conversation", "id": 1, "titulo_conversa": "...", "data_criacao": "...", "data_atualizacao": "...", "arquivada": false}
+    {"type": "message", "conversation_id": 1, "id": 10, "remetente": "usuario", "conteudo": "...", "data_envio": "..."}
+
+A exportação lê com cursor sem buffer no servidor (SSDictCursor) e produz as linhas conforme
+chegam, com memória constante; o zip é gerado em modo streaming (sem seek). A importação lê o
+arquivo em lotes e grava as mensagens com INSERTs de múltiplas linhas (executemany), tudo em
+uma única transação; por isso o arquivo (já descompactado) é limitado a IMPORT_MAX_BYTES, abaixo
+do limite de tamanho de transação do TiDB.
+"""
+import io
+import json
+import asyncio
+import zipfile
+import datetime
+import itertools
+import logging
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import aiomysql
+
+from settings.config import Config
+from db.dependencies import acquire_db_connection
+from chat.archive import read_user_index, read_record, json_default, parse_datetime
+from chat.conversation_stats import refresh_conversation_stats
+from chat.search import invalidate_user_index
+
+logger = logging.getLogger(__name__)
+
+config = Config()
+
+EXPORT_FETCH_SIZE = 500
+EXPORT_ZIP_MEMBER = "conversas.ndjson"
+VALID_SENDERS = ("usuario", "ia")
+
+
+class ImportTooLargeError(ValueError):
+    """O arquivo importado passa de IMPORT_MAX_BYTES (a importação é desfeita)."""
+
+
+def _line(record: Dict[str, Any]) -> bytes:
+    return json.dumps(record, default=json_default, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def _conversation_line(row: Dict[str, Any], archived: bool) -> bytes:
+    return _line({
+        "type": "conversation",
+        "id": row["id"],
+        "titulo_conversa": row["titulo_conversa"],
+        "data_criacao": row["data_criacao"],
+        "data_atualizacao": row["data_atualizacao"],
+        "arquivada": archived,
+    })
+
+
+def _message_line(conversation_id: int, message: Dict[str, Any]) -> bytes:
+    return _line({
+        "type": "message",
+        "conversation_id": conversation_id,
+        "id": message["id"],
+        "remetente": message["remetente"],
+        "conteudo": message["conteudo"],
+        "data_envio": message["data_envio"],
+    })
+
+
+async def iter_export_ndjson(user_id: int) -> AsyncIterator[bytes]:
+    """Gera o NDJSON de todas as conversas do usuário (tabelas quentes e arquivo)."""
+    async with acquire_db_connection() as conn:
+        cursor = await conn.cursor(aiomysql.SSDictCursor)
+        try:
+            await cursor.execute(
+                """
+                SELECT c.id, c.titulo_conversa, c.data_criacao, c.data_atualizacao,
+                       m.id AS mensagem_id, m.remetente, m.conteudo, m.data_envio
+                FROM conversas c
+                LEFT JOIN mensagens m ON m.id_conversa = c.id
+                WHERE c.id_usuario = %s
+                ORDER BY c.id, m.id
+                """,
+                (user_id,)
+            )
+            current_conversation = None
+            while True:
+                rows = await cursor.fetchmany(EXPORT_FETCH_SIZE)
+                if not rows:
+                    break
+                chunk = []
+                for row in rows:
+                    if row["id"] != current_conversation:
+                        current_conversation = row["id"]
+                        chunk.append(_conversation_line(row, archived=False))
+                    if row["mensagem_id"] is not None:
+                        chunk.append(_message_line(row["id"], {
+                            "id": row["mensagem_id"], "remetente": row["remetente"],
+                            "conteudo": row["conteudo"], "data_envio": row["data_envio"],
+                        }))
+                yield b"".join(chunk)
+        finally:
+            await cursor.close()
+
+    entries = await asyncio.to_thread(read_user_index, user_id)
+    for entry in entries.values():
+        record = await asyncio.to_thread(read_record, entry)
+        conversa = record["conversa"]
+        chunk = [_conversation_line(conversa, archived=True)]
+        chunk.extend(_message_line(conversa["id"], message) for message in record["mensagens"])
+        yield b"".join(chunk)
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Destino não pesquisável para o ZipFile: acumula os bytes escritos até serem drenados."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+async def iter_export_zip(user_id: int) -> AsyncIterator[bytes]:
+    """Gera um zip (streaming, sem seek) contendo o NDJSON da exportação."""
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(EXPORT_ZIP_MEMBER, mode="w", force_zip64=True) as member:
+            async for chunk in iter_export_ndjson(user_id):
+                member.write(chunk)
+                data = buffer.drain()
+                if data:
+                    yield data
+    data = buffer.drain()
+    if data:
+        yield data
+
+
+def open_import_lines(file_obj, filename: Optional[str]) -> Iterator[bytes]:
+    """Itera as linhas de um upload NDJSON, ou do NDJSON dentro de um zip exportado (síncrona)."""
+    if filename and filename.lower().endswith(".zip"):
+        archive = zipfile.ZipFile(file_obj)
+        member_name = EXPORT_ZIP_MEMBER if EXPORT_ZIP_MEMBER in archive.namelist() else archive.namelist()[0]
+        return iter(archive.open(member_name))
+    return iter(file_obj)
+
+
+def _parse_datetime(value: Optional[str]) -> datetime.datetime:
+    return parse_datetime(value) or datetime.datetime.now()
+
+
+async def _flush_messages(conn: aiomysql.Connection, pending: List[Tuple]) -> int:
+    if not pending:
+        return 0
+    cursor = await conn.cursor()
+    try:
+        # O aiomysql reescreve o executemany de INSERT ... VALUES como INSERT de múltiplas linhas.
+        await cursor.executemany(
+            "INSERT INTO mensagens (id_conversa, remetente, conteudo, data_envio) VALUES (%s, %s, %s, %s)",
+            pending
+        )
+    finally:
+        await cursor.close()
+    inserted = len(pending)
+    pending.clear()
+    return inserted
+
+
+async def import_user_history(conn: aiomysql.Connection, user_id: int, lines: Iterator[bytes]) -> Dict[str, int]:
+    """
+    Importa um NDJSON exportado para a conta do usuário. As conversas recebem novos IDs;
+    as mensagens são gravadas em lotes de IMPORT_BATCH_SIZE linhas. Tudo roda em uma única
+    transação: um erro no meio (inclusive ImportTooLargeError, acima de IMPORT_MAX_BYTES)
+    desfaz a importação inteira. Não há deduplicação: importar o mesmo arquivo duas vezes
+    cria as conversas duas vezes.
+    """
+    conversation_ids: Dict[Any, int] = {}
+    pending: List[Tuple] = []
+    counts = {"conversations": 0, "messages": 0, "skipped": 0}
+    bytes_read = 0
+
+    cursor = await conn.cursor()
+    try:
+        await conn.begin()
+        while True:
+            batch = await asyncio.to_thread(list, itertools.islice(lines, config.IMPORT_BATCH_SIZE))
+            if not batch:
+                break
+
+            for raw_line in batch:
+                bytes_read += len(raw_line)
+                if config.IMPORT_MAX_BYTES and bytes_read > config.IMPORT_MAX_BYTES:
+                    raise ImportTooLargeError(f"o arquivo passa de {config.IMPORT_MAX_BYTES} bytes")
+                raw_line = raw_line.strip()
+                if not raw_line:
+                    continue
+                try:
+                    record = json.loads(raw_line)
+                    kind = record.get("type")
+                except (ValueError, AttributeError):
+                    counts["skipped"] += 1
+                    continue
+
+                if kind == "conversation":
+                    await cursor.execute(
+                        "INSERT INTO conversas (id_usuario, titulo_conversa, data_criacao, data_atualizacao) VALUES (%s, %s, %s, %s)",
+                        (user_id, (record.get("titulo_conversa") or "Conversa Importada")[:50],
+                         _parse_datetime(record.get("data_criacao")), _parse_datetime(record.get("data_atualizacao")))
+                    )
+                    conversation_ids[record.get("id")] = cursor.lastrowid
+                    counts["conversations"] += 1
+                elif kind == "message" and record.get("conversation_id") in conversation_ids \
+                        and record.get("remetente") in VALID_SENDERS and record.get("conteudo"):
+                    pending.append((conversation_ids[record["conversation_id"]], record["remetente"],
+                                    record["conteudo"], _parse_datetime(record.get("data_envio"))))
+                else:
+                    counts["skipped"] += 1
+
+            if len(pending) >= config.IMPORT_BATCH_SIZE:
+                counts["messages"] += await _flush_messages(conn, pending)
+
+        counts["messages"] += await _flush_messages(conn, pending)
+        imported_ids = list(conversation_ids.values())
+        for start in range(0, len(imported_ids), config.CONVERSATION_STATS_BACKFILL_BATCH_SIZE):
+            await refresh_conversation_stats(conn, imported_ids[start:start + config.CONVERSATION_STATS_BACKFILL_BATCH_SIZE])
+        await conn.commit()
+    except BaseException:
+        await conn.rollback()
+        raise
+    finally:
+        await cursor.close()
+
+    invalidate_user_index(user_id)
+    logger.info(f"Importação concluída para o usuário {user_id}: {counts}")
+    return counts
@@ -0,0 +1,104 @@
+"""
+Cache de respostas exatas para o primeiro turno de conversas sem histórico.
+
+Aberturas como "oi" ou "o que você faz?" chegam a uma ConversationChain vazia e sempre geram a
+mesma chamada ao Gemini. A chave é (entrada normalizada, versão do prompt, histórico vazio), com
+despejo LRU por tamanho e expiração por TTL.
+"""
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from settings.config import Config
+from chat.llm_config import PROMPT_TEMPLATE_TEXTS
+from chat.search import normalize_token
+from utils.metrics import Counter, Gauge
+
+config = Config()
+
+# Muda sempre que o texto do prompt muda, invalidando as respostas geradas com o prompt antigo.
+PROMPT_VERSION = hashlib.sha1(PROMPT_TEMPLATE_TEXTS["pt"].encode("utf-8")).hexdigest()[:12]
+
+CacheKey = Tuple[str, str, bool]
+
+
+class ResponseCache:
+    """LRU com TTL de respostas do LLM, com contagem de acertos/falhas."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[CacheKey, Tuple[float, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            response_cache_lookups.inc(result="hit")
+            return entry[1]
+
+        if entry is not None:
+            del self._entries[key]
+        self.misses += 1
+        response_cache_lookups.inc(result="miss")
+        return None
+
+    def put(self, key: CacheKey, response: str):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def evict_expired(self) -> int:
+        """Remove as entradas vencidas (as não consultadas só sairiam pelo despejo LRU)."""
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        return len(expired)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+response_cache_lookups = Counter("falaai_response_cache_lookups_total", "Consultas ao cache de respostas do primeiro turno.", ["result"])
+
+response_cache = ResponseCache(config.RESPONSE_CACHE_MAX_ENTRIES, config.RESPONSE_CACHE_TTL_SECONDS)
+
+Gauge("falaai_response_cache_entries", "Respostas armazenadas no cache do primeiro turno.", function=lambda: len(response_cache))
+Gauge("falaai_response_cache_hit_ratio", "Taxa de acerto do cache de respostas do primeiro turno.", function=lambda: response_cache.hit_rate)
+
+
+def normalize_prompt(text: str) -> str:
+    """Minúsculas, sem acentos, espaços colapsados e sem pontuação final ("Oi!" == "oi")."""
+    return normalize_token(" ".join(text.split())).strip(" ?!.,;:…")
+
+
+def is_fresh_conversation(chain) -> bool:
+    """True se a memória da cadeia ainda não tem nenhuma mensagem nem resumo."""
+    memory = chain.memory
+    return not len(memory.chat_memory) and not getattr(memory, "moving_summary_buffer", "")
+
+
+def response_cache_key(chain, user_message: str) -> Optional[CacheKey]:
+    """Chave do cache para o turno, ou None se ele não for elegível (cache desligado, histórico ou entrada longa)."""
+    if not config.RESPONSE_CACHE_ENABLED or len(user_message) > config.RESPONSE_CACHE_MAX_INPUT_CHARS:
+        return None
+    if not is_fresh_conversation(chain):
+        return None
+    normalized = normalize_prompt(user_message)
+    if not normalized:
+        return None
+    return (normalized, PROMPT_VERSION, True)
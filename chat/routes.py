@@ -3,26 +3,41 @@ import logging
 import datetime
 import uuid
 import asyncio 
-from typing import Dict, Any, Optional 
+import hashlib
+import zipfile
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable
 
 import aiomysql
-from fastapi import APIRouter, Request, HTTPException, Depends, status
-from fastapi.responses import HTMLResponse, JSONResponse
-from langchain.chains import ConversationChain
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain.memory import ConversationSummaryBufferMemory
-from langchain_community.chat_message_histories import ChatMessageHistory
+from fastapi import APIRouter, Request, HTTPException, Depends, Query, status, WebSocket, WebSocketDisconnect, UploadFile, File
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from pydantic import ValidationError
 
 
-from db.dependencies import get_db_connection
+from db.dependencies import get_db_connection, acquire_db_connection
 from common_deps import get_current_user, templates
+from utils.responses import FastJSONResponse, dumps
 
 from chat.models import Message 
+from chat.search import search_user_messages, index_persisted_messages
+from chat.conversation_stats import make_preview
+from chat.archive import list_archived_conversations, restore_archived_conversation, to_epoch_ms
+from chat.llm_guard import LLMUnavailableError, LLM_UNAVAILABLE_MESSAGE
+from chat.usage import usage_scope, usage_subject, has_quota, QUOTA_EXCEEDED_MESSAGE
+from chat.response_cache import response_cache, response_cache_key
+from chat.portability import iter_export_ndjson, iter_export_zip, open_import_lines, import_user_history, ImportTooLargeError
 from chat.llm_config import (
    
-    get_user_conversation_instance as get_conversation_state_dep, 
+    load_user_conversation_instance,
+    activate_conversation_state,
+    remember_conversation_state,
+    record_persisted_turn,
+    start_new_conversation_state,
+    active_conversation_from_cookie,
+    prewarm_conversation_state,
+    get_conversation_key,
     user_conversations_instances, 
     templates_by_lang,
+    ACTIVE_CONVERSATION_COOKIE,
     get_llm_title_generator,
     TITLE_GENERATION_PROMPT,
     initialize_llms # Adicionei o initialize_llms se for usado na rota /conversations
@@ -31,6 +46,8 @@ from chat.llm_config import (
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+UNVERIFIED_ACCOUNT_MESSAGE = "Sua conta ainda não foi verificada. Por favor, verifique seu email para que eu possa salvar nosso histórico. Você pode reeunviar o link através da tela de Login."
+
 
 async def generate_chat_title(user_message: str) -> str:
     """Gera um título conciso usando o LLM."""
@@ -54,141 +71,523 @@ async def generate_chat_title(user_message: str) -> str:
 
 
 
-async def update_conversation_title(conversation_id: int, user_message: str, conn: aiomysql.Connection):
-    """Função separada para atualizar o título da conversa em segundo plano."""
+async def update_conversation_title(conversation_id: int, user_message: str):
+    """
+    Função separada para atualizar o título da conversa em segundo plano.
+    Usa uma conexão própria do pool: a conexão da requisição já foi devolvida quando ela roda.
+    """
     new_title = await generate_chat_title(user_message)
     
-    
-    cursor_title = await conn.cursor()
     try:
-        await cursor_title.execute(
-            "UPDATE conversas SET titulo_conversa = %s WHERE id = %s",
-            (new_title, conversation_id)
-        )
-        await conn.commit()
-        logger.info(f"Título da conversa {conversation_id} atualizado para: '{new_title}'")
+        async with acquire_db_connection() as conn:
+            cursor_title = await conn.cursor()
+            try:
+                # data_atualizacao também muda para invalidar o ETag da lista de conversas.
+                await cursor_title.execute(
+                    "UPDATE conversas SET titulo_conversa = %s, data_atualizacao = %s WHERE id = %s",
+                    (new_title, datetime.datetime.now(), conversation_id)
+                )
+                await conn.commit()
+                logger.info(f"Título da conversa {conversation_id} atualizado para: '{new_title}'")
+            finally:
+                await cursor_title.close()
     except Exception as title_err:
         logger.error(f"Erro ao atualizar título da conversa {conversation_id}: {title_err}", exc_info=True)
+
+
+async def fetch_email_verified(conn: aiomysql.Connection, user_id: int) -> bool:
+    """Retorna se o email do usuário já foi verificado."""
+    cursor_check = await conn.cursor()
+    try:
+        await cursor_check.execute("SELECT email_verified FROM usuarios WHERE id = %s", (user_id,))
+        user_data = await cursor_check.fetchone()
+        return bool(user_data['email_verified']) if user_data else False
+    finally:
+        await cursor_check.close()
+
+
+async def create_conversation(conn: aiomysql.Connection, user_id: int) -> Optional[int]:
+    """Cria uma nova entrada em `conversas` e retorna o seu ID (ou None em caso de falha)."""
+    cursor_new = await conn.cursor()
+    try:
+        await cursor_new.execute(
+            "INSERT INTO conversas (id_usuario, titulo_conversa, data_criacao, data_atualizacao) VALUES (%s, %s, %s, %s)",
+            (user_id, 'Nova Conversa...', datetime.datetime.now(), datetime.datetime.now())
+        )
+        
+        new_id = cursor_new.lastrowid
+        
+        await conn.commit() 
+
+        if new_id:
+            logger.info(f"Nova conversa {new_id} criada para o usuário {user_id} usando lastrowid.")
+            return new_id
+
+        # Rollback e log de erro se o ID não foi recuperado
+        await conn.rollback()
+        logger.error("Falha ao obter o ID (lastrowid) após a criação da conversa. Rollback executado.")
+        return None
+             
+    except Exception as new_conv_err:
+        logger.error(f"Erro ao criar nova conversa no DB: {new_conv_err}", exc_info=True)
+        await conn.rollback()
+        return None
+    finally:
+         await cursor_new.close()
+
+
+async def persist_chat_turn(conn: aiomysql.Connection, user_id: int, conversation_id: int, user_message: str, ai_text: str):
+    """
+    Salva a mensagem do usuário e a resposta da IA e atualiza a data e as colunas de resumo da
+    conversa (chat.conversation_stats) na mesma transação; depois, o índice de busca local.
+    """
+    cursor_persist = await conn.cursor()
+    try:
+        await conn.begin()
+        user_sent_at = datetime.datetime.now()
+        await cursor_persist.execute(
+            "INSERT INTO mensagens (id_conversa, remetente, conteudo, data_envio) VALUES (%s, %s, %s, %s)",
+            (conversation_id, 'usuario', user_message, user_sent_at)
+        )
+        user_message_id = cursor_persist.lastrowid
+
+        ai_sent_at = datetime.datetime.now()
+        await cursor_persist.execute(
+            "INSERT INTO mensagens (id_conversa, remetente, conteudo, data_envio) VALUES (%s, %s, %s, %s)",
+            (conversation_id, 'ia', ai_text, ai_sent_at) 
+        )
+        ai_message_id = cursor_persist.lastrowid
+
+        # Em conversas ainda não preenchidas (total NULL) o incremento mantém o NULL para o backfill.
+        await cursor_persist.execute(
+            """
+            UPDATE conversas
+            SET data_atualizacao = %s,
+                total_mensagens = total_mensagens + 2,
+                total_caracteres = total_caracteres + %s,
+                previa_ultima_mensagem = %s
+            WHERE id = %s
+            """,
+            (datetime.datetime.now(), len(user_message) + len(ai_text), make_preview(ai_text), conversation_id)
+        )
+        
+        await conn.commit()
+        logger.info(f"Mensagem do usuário e resposta da IA salvas na conversa {conversation_id}")
+
+        index_persisted_messages(user_id, conversation_id, [
+            (user_message_id, 'usuario', user_message, user_sent_at),
+            (ai_message_id, 'ia', ai_text, ai_sent_at),
+        ])
+    except Exception as save_err:
+        await conn.rollback()
+        logger.error(f"Erro ao salvar mensagens no DB: {save_err}", exc_info=True)
     finally:
-        await cursor_title.close()
+        await cursor_persist.close()
+
+
+async def ensure_conversation(conn: aiomysql.Connection, user_id: int, user_conversation_state: Dict[str, Any]) -> Tuple[Optional[int], bool]:
+    """
+    Garante que o estado tenha uma conversa no DB, criando-a na primeira mensagem.
+    Retorna (conversation_id, is_new_conversation).
+    """
+    current_conversation_id = user_conversation_state.get("current_conversation_id")
+    if current_conversation_id is not None:
+        return current_conversation_id, False
 
+    new_id = await create_conversation(conn, user_id)
+    if new_id is None:
+        return None, False
+
+    # ATUALIZA o estado da conversa para uso imediato e persistência
+    user_conversation_state["current_conversation_id"] = new_id
+    remember_conversation_state(user_id, user_conversation_state)
+    return new_id, True
+
+
+async def resolve_conversation_state(
+    request: Request,
+    user_id: Optional[int],
+    message_data: Message,
+    fallback_conversation_id: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Estado em que a mensagem continua: um estado vazio se ela pede `new_conversation`; a conversa
+    `conversation_id` do payload (None se não existir ou não for do usuário); ou, sem ela, a conversa
+    `fallback_conversation_id` (cookie ou a da conexão), com o estado ativo como último recurso.
+    Tudo vem da própria mensagem, não do estado local do worker: estados em cache de usuários logados
+    têm a versão conferida no DB antes do uso. Aceita um WebSocket no lugar do Request.
+    """
+    if message_data.new_conversation:
+        return await start_new_conversation_state(get_conversation_key(request, user_id))
+    if user_id is not None and message_data.conversation_id is not None:
+        return await activate_conversation_state(user_id, message_data.conversation_id)
+    return await load_user_conversation_instance(request, user_id, conversation_id=fallback_conversation_id)
+
+
+async def stream_conversation_response(user_conversation, user_message: str, on_token: Callable[[str], Awaitable[None]]) -> str:
+    """
+    Executa a ConversationChain repassando os tokens da resposta a `on_token` à medida que chegam.
+    Apenas a chamada principal do modelo é transmitida (a sumarização da memória não).
+    """
+    root_run_id = None
+    model_run_id = None
+    result = None
+
+    async for event in user_conversation.astream_events({"input": user_message}, version="v2"):
+        kind = event["event"]
+        if root_run_id is None:
+            root_run_id = event["run_id"]
+
+        if kind == "on_chat_model_start" and model_run_id is None:
+            model_run_id = event["run_id"]
+        elif kind == "on_chat_model_stream" and event["run_id"] == model_run_id:
+            content = event["data"]["chunk"].content
+            if isinstance(content, str) and content:
+                await on_token(content)
+        elif kind == "on_chain_end" and event["run_id"] == root_run_id:
+            result = event["data"]["output"]
+
+    if not result or "response" not in result:
+        raise RuntimeError("A cadeia de conversa terminou sem resposta.")
+    return result["response"]
+
+
+def make_etag(*parts: Any) -> str:
+    """Gera um ETag fraco a partir dos valores que identificam a versão de um recurso."""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Verifica se o cabeçalho If-None-Match do cliente contém o ETag atual."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return etag in candidates or "*" in candidates
+
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+
+# Leitura por chave primária: total_mensagens é atualizado na mesma transação que grava cada turno
+# (e recalculado na importação/restauração), e mensagens nunca são editadas, então ele e a data de
+# atualização bastam como versão, sem varrer `mensagens`.
+CONVERSATION_VERSION_SQL = """
+    SELECT id, data_atualizacao, total_mensagens
+    FROM conversas
+    WHERE id = %s AND id_usuario = %s
+"""
+
+
+async def conversation_list_etag(cursor, user_id: int) -> str:
+    """ETag da lista de conversas: quantidade, maior ID e última atualização."""
+    await cursor.execute(
+        "SELECT COUNT(*) AS total, MAX(id) AS ultimo_id, MAX(data_atualizacao) AS ultima_atualizacao FROM conversas WHERE id_usuario = %s",
+        (user_id,)
+    )
+    version = await cursor.fetchone()
+    return make_etag("conversas", user_id, version['total'], version['ultimo_id'], version['ultima_atualizacao'])
+
+
+async def select_conversation_list(cursor, user_id: int) -> List[Dict[str, Any]]:
+    """Conversas do usuário, mais recentes primeiro, com as datas em milissegundos desde a época (como /conversations/archived)."""
+    await cursor.execute(
+        """
+        SELECT id, titulo_conversa, data_criacao, data_atualizacao,
+               total_mensagens, total_caracteres, previa_ultima_mensagem
+        FROM conversas 
+        WHERE id_usuario = %s 
+        ORDER BY data_atualizacao DESC
+        """, 
+        (user_id,)
+    )
+    conversations = await cursor.fetchall()
+    for conv in conversations:
+        conv['data_criacao'] = to_epoch_ms(conv['data_criacao'])
+        conv['data_atualizacao'] = to_epoch_ms(conv['data_atualizacao'])
+    return conversations
+
+
+def conversation_etag(conversation: Dict[str, Any]) -> str:
+    """ETag de uma conversa a partir da linha de CONVERSATION_VERSION_SQL."""
+    return make_etag("conversa", conversation['id'], conversation['data_atualizacao'], conversation['total_mensagens'])
+
+
+async def select_conversation_messages(cursor, conversation_id: int, since_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Mensagens da conversa no formato do front-end (remetente 'usuario'/'bot'), prontas para a FastJSONResponse."""
+    select_sql = """
+        SELECT id, CASE WHEN remetente = 'usuario' THEN 'usuario' ELSE 'bot' END AS remetente, conteudo, data_envio
+        FROM mensagens
+        WHERE id_conversa = %s{since_filter}
+        ORDER BY data_envio ASC, id ASC
+    """
+    if since_id is not None:
+        await cursor.execute(select_sql.format(since_filter=" AND id > %s"), (conversation_id, since_id))
+    else:
+        await cursor.execute(select_sql.format(since_filter=""), (conversation_id,))
+    return await cursor.fetchall()
 
 
-@router.get("/conversations", response_class=JSONResponse)
+@router.get("/conversations", response_class=FastJSONResponse)
 async def get_conversations_list(
+    request: Request,
     user_id: Optional[int] = Depends(get_current_user),
     conn: aiomysql.Connection = Depends(get_db_connection)
 ):
+    """
+    Lista as conversas do usuário. Responde 304 quando o If-None-Match do cliente
+    ainda corresponde à versão atual da lista (quantidade, maior ID e última atualização).
+    """
     cursor = await conn.cursor(aiomysql.DictCursor)
     conversations_list = []
     try:
-        await cursor.execute(
-            """
-            SELECT id, titulo_conversa, data_criacao, data_atualizacao 
-            FROM conversas 
-            WHERE id_usuario = %s 
-            ORDER BY data_atualizacao DESC
-            """, 
-            (user_id,)
-        )
-        conversations_raw = await cursor.fetchall()
-        
-        for conv in conversations_raw:
-            if isinstance(conv.get('data_criacao'), datetime.datetime):
-                conv['data_criacao'] = int(conv['data_criacao'].timestamp() * 1000)
-            if isinstance(conv.get('data_atualizacao'), datetime.datetime):
-                conv['data_atualizacao'] = int(conv['data_atualizacao'].timestamp() * 1000)
-            
-            conversations_list.append(conv)
+        etag = await conversation_list_etag(cursor, user_id)
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
+
+        conversations_list = await select_conversation_list(cursor, user_id)
             
     except Exception as e:
         logger.error(f"Erro ao buscar lista de conversas para o usuário {user_id}: {e}")
 
-        return JSONResponse(content=[], status_code=status.HTTP_200_OK)
+        return FastJSONResponse(content=[], status_code=status.HTTP_200_OK)
     finally:
         await cursor.close()
 
-    return JSONResponse(content=conversations_list, status_code=status.HTTP_200_OK)
+    return FastJSONResponse(content=conversations_list, status_code=status.HTTP_200_OK, headers={"ETag": etag})
+
+
+@router.get("/conversations/search", response_class=FastJSONResponse)
+async def search_conversations(
+    q: str = Query(..., min_length=1, max_length=200),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=50),
+    user_id: Optional[int] = Depends(get_current_user),
+    conn: aiomysql.Connection = Depends(get_db_connection)
+):
+    """Busca textual ranqueada nas mensagens do usuário, com trechos e paginação."""
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Acesso não autorizado.")
+
+    offset = (page - 1) * page_size
+    try:
+        # Busca um item a mais para saber se existe próxima página.
+        results = await search_user_messages(conn, user_id, q, page_size + 1, offset)
+    except Exception as e:
+        logger.error(f"Erro na busca de mensagens para o usuário {user_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Erro ao buscar mensagens.")
+
+    return FastJSONResponse(content={
+        "query": q,
+        "page": page,
+        "page_size": page_size,
+        "has_more": len(results) > page_size,
+        "results": results[:page_size],
+    }, status_code=status.HTTP_200_OK)
+
+
+@router.get("/conversations/archived", response_class=FastJSONResponse)
+async def get_archived_conversations_list(user_id: Optional[int] = Depends(get_current_user)):
+    """Lista as conversas arquivadas do usuário (abrir uma delas a restaura)."""
+    if not user_id:
+        return FastJSONResponse(content=[], status_code=status.HTTP_200_OK)
+
+    try:
+        conversations = await list_archived_conversations(user_id)
+    except Exception as e:
+        logger.error(f"Erro ao listar conversas arquivadas do usuário {user_id}: {e}", exc_info=True)
+        return FastJSONResponse(content=[], status_code=status.HTTP_200_OK)
+
+    return FastJSONResponse(content=conversations, status_code=status.HTTP_200_OK)
+
+
+@router.get("/conversations/export")
+async def export_conversations(
+    format: str = Query("ndjson", pattern="^(ndjson|zip)$"),
+    user_id: Optional[int] = Depends(get_current_user)
+):
+    """
+    Exporta todo o histórico do usuário (inclusive conversas arquivadas) em NDJSON ou zip.
+    A resposta é gerada em streaming, com a conexão do DB presa apenas durante a leitura.
+    """
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Usuário não autenticado.")
+
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    if format == "zip":
+        body, media_type, filename = iter_export_zip(user_id), "application/zip", f"falaai-historico-{stamp}.zip"
+    else:
+        body, media_type, filename = iter_export_ndjson(user_id), "application/x-ndjson", f"falaai-historico-{stamp}.ndjson"
+
+    logger.info(f"Exportação ({format}) iniciada para o usuário {user_id}.")
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@router.post("/conversations/import", response_class=FastJSONResponse)
+async def import_conversations(
+    file: UploadFile = File(...),
+    user_id: Optional[int] = Depends(get_current_user),
+    conn: aiomysql.Connection = Depends(get_db_connection)
+):
+    """Importa um histórico exportado (NDJSON ou zip) como novas conversas do usuário."""
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Usuário não autenticado.")
+    if not await fetch_email_verified(conn, user_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=UNVERIFIED_ACCOUNT_MESSAGE)
+
+    try:
+        lines = await asyncio.to_thread(open_import_lines, file.file, file.filename)
+        counts = await import_user_history(conn, user_id, lines)
+    except ImportTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Arquivo de importação grande demais: {e}")
+    except (ValueError, zipfile.BadZipFile, IndexError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Arquivo de importação inválido: {e}")
+    except Exception as e:
+        logger.error(f"Erro ao importar histórico do usuário {user_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Erro interno ao importar o histórico.")
+    finally:
+        await file.close()
+
+    return FastJSONResponse(content=counts, status_code=status.HTTP_200_OK)
+
+
+async def _load_chat_profile(user_id: int) -> Optional[Dict[str, Any]]:
+    async with acquire_db_connection() as conn:
+        cursor = await conn.cursor(aiomysql.DictCursor)
+        try:
+            await cursor.execute("SELECT nome, profile_pic_url FROM usuarios WHERE id = %s", (user_id,))
+            return await cursor.fetchone()
+        finally:
+            await cursor.close()
+
+
+async def _load_chat_conversation_list(user_id: int) -> Dict[str, Any]:
+    async with acquire_db_connection() as conn:
+        cursor = await conn.cursor(aiomysql.DictCursor)
+        try:
+            etag = await conversation_list_etag(cursor, user_id)
+            return {"etag": etag, "conversations": await select_conversation_list(cursor, user_id)}
+        finally:
+            await cursor.close()
+
+
+async def _load_chat_conversation(user_id: int, conversation_id: Optional[int]) -> Optional[Dict[str, Any]]:
+    """Mensagens da conversa ativa (a do cookie ou, sem ele, a mais recente); None se não estiver nas tabelas quentes."""
+    async with acquire_db_connection() as conn:
+        cursor = await conn.cursor(aiomysql.DictCursor)
+        try:
+            if conversation_id is None:
+                await cursor.execute(
+                    "SELECT id FROM conversas WHERE id_usuario = %s ORDER BY data_atualizacao DESC LIMIT 1",
+                    (user_id,)
+                )
+                latest = await cursor.fetchone()
+                if not latest:
+                    return None
+                conversation_id = latest['id']
+
+            await cursor.execute(CONVERSATION_VERSION_SQL, (conversation_id, user_id))
+            conversation = await cursor.fetchone()
+            if not conversation:
+                return None
+            return {
+                "id": conversation_id,
+                "etag": conversation_etag(conversation),
+                "messages": await select_conversation_messages(cursor, conversation_id),
+            }
+        finally:
+            await cursor.close()
+
+
+def _initial_state_json(state: Dict[str, Any]) -> str:
+    """JSON seguro para um <script type="application/json"> (sem '</script>' nem '<!--' no conteúdo)."""
+    return dumps(state).decode("utf-8").replace("<", "\\u003c").replace(">", "\\u003e").replace("&", "\\u0026")
 
 
 @router.get("/chat", response_class=HTMLResponse)
 async def get_chat_page(
     request: Request, 
-    user_id: int = Depends(get_current_user),
-    conn: aiomysql.Connection = Depends(get_db_connection)
+    user_id: int = Depends(get_current_user)
 ):
+    """
+    Renderiza o chat já com o perfil, a lista de conversas e as mensagens da conversa ativa,
+    buscados em paralelo (uma conexão cada) e embutidos como JSON; o script.js os usa no lugar
+    das requisições iniciais a /conversations e /conversation/{id}.
+    """
     user_first_name = "Usuário"
     profile_pic_url = "/static/images/default_profile.png"
+    initial_state = None
     
     if user_id:
-        cursor = await conn.cursor(aiomysql.DictCursor)
-        try:
-            await cursor.execute("SELECT nome, profile_pic_url FROM usuarios WHERE id = %s", (user_id,))
-            user_record = await cursor.fetchone()
-                
-            if user_record:
-                if user_record['nome']:
-                    user_full_name = user_record['nome']
-                    user_first_name = user_full_name.split(' ')[0]
-                if user_record['profile_pic_url']:
-                    profile_pic_url = user_record['profile_pic_url']
-        finally:
-            await cursor.close()
+        active_conversation_id = active_conversation_from_cookie(request)
+        prewarm_conversation_state(user_id, active_conversation_id)
+
+        results = await asyncio.gather(
+            _load_chat_profile(user_id),
+            _load_chat_conversation_list(user_id),
+            _load_chat_conversation(user_id, active_conversation_id),
+            return_exceptions=True
+        )
+        user_record, conversation_list, active_conversation = results
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Erro ao carregar dados iniciais do chat para o usuário {user_id}: {result}", exc_info=result)
+
+        if isinstance(user_record, dict):
+            if user_record['nome']:
+                user_full_name = user_record['nome']
+                user_first_name = user_full_name.split(' ')[0]
+            if user_record['profile_pic_url']:
+                profile_pic_url = user_record['profile_pic_url']
+
+        initial_state = {
+            "conversations": conversation_list if isinstance(conversation_list, dict) else None,
+            "conversation": active_conversation if isinstance(active_conversation, dict) else None,
+        }
             
     return templates.TemplateResponse("chat.html", {
         "request": request, 
         "user_id": user_id, 
         "user_name": user_first_name,
-        "profile_pic_url": profile_pic_url
+        "profile_pic_url": profile_pic_url,
+        "initial_state_json": _initial_state_json(initial_state) if initial_state else "null"
     })
 
 
-@router.get("/conversation/{conversation_id}", response_class=JSONResponse)
+@router.get("/conversation/{conversation_id}", response_class=FastJSONResponse)
 async def get_conversation_messages(
     conversation_id: int,
+    request: Request,
+    since_id: Optional[int] = None,
     user_id: int = Depends(get_current_user),
     conn: aiomysql.Connection = Depends(get_db_connection)
 ):
-    """Retorna as mensagens de uma conversa específica e atualiza a cadeia de memória."""
+    """
+    Retorna as mensagens de uma conversa específica.
+    Com `since_id`, retorna apenas as mensagens com ID maior (sincronização incremental);
+    responde 304 quando o If-None-Match corresponde à versão atual da conversa.
+    Conversas arquivadas respondem 404 até serem restauradas por POST /conversation/{id}/activate.
+    """
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Acesso não autorizado.")
 
     cursor = await conn.cursor(aiomysql.DictCursor) 
-    history_messages = []
     
     try:
-        await cursor.execute(
-            "SELECT id FROM conversas WHERE id = %s AND id_usuario = %s",
-            (conversation_id, user_id)
-        )
-        if not await cursor.fetchone():
+        await cursor.execute(CONVERSATION_VERSION_SQL, (conversation_id, user_id))
+        conversation = await cursor.fetchone()
+        if not conversation:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversa não encontrada ou não pertence ao usuário.")
 
-        await cursor.execute(
-            "SELECT remetente, conteudo, data_envio FROM mensagens WHERE id_conversa = %s ORDER BY data_envio ASC",
-            (conversation_id,)
-        )
-        messages = await cursor.fetchall()
-        
-
-        for msg_data in messages:
-            if msg_data['remetente'] == 'usuario':
-                history_messages.append(HumanMessage(content=msg_data['conteudo']))
-            
-            else: 
-                history_messages.append(AIMessage(content=msg_data['conteudo']))
-                
+        etag = conversation_etag(conversation)
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
 
-        for msg in messages:
-            if isinstance(msg.get('data_envio'), datetime.datetime):
-                msg['data_envio'] = msg['data_envio'].isoformat()
-             
-            if msg['remetente'] == 'usuario':
-                msg['remetente'] = 'usuario' 
-            else:
-                msg['remetente'] = 'bot'
+        messages = await select_conversation_messages(cursor, conversation_id, since_id)
 
-        return JSONResponse(content=messages, status_code=status.HTTP_200_OK)
+        return FastJSONResponse(content=messages, status_code=status.HTTP_200_OK, headers={"ETag": etag})
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -200,115 +599,217 @@ async def get_conversation_messages(
 
 
 
-@router.post("/chat/message", response_class=JSONResponse)
+@router.post("/conversation/{conversation_id}/activate", response_class=FastJSONResponse)
+async def activate_conversation(
+    conversation_id: int,
+    user_id: int = Depends(get_current_user)
+):
+    """
+    Torna a conversa a ativa do usuário: as próximas mensagens (HTTP ou WebSocket) continuam nela.
+    Conversas recentes já estão em memória e são reativadas sem recarregar o histórico (só a versão
+    é conferida); as demais têm o histórico carregado (e são restauradas do arquivo, se arquivadas).
+    """
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Acesso não autorizado.")
+
+    state = await activate_conversation_state(user_id, conversation_id)
+    if state is None:
+        async with acquire_db_connection() as conn:
+            if await restore_archived_conversation(conn, user_id, conversation_id):
+                state = await activate_conversation_state(user_id, conversation_id, conn)
+    if state is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversa não encontrada ou não pertence ao usuário.")
+
+    response = FastJSONResponse(content={"conversation_id": conversation_id}, status_code=status.HTTP_200_OK)
+    response.set_cookie(ACTIVE_CONVERSATION_COOKIE, str(conversation_id), max_age=31536000, samesite="lax")
+    return response
+
+
+@router.post("/chat/message", response_class=FastJSONResponse)
 async def chat_message_endpoint(
     message_data: Message,
-    request: Request,
-    user_conversation_state: Dict[str, Any] = Depends(get_conversation_state_dep),
-    conn: aiomysql.Connection = Depends(get_db_connection)
+    request: Request
 ):
+    """
+    Executa um turno do chat. O DB é usado em fases curtas (verificação e criação da conversa
+    antes do LLM, persistência depois): nenhuma conexão do pool fica presa durante a chamada ao modelo.
+    """
     user_id = request.session.get("user_id")
-    user_conversation = user_conversation_state.get("chain")
-    current_conversation_id = user_conversation_state.get("current_conversation_id")
     user_message = message_data.message
 
+    subject = usage_subject(user_id, get_conversation_key(request, user_id))
+    if not await has_quota(subject):
+        return FastJSONResponse(content={"response": QUOTA_EXCEEDED_MESSAGE}, status_code=status.HTTP_429_TOO_MANY_REQUESTS)
+
+    user_conversation_state = await resolve_conversation_state(
+        request, user_id, message_data, fallback_conversation_id=active_conversation_from_cookie(request)
+    )
+    if user_conversation_state is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversa não encontrada ou não pertence ao usuário.")
+    user_conversation = user_conversation_state.get("chain")
  
     is_verified = False
+    current_conversation_id = None
+    is_new_conversation = False
     if user_id is not None:
-        cursor_check = await conn.cursor()
-        try:
-            await cursor_check.execute("SELECT email_verified FROM usuarios WHERE id = %s", (user_id,))
-            user_data = await cursor_check.fetchone()
-            if user_data:
-                is_verified = bool(user_data['email_verified'])
-        finally:
-            await cursor_check.close()
-            
+        async with acquire_db_connection() as conn:
+            is_verified = await fetch_email_verified(conn, user_id)
+            if is_verified:
+                current_conversation_id, is_new_conversation = await ensure_conversation(conn, user_id, user_conversation_state)
 
     is_persistence_allowed = user_id is not None and is_verified
 
-    is_new_conversation = False
-    
-    if is_persistence_allowed and current_conversation_id is None:
-        cursor_new = await conn.cursor()
-        try:
+    user_conversation.prompt = templates_by_lang["pt"]
+    with usage_scope(subject):
+        cache_key = response_cache_key(user_conversation, user_message)
+        ai_text = response_cache.get(cache_key) if cache_key else None
+        if ai_text is not None:
+            # Resposta do cache: só registra o turno na memória, sem chamar o LLM.
+            user_conversation.memory.save_context({"input": user_message}, {"response": ai_text})
+        else:
+            try:
+                ai_response = await user_conversation.ainvoke({"input": user_message})
+            except LLMUnavailableError as e:
+                logger.warning(f"LLM indisponível para a mensagem de {user_id or 'anônimo'}: {e}")
+                return FastJSONResponse(content={"response": LLM_UNAVAILABLE_MESSAGE}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+            ai_text = ai_response["response"]
+            if cache_key:
+                response_cache.put(cache_key, ai_text)
+
+        if is_new_conversation and current_conversation_id is not None:
+
+            asyncio.create_task(update_conversation_title(current_conversation_id, user_message))
 
-            await cursor_new.execute(
-                "INSERT INTO conversas (id_usuario, titulo_conversa, data_criacao, data_atualizacao) VALUES (%s, %s, %s, %s)",
-                (user_id, 'Nova Conversa...', datetime.datetime.now(), datetime.datetime.now())
-            )
-            
-            new_id = cursor_new.lastrowid
+
+    if is_persistence_allowed and current_conversation_id is not None:
+        async with acquire_db_connection() as conn:
+            await persist_chat_turn(conn, user_id, current_conversation_id, user_message, ai_text)
+        record_persisted_turn(user_conversation_state)
             
-            await conn.commit() 
-
-            if new_id:
-                current_conversation_id = new_id
-                
-                logger.info(f"Nova conversa {current_conversation_id} criada para o usuário {user_id} usando lastrowid.")
-                
-                # ATUALIZA o estado da conversa para uso imediato e persistência
-                user_conversation_state["current_conversation_id"] = current_conversation_id
-                
-                is_new_conversation = True
-            else:
-                 # Rollback e log de erro se o ID não foi recuperado
-                 await conn.rollback()
-                 logger.error("Falha ao obter o ID (lastrowid) após a criação da conversa. Rollback executado.")
-                 current_conversation_id = None
-                 
-        except Exception as new_conv_err:
-            logger.error(f"Erro ao criar nova conversa no DB: {new_conv_err}", exc_info=True)
-            await conn.rollback()
-            current_conversation_id = None 
-        finally:
-             await cursor_new.close()
+    elif user_id is not None and not is_verified:
+        return FastJSONResponse(
+            content={"response": UNVERIFIED_ACCOUNT_MESSAGE}, 
+            status_code=status.HTTP_403_FORBIDDEN 
+        )
 
-    user_conversation.prompt = templates_by_lang["pt"]
-    ai_response = await user_conversation.ainvoke({"input": user_message})
-    ai_text = ai_response["response"]
 
-    if is_new_conversation and is_persistence_allowed and current_conversation_id is not None:
+    return FastJSONResponse(content={"response": ai_text, "language": "pt", "conversation_id": current_conversation_id})
 
-        asyncio.create_task(update_conversation_title(current_conversation_id, user_message, conn))
 
+@router.websocket("/chat/ws")
+async def chat_websocket_endpoint(websocket: WebSocket):
+    """
+    Canal de chat por WebSocket: autentica uma vez na conexão, mantém o estado da conversa
+    fixado durante toda a conexão e transmite a resposta token a token.
+
+    Protocolo (JSON): o cliente envia {"message": "...", "language": "pt", "conversation_id": ..., "new_conversation": false}
+    (conversation_id opcional: a conversa ativa no navegador; new_conversation: true depois de "Novo Chat");
+    o servidor responde {"type": "start"},
+    vários {"type": "token", "content": "..."} e {"type": "end", "response": "...", "conversation_id": ...},
+    ou {"type": "error", "status": ..., "detail": "..."}.
+    """
+    await websocket.accept()
 
-    if is_persistence_allowed and current_conversation_id is not None:
-        cursor_persist = await conn.cursor()
-        try:
-            await cursor_persist.execute(
-                "INSERT INTO mensagens (id_conversa, remetente, conteudo, data_envio) VALUES (%s, %s, %s, %s)",
-                (current_conversation_id, 'usuario', user_message, datetime.datetime.now())
-            )
+    user_id = websocket.session.get("user_id")
+    had_session_id = bool(websocket.session.get("session_id"))
+    key = get_conversation_key(websocket, user_id)
 
-            await cursor_persist.execute(
-                "INSERT INTO mensagens (id_conversa, remetente, conteudo, data_envio) VALUES (%s, %s, %s, %s)",
-                (current_conversation_id, 'ia', ai_text, datetime.datetime.now()) 
+    try:
+        async with acquire_db_connection() as conn:
+            is_verified = await fetch_email_verified(conn, user_id) if user_id is not None else False
+            user_conversation_state = await load_user_conversation_instance(
+                websocket, user_id, conn, conversation_id=active_conversation_from_cookie(websocket)
             )
+    except Exception as e:
+        logger.error(f"Erro ao iniciar o chat por WebSocket para {key}: {e}", exc_info=True)
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+        return
 
-            await cursor_persist.execute(
-                "UPDATE conversas SET data_atualizacao = %s WHERE id = %s",
-                (datetime.datetime.now(), current_conversation_id)
+    is_persistence_allowed = user_id is not None and is_verified
+
+    try:
+        while True:
+            payload = await websocket.receive_text()
+            try:
+                # JSON malformado também é ValidationError: responde 422 sem derrubar a conexão.
+                message_data = Message.model_validate_json(payload)
+            except ValidationError:
+                await websocket.send_json({"type": "error", "status": status.HTTP_422_UNPROCESSABLE_ENTITY, "detail": "Mensagem inválida."})
+                continue
+
+            if user_id is not None and not is_verified:
+                await websocket.send_json({"type": "error", "status": status.HTTP_403_FORBIDDEN, "detail": UNVERIFIED_ACCOUNT_MESSAGE})
+                continue
+
+            if not await has_quota(usage_subject(user_id, key)):
+                await websocket.send_json({"type": "error", "status": status.HTTP_429_TOO_MANY_REQUESTS, "detail": QUOTA_EXCEEDED_MESSAGE})
+                continue
+
+            # A mensagem diz em que conversa continua (ou que começa uma nova); sem isso, segue a da conexão.
+            state = await resolve_conversation_state(
+                websocket, user_id, message_data, fallback_conversation_id=user_conversation_state.get("current_conversation_id")
             )
-            
-            await conn.commit()
-            logger.info(f"Mensagem do usuário e resposta da IA salvas na conversa {current_conversation_id}")
-        except Exception as save_err:
-            logger.error(f"Erro ao salvar mensagens no DB: {save_err}", exc_info=True)
-        finally:
-            await cursor_persist.close()
-            
-    elif user_id is not None and not is_verified:
-        return JSONResponse(
-            content={"response": "Sua conta ainda não foi verificada. Por favor, verifique seu email para que eu possa salvar nosso histórico. Você pode reeunviar o link através da tela de Login."}, 
-            status_code=status.HTTP_403_FORBIDDEN 
-        )
+            if state is None:
+                await websocket.send_json({"type": "error", "status": status.HTTP_404_NOT_FOUND, "detail": "Conversa não encontrada ou não pertence ao usuário."})
+                continue
+            user_conversation_state = state
+
+            await websocket.send_json({"type": "start"})
+            try:
+                with usage_scope(usage_subject(user_id, key)):
+                    await _run_websocket_turn(websocket, user_id, user_conversation_state, message_data.message, is_persistence_allowed)
+            except WebSocketDisconnect:
+                raise
+            except LLMUnavailableError as e:
+                logger.warning(f"LLM indisponível no chat por WebSocket para {key}: {e}")
+                await websocket.send_json({"type": "error", "status": status.HTTP_503_SERVICE_UNAVAILABLE, "detail": LLM_UNAVAILABLE_MESSAGE})
+            except Exception as e:
+                logger.error(f"Erro no turno de chat por WebSocket para {key}: {e}", exc_info=True)
+                await websocket.send_json({"type": "error", "status": status.HTTP_500_INTERNAL_SERVER_ERROR, "detail": "Erro ao processar a mensagem."})
+
+    except WebSocketDisconnect:
+        logger.info(f"WebSocket de chat desconectado para {key}.")
+    finally:
+        # Sessões anônimas sem cookie não conseguem reaproveitar o estado depois da conexão.
+        if user_id is None and not had_session_id:
+            user_conversations_instances.pop(key, None)
 
 
-    return JSONResponse(content={"response": ai_text, "language": "pt"})
+async def _run_websocket_turn(websocket: WebSocket, user_id: Optional[int], user_conversation_state: Dict[str, Any], user_message: str, is_persistence_allowed: bool):
+    """Executa um turno do chat por WebSocket, usando conexões curtas do pool antes e depois da chamada ao LLM."""
+    current_conversation_id = None
+    is_new_conversation = False
+    if is_persistence_allowed:
+        async with acquire_db_connection() as conn:
+            current_conversation_id, is_new_conversation = await ensure_conversation(conn, user_id, user_conversation_state)
+
+    async def send_token(token: str):
+        await websocket.send_json({"type": "token", "content": token})
+
+    user_conversation = user_conversation_state.get("chain")
+    user_conversation.prompt = templates_by_lang["pt"]
+    cache_key = response_cache_key(user_conversation, user_message)
+    ai_text = response_cache.get(cache_key) if cache_key else None
+    if ai_text is not None:
+        user_conversation.memory.save_context({"input": user_message}, {"response": ai_text})
+        await send_token(ai_text)
+    else:
+        ai_text = await stream_conversation_response(user_conversation, user_message, send_token)
+        if cache_key:
+            response_cache.put(cache_key, ai_text)
+
+    if is_new_conversation and current_conversation_id is not None:
+        asyncio.create_task(update_conversation_title(current_conversation_id, user_message))
+
+    if is_persistence_allowed and current_conversation_id is not None:
+        async with acquire_db_connection() as conn:
+            await persist_chat_turn(conn, user_id, current_conversation_id, user_message, ai_text)
+        record_persisted_turn(user_conversation_state)
+
+    await websocket.send_json({"type": "end", "response": ai_text, "language": "pt", "conversation_id": current_conversation_id})
 
 
-@router.post("/reset_chat", response_class=JSONResponse)
+@router.post("/reset_chat", response_class=FastJSONResponse)
 async def reset_chat_endpoint(
     request: Request,
     user_id: int = Depends(get_current_user),
@@ -316,13 +817,19 @@ async def reset_chat_endpoint(
 ):
     """
     Reseta a conversa atual do usuário na memória, mas NÃO cria uma nova entrada no DB.
-    A nova entrada será criada na primeira mensagem enviada (/chat/message).
+    A nova entrada será criada na primeira mensagem enviada (/chat/message). As conversas
+    anteriores continuam no LRU do usuário e podem ser reativadas sem recarga. O reset só vale
+    no worker que o atendeu: o cliente também marca a mensagem seguinte com `new_conversation`.
     """
-    key_to_delete = user_id if user_id is not None else request.session.get("session_id")
-    
-    if key_to_delete in user_conversations_instances:
-      
-        del user_conversations_instances[key_to_delete]
-        logger.info(f"Instância de conversa resetada da memória para {key_to_delete}")
-
-    return JSONResponse(content={"message": "Chat reiniciado com sucesso."}, status_code=status.HTTP_200_OK)
\ No newline at end of file
+    if user_id is not None:
+        # Usuário logado: instala um estado vazio, senão a próxima mensagem recarregaria a conversa mais recente.
+        await start_new_conversation_state(user_id)
+        logger.info(f"Instância de conversa resetada da memória para {user_id}")
+    else:
+        key_to_delete = request.session.get("session_id")
+        if key_to_delete in user_conversations_instances:
+          
+            del user_conversations_instances[key_to_delete]
+            logger.info(f"Instância de conversa resetada da memória para {key_to_delete}")
+
+    return FastJSONResponse(content={"message": "Chat reiniciado com sucesso."}, status_code=status.HTTP_200_OK)
\ No newline at end of file
@@ -0,0 +1,319 @@
+import re
+import math
+import asyncio
+import logging
+import datetime
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+import aiomysql
+
+from settings.config import Config
+
+logger = logging.getLogger(__name__)
+
+config = Config()
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+STOPWORDS = frozenset("""
+a ao aos as com como da das de do dos e ela ele em entre era essa esse esta este eu foi for
+isso isto ja lhe mais mas me meu minha na nas nao no nos o os ou para pela pelas pelo pelos
+por qual que se sem ser seu sua so sao tambem te tem um uma umas uns voce voces
+""".split())
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+SNIPPET_RADIUS = 80
+# Conversas relidas por consulta na sincronização do índice local.
+SYNC_BATCH_SIZE = 200
+
+_fulltext_available: Optional[bool] = None
+
+
+def normalize_token(token: str) -> str:
+    """Minúsculas e sem acentos, para que 'Ação' e 'acao' casem."""
+    decomposed = unicodedata.normalize("NFKD", token.casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in _TOKEN_RE.finditer(text or ""):
+        token = normalize_token(match.group())
+        if len(token) > 1 and token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+def make_snippet(content: str, terms: set) -> str:
+    """Trecho de ~160 caracteres em torno da primeira ocorrência de um dos termos buscados."""
+    position = 0
+    for match in _TOKEN_RE.finditer(content):
+        if normalize_token(match.group()) in terms:
+            position = match.start()
+            break
+
+    start = max(0, position - SNIPPET_RADIUS)
+    end = min(len(content), position + SNIPPET_RADIUS)
+    snippet = content[start:end].replace("\n", " ").strip()
+    if start > 0:
+        snippet = "…" + snippet
+    if end < len(content):
+        snippet = snippet + "…"
+    return snippet
+
+
+class UserSearchIndex:
+    """
+    Índice invertido (BM25) das mensagens de um único usuário, mantido incrementalmente.
+
+    A sincronização não depende da ordem dos IDs (que não é global no TiDB, e importações/restaurações
+    inserem linhas "no passado"): `synced_totals` guarda, por conversa, o `conversas.total_mensagens`
+    já refletido no índice, e só conversas cujo total mudou são relidas.
+    """
+
+    __slots__ = ("postings", "documents", "total_length", "synced_totals", "lock")
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.documents: Dict[int, Tuple[int, str, str, Any, int]] = {}
+        self.total_length = 0
+        self.synced_totals: Dict[int, int] = {}
+        self.lock = asyncio.Lock()
+
+    def add(self, message_id: int, conversation_id: int, remetente: str, conteudo: str, data_envio: Any) -> bool:
+        if message_id in self.documents:
+            return False
+        tokens = tokenize(conteudo)
+        self.documents[message_id] = (conversation_id, remetente, conteudo, data_envio, len(tokens))
+        self.total_length += len(tokens)
+        for token in tokens:
+            postings = self.postings.setdefault(token, {})
+            postings[message_id] = postings.get(message_id, 0) + 1
+        return True
+
+    def remove_conversations(self, conversation_ids: set):
+        """Remove do índice as mensagens de conversas que não existem mais no DB."""
+        for conversation_id in conversation_ids:
+            self.synced_totals.pop(conversation_id, None)
+        stale = [mid for mid, doc in self.documents.items() if doc[0] in conversation_ids]
+        for message_id in stale:
+            conteudo, length = self.documents[message_id][2], self.documents[message_id][4]
+            for token in set(tokenize(conteudo)):
+                postings = self.postings.get(token)
+                if postings is not None:
+                    postings.pop(message_id, None)
+                    if not postings:
+                        del self.postings[token]
+            self.total_length -= length
+            del self.documents[message_id]
+
+    def search(self, query_terms: List[str]) -> List[Tuple[float, int]]:
+        """Retorna [(score, message_id)] ordenado por relevância BM25."""
+        total_docs = len(self.documents)
+        if not total_docs:
+            return []
+        avg_length = self.total_length / total_docs or 1.0
+
+        scores: Dict[int, float] = {}
+        for term in set(query_terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for message_id, tf in postings.items():
+                length = self.documents[message_id][4]
+                norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+                scores[message_id] = scores.get(message_id, 0.0) + idf * norm
+
+        return sorted(((score, mid) for mid, score in scores.items()), key=lambda item: (-item[0], -item[1]))
+
+
+# Índices locais por usuário, com despejo LRU para limitar a memória do worker.
+_user_indexes: "OrderedDict[int, UserSearchIndex]" = OrderedDict()
+
+
+def _get_user_index(user_id: int) -> UserSearchIndex:
+    index = _user_indexes.get(user_id)
+    if index is None:
+        index = UserSearchIndex()
+        _user_indexes[user_id] = index
+        while len(_user_indexes) > config.SEARCH_INDEX_MAX_USERS:
+            _user_indexes.popitem(last=False)
+    else:
+        _user_indexes.move_to_end(user_id)
+    return index
+
+
+def index_persisted_messages(user_id: int, conversation_id: int, messages: List[Tuple[int, str, str, Any]]):
+    """
+    Atualiza o índice local do usuário com mensagens recém-persistidas [(id, remetente, conteudo, data_envio)].
+    Só atua se o índice do usuário já estiver carregado; senão ele é montado na próxima busca.
+    """
+    index = _user_indexes.get(user_id)
+    if index is None:
+        return
+    for message_id, remetente, conteudo, data_envio in messages:
+        if message_id and index.add(message_id, conversation_id, remetente, conteudo, data_envio):
+            # O turno também somou no total_mensagens da conversa: só diverge se outro worker escreveu nela.
+            if index.synced_totals.get(conversation_id) is not None:
+                index.synced_totals[conversation_id] += 1
+
+
+def invalidate_user_index(user_id: int):
+    """Descarta o índice local do usuário (ex.: após importar ou restaurar conversas); ele é remontado na próxima busca."""
+    _user_indexes.pop(user_id, None)
+
+
+async def _sync_user_index(conn: aiomysql.Connection, user_id: int) -> UserSearchIndex:
+    """
+    Relê as conversas do usuário cujo total de mensagens no DB difere do já indexado (escritas de outros
+    workers, importações, restaurações) e descarta as que não existem mais.
+    """
+    index = _get_user_index(user_id)
+    async with index.lock:
+        cursor = await conn.cursor(aiomysql.DictCursor)
+        try:
+            await cursor.execute("SELECT id, total_mensagens FROM conversas WHERE id_usuario = %s", (user_id,))
+            totals = {row['id']: row['total_mensagens'] for row in await cursor.fetchall()}
+
+            removed = index.synced_totals.keys() - totals.keys()
+            if removed:
+                index.remove_conversations(set(removed))
+
+            # Total NULL (ainda não preenchido pelo backfill) não diz nada: a conversa é relida.
+            stale = [
+                conversation_id for conversation_id, total in totals.items()
+                if total is None or index.synced_totals.get(conversation_id) != total
+            ]
+            for start in range(0, len(stale), SYNC_BATCH_SIZE):
+                batch = stale[start:start + SYNC_BATCH_SIZE]
+                placeholders = ", ".join(["%s"] * len(batch))
+                await cursor.execute(
+                    f"SELECT id, id_conversa, remetente, conteudo, data_envio FROM mensagens WHERE id_conversa IN ({placeholders})",
+                    batch
+                )
+                for row in await cursor.fetchall():
+                    index.add(row['id'], row['id_conversa'], row['remetente'], row['conteudo'], row['data_envio'])
+                for conversation_id in batch:
+                    index.synced_totals[conversation_id] = totals[conversation_id]
+        finally:
+            await cursor.close()
+    return index
+
+
+async def detect_fulltext_support(conn: aiomysql.Connection) -> bool:
+    """Verifica (uma vez por worker) se `mensagens.conteudo` possui um índice FULLTEXT utilizável."""
+    global _fulltext_available
+    if config.SEARCH_BACKEND == "local":
+        return False
+    if _fulltext_available is not None:
+        return _fulltext_available
+
+    cursor = await conn.cursor(aiomysql.DictCursor)
+    try:
+        await cursor.execute(
+            """
+            SELECT COUNT(*) AS total FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'mensagens'
+              AND COLUMN_NAME = 'conteudo' AND INDEX_TYPE = 'FULLTEXT'
+            """
+        )
+        row = await cursor.fetchone()
+        _fulltext_available = bool(row and row['total'])
+    except Exception as e:
+        logger.warning(f"Não foi possível detectar índice FULLTEXT, usando índice local: {e}")
+        _fulltext_available = False
+    finally:
+        await cursor.close()
+
+    logger.info(f"Busca de mensagens usando {'FULLTEXT do banco' if _fulltext_available else 'índice invertido local'}.")
+    return _fulltext_available
+
+
+def _format_result(row: Dict[str, Any], terms: set, score: float) -> Dict[str, Any]:
+    data_envio = row['data_envio']
+    return {
+        "conversation_id": row['id_conversa'],
+        "titulo_conversa": row.get('titulo_conversa'),
+        "message_id": row['id'],
+        "remetente": 'usuario' if row['remetente'] == 'usuario' else 'bot',
+        "snippet": make_snippet(row['conteudo'], terms),
+        "data_envio": data_envio.isoformat() if isinstance(data_envio, datetime.datetime) else data_envio,
+        "score": round(float(score), 4),
+    }
+
+
+async def _search_fulltext(conn: aiomysql.Connection, user_id: int, query: str, terms: set, limit: int, offset: int) -> List[Dict[str, Any]]:
+    cursor = await conn.cursor(aiomysql.DictCursor)
+    try:
+        await cursor.execute(
+            """
+            SELECT m.id, m.id_conversa, m.remetente, m.conteudo, m.data_envio, c.titulo_conversa,
+                   MATCH(m.conteudo) AGAINST (%s IN NATURAL LANGUAGE MODE) AS score
+            FROM mensagens m
+            JOIN conversas c ON c.id = m.id_conversa
+            WHERE c.id_usuario = %s AND MATCH(m.conteudo) AGAINST (%s IN NATURAL LANGUAGE MODE)
+            ORDER BY score DESC, m.id DESC
+            LIMIT %s OFFSET %s
+            """,
+            (query, user_id, query, limit, offset)
+        )
+        rows = await cursor.fetchall()
+    finally:
+        await cursor.close()
+    return [_format_result(row, terms, row['score']) for row in rows]
+
+
+async def _search_local(conn: aiomysql.Connection, user_id: int, terms: List[str], limit: int, offset: int) -> List[Dict[str, Any]]:
+    index = await _sync_user_index(conn, user_id)
+    ranked = index.search(terms)
+    if not ranked:
+        return []
+
+    # Títulos atuais e filtro de conversas removidas (limpeza/arquivamento) desde a indexação.
+    candidate_conversations = {index.documents[mid][0] for _, mid in ranked}
+    placeholders = ", ".join(["%s"] * len(candidate_conversations))
+    cursor = await conn.cursor(aiomysql.DictCursor)
+    try:
+        await cursor.execute(
+            f"SELECT id, titulo_conversa FROM conversas WHERE id_usuario = %s AND id IN ({placeholders})",
+            (user_id, *candidate_conversations)
+        )
+        titles = {row['id']: row['titulo_conversa'] for row in await cursor.fetchall()}
+    finally:
+        await cursor.close()
+
+    removed = candidate_conversations - titles.keys()
+    if removed:
+        index.remove_conversations(removed)
+
+    term_set = set(terms)
+    results = []
+    for score, message_id in ranked:
+        document = index.documents.get(message_id)
+        if document is None or document[0] not in titles:
+            continue
+        conversation_id, remetente, conteudo, data_envio, _ = document
+        results.append((score, {
+            "id": message_id, "id_conversa": conversation_id, "remetente": remetente,
+            "conteudo": conteudo, "data_envio": data_envio, "titulo_conversa": titles[conversation_id],
+        }))
+    return [_format_result(row, term_set, score) for score, row in results[offset:offset + limit]]
+
+
+async def search_user_messages(conn: aiomysql.Connection, user_id: int, query: str, limit: int, offset: int) -> List[Dict[str, Any]]:
+    """Busca ranqueada nas mensagens do usuário, via FULLTEXT quando disponível ou índice local."""
+    terms = tokenize(query)
+    if not terms:
+        return []
+
+    if await detect_fulltext_support(conn):
+        try:
+            return await _search_fulltext(conn, user_id, query, set(terms), limit, offset)
+        except Exception as e:
+            logger.error(f"Falha na busca FULLTEXT, usando índice local: {e}", exc_info=True)
+
+    return await _search_local(conn, user_id, terms, limit, offset)
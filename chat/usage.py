@@ -0,0 +1,210 @@
+"""
+Contabilidade de tokens por usuário (ou sessão anônima) e por dia, com cota diária.
+
+O consumo é lido do `usage_metadata` de cada resposta do modelo (chat.guarded_model) e somado
+em memória; a tarefa `usage_flush` do agendador (main.py) grava os deltas na tabela `uso_tokens` em lote
+(INSERT ... ON DUPLICATE KEY UPDATE). A verificação de cota usa apenas os contadores em memória:
+o DB só é lido uma vez por sujeito e dia em cada worker, para somar o que já foi gravado.
+"""
+import asyncio
+import logging
+import datetime
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiomysql
+
+from settings.config import Config
+from db.dependencies import acquire_db_connection
+from utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+config = Config()
+
+QUOTA_EXCEEDED_MESSAGE = "Você atingiu o limite diário de uso do Fala Aí. Ele será renovado amanhã."
+SYSTEM_SUBJECT = "sistema"
+
+llm_tokens = Counter("falaai_llm_tokens_total", "Tokens consumidos no LLM por finalidade (chat, title, summary) e tipo.", ["purpose", "kind"])
+usage_quota_rejections = Counter("falaai_usage_quota_rejections_total", "Mensagens recusadas por cota diária de tokens.", ["subject_type"])
+
+# Índices das listas de contadores: [tokens do prompt, tokens da resposta, tokens de resumo, chamadas].
+_PROMPT, _COMPLETION, _SUMMARY, _CALLS = range(4)
+
+UsageKey = Tuple[str, datetime.date]
+
+_totals: Dict[UsageKey, List[int]] = {}
+_pending: Dict[UsageKey, List[int]] = {}
+_loaded: set = set()
+# Cargas do DB em andamento por chave, para que leituras simultâneas da mesma chave não se repitam.
+_loads: Dict[UsageKey, "asyncio.Task"] = {}
+# Serializa as cargas com o flush: um lote já tirado de _pending e ainda não gravado não aparece
+# nem no DB nem em _pending, e se perderia nos totais de uma carga feita nesse intervalo.
+_flush_lock = asyncio.Lock()
+
+
+class UsageScope:
+    """Sujeito do turno atual; a primeira chamada ao modelo de chat é a resposta, as seguintes são resumo da memória."""
+
+    __slots__ = ("subject", "chat_calls")
+
+    def __init__(self, subject: str):
+        self.subject = subject
+        self.chat_calls = 0
+
+
+_current_scope: ContextVar[Optional[UsageScope]] = ContextVar("usage_scope", default=None)
+
+
+def usage_subject(user_id: Optional[int], conversation_key: Any) -> str:
+    """'u:<id>' para usuários logados, 's:<session_id>' para sessões anônimas."""
+    return f"u:{user_id}" if user_id is not None else f"s:{conversation_key}"
+
+
+@contextmanager
+def usage_scope(subject: str):
+    """Atribui ao sujeito as chamadas ao LLM feitas neste contexto (inclusive tarefas criadas nele)."""
+    token = _current_scope.set(UsageScope(subject))
+    try:
+        yield
+    finally:
+        _current_scope.reset(token)
+
+
+def record_llm_usage(model_name: str, usage: Optional[Dict[str, Any]]):
+    """Soma o `usage_metadata` de uma resposta do modelo aos contadores do sujeito atual."""
+    if not usage:
+        return
+    input_tokens = int(usage.get("input_tokens") or 0)
+    output_tokens = int(usage.get("output_tokens") or 0)
+
+    scope = _current_scope.get()
+    subject = scope.subject if scope else SYSTEM_SUBJECT
+    if model_name == "title":
+        purpose = "title"
+    elif scope is not None and scope.chat_calls == 0:
+        purpose = "chat"
+    else:
+        purpose = "summary"
+    if scope is not None and model_name != "title":
+        scope.chat_calls += 1
+
+    key = (subject, datetime.date.today())
+    for counters in (_totals.setdefault(key, [0, 0, 0, 0]), _pending.setdefault(key, [0, 0, 0, 0])):
+        if purpose == "summary":
+            counters[_SUMMARY] += input_tokens + output_tokens
+        else:
+            counters[_PROMPT] += input_tokens
+            counters[_COMPLETION] += output_tokens
+        counters[_CALLS] += 1
+
+    llm_tokens.inc(input_tokens, purpose=purpose, kind="input")
+    llm_tokens.inc(output_tokens, purpose=purpose, kind="output")
+
+
+def _daily_limit(subject: str) -> int:
+    return config.USAGE_DAILY_TOKENS_USER if subject.startswith("u:") else config.USAGE_DAILY_TOKENS_ANONYMOUS
+
+
+async def _load_persisted_usage(key: UsageKey):
+    """Uma vez por sujeito e dia: soma aos contadores locais o que já foi gravado (inclusive por outros workers)."""
+    async with _flush_lock:
+        if key in _loaded:
+            return
+        async with acquire_db_connection() as conn:
+            cursor = await conn.cursor(aiomysql.DictCursor)
+            try:
+                await cursor.execute(
+                    "SELECT tokens_prompt, tokens_resposta, tokens_resumo, chamadas FROM uso_tokens WHERE sujeito = %s AND dia = %s",
+                    key
+                )
+                row = await cursor.fetchone()
+            finally:
+                await cursor.close()
+
+        pending = _pending.get(key, [0, 0, 0, 0])
+        persisted = [row['tokens_prompt'], row['tokens_resposta'], row['tokens_resumo'], row['chamadas']] if row else [0, 0, 0, 0]
+        _totals[key] = [stored + local for stored, local in zip(persisted, pending)]
+        _loaded.add(key)
+
+
+def _start_usage_load(key: UsageKey) -> "asyncio.Task":
+    """Dispara (ou reaproveita) a carga do uso gravado da chave."""
+    task = _loads.get(key)
+    if task is None:
+        task = asyncio.create_task(_load_persisted_usage(key))
+        _loads[key] = task
+        task.add_done_callback(lambda _: _loads.pop(key, None))
+    return task
+
+
+async def has_quota(subject: str) -> bool:
+    """True se o sujeito ainda não passou da cota diária de tokens (0 = ilimitado)."""
+    limit = _daily_limit(subject)
+    if limit <= 0:
+        return True
+
+    key = (subject, datetime.date.today())
+    if key not in _loaded:
+        try:
+            await asyncio.shield(_start_usage_load(key))
+        except Exception as e:
+            logger.error(f"Erro ao carregar o uso de tokens de {subject}: {e}", exc_info=True)
+
+    counters = _totals.get(key)
+    used = counters[_PROMPT] + counters[_COMPLETION] + counters[_SUMMARY] if counters else 0
+    if used >= limit:
+        usage_quota_rejections.inc(subject_type="user" if subject.startswith("u:") else "anonymous")
+        return False
+    return True
+
+
+async def flush_usage():
+    """Grava os deltas pendentes em `uso_tokens` com um único INSERT de múltiplas linhas."""
+    async with _flush_lock:
+        await _flush_pending()
+
+
+async def _flush_pending():
+    global _pending
+    if not _pending:
+        return
+
+    batch, _pending = _pending, {}
+    rows = [(subject, day, *counters) for (subject, day), counters in batch.items()]
+    try:
+        async with acquire_db_connection() as conn:
+            cursor = await conn.cursor()
+            try:
+                await cursor.executemany(
+                    """
+                    INSERT INTO uso_tokens (sujeito, dia, tokens_prompt, tokens_resposta, tokens_resumo, chamadas)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        tokens_prompt = tokens_prompt + VALUES(tokens_prompt),
+                        tokens_resposta = tokens_resposta + VALUES(tokens_resposta),
+                        tokens_resumo = tokens_resumo + VALUES(tokens_resumo),
+                        chamadas = chamadas + VALUES(chamadas)
+                    """,
+                    rows
+                )
+                await conn.commit()
+            finally:
+                await cursor.close()
+    except Exception:
+        # Devolve os deltas para a próxima rodada.
+        for key, counters in batch.items():
+            pending = _pending.setdefault(key, [0, 0, 0, 0])
+            for position, value in enumerate(counters):
+                pending[position] += value
+        raise
+
+    # Contadores de dias anteriores não são mais consultados pela cota.
+    today = datetime.date.today()
+    for key in [key for key in _totals if key[1] < today and key not in _pending]:
+        del _totals[key]
+        _loaded.discard(key)
+
+    logger.info(f"Uso de tokens gravado para {len(rows)} sujeito(s)/dia.")
+
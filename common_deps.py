@@ -1,7 +1,9 @@
-from fastapi import Request
+from fastapi import Request, HTTPException, status
 from fastapi.templating import Jinja2Templates
 from typing import Optional
 
+from settings.config import Config
+
 templates = Jinja2Templates(directory="templates")
 
 async def get_current_user(request: Request) -> Optional[int]:
@@ -10,4 +12,20 @@ async def get_current_user(request: Request) -> Optional[int]:
 
 def get_current_user_sync(request: Request) -> Optional[int]:
     """Versão síncrona para acesso rápido fora do Depends."""
-    return request.session.get("user_id")
\ No newline at end of file
+    return request.session.get("user_id")
+
+async def require_admin(request: Request) -> None:
+    """Permite apenas administradores: token ADMIN_TOKEN (Authorization: Bearer) ou usuário logado em ADMIN_USER_IDS."""
+    config = Config()
+    if config.ADMIN_TOKEN and request.headers.get("authorization") == f"Bearer {config.ADMIN_TOKEN}":
+        return
+    if request.session.get("user_id") in config.ADMIN_USER_IDS:
+        return
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acesso restrito a administradores.")
+
+async def require_metrics_access(request: Request) -> None:
+    """Acesso a /metrics: token METRICS_TOKEN (Authorization: Bearer) ou, na falta dele, as regras de require_admin."""
+    config = Config()
+    if config.METRICS_TOKEN and request.headers.get("authorization") == f"Bearer {config.METRICS_TOKEN}":
+        return
+    await require_admin(request)
@@ -1,4 +1,6 @@
 import logging
+from contextlib import asynccontextmanager
+
 import aiomysql
 from fastapi import HTTPException
 from settings.config import Config
@@ -17,11 +19,13 @@ async def startup_db_pool(config: Config):
             password=config.DB_PASSWORD,
             db=config.DB_NAME,
             port=config.DB_PORT,
+            minsize=config.DB_POOL_MIN_SIZE,
+            maxsize=config.DB_POOL_MAX_SIZE,
             autocommit=True,
             cursorclass=aiomysql.DictCursor,
             ssl=True 
         )
-        logger.info("Pool de conexão do MySQL criado com sucesso!")
+        logger.info(f"Pool de conexão do MySQL criado com sucesso! (até {config.DB_POOL_MAX_SIZE} conexões neste worker)")
     except Exception as e:
         logger.error(f"Erro ao criar pool de conexão do MySQL: {e}", exc_info=True)
         raise RuntimeError("Não foi possível conectar ao banco de dados.") 
@@ -41,4 +45,17 @@ async def get_db_connection():
         raise HTTPException(status_code=500, detail="Serviço de banco de dados indisponível.")
     
     async with db_pool.acquire() as conn:
-        yield conn
\ No newline at end of file
+        yield conn
+
+
+@asynccontextmanager
+async def acquire_db_connection():
+    """
+    Obtém uma conexão do pool fora do ciclo de uma requisição (tarefas em segundo plano,
+    WebSockets). A conexão volta ao pool ao sair do bloco `async with`.
+    """
+    if db_pool is None:
+        raise RuntimeError("Pool de conexão do banco de dados não inicializado.")
+
+    async with db_pool.acquire() as conn:
+        yield conn
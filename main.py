@@ -1,11 +1,10 @@
 import os
 import logging
-import uvicorn
 import asyncio
 from typing import Awaitable, Callable
 import aiomysql
 from fastapi import FastAPI, HTTPException, Request, Depends 
-from fastapi.responses import HTMLResponse, JSONResponse 
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 from dotenv import load_dotenv
@@ -13,12 +12,27 @@ from contextlib import asynccontextmanager
 
 from settings.config import Config 
 
-from db.dependencies import startup_db_pool, shutdown_db_pool, get_db_connection 
+from db.dependencies import startup_db_pool, shutdown_db_pool, get_db_connection, acquire_db_connection
 
 
 from auth import routes as auth_routes
 from chat import routes as chat_routes
-from common_deps import templates
+from chat.llm_config import warm_up_llm_stack
+from chat.archive import archive_expired_conversations
+from chat.usage import flush_usage
+from chat.response_cache import response_cache
+from chat.conversation_stats import backfill_conversation_stats
+from common_deps import templates, require_admin, require_metrics_access
+from utils.metrics import render_metrics
+from utils.responses import FastJSONResponse
+from utils.compression import CompressionMiddleware
+from utils.loop_monitor import monitor_event_loop
+from utils.profiler import run_profile, start_tracemalloc
+from utils.primary_worker import release_primary
+from utils.scheduler import Scheduler, Every, Once, MACHINE, WORKER, parse_schedule
+from utils.rate_limit import limiter
+from utils.server_sessions import ServerSessionMiddleware, session_store
+from chat.llm_config import cached_conversation_state_count
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -26,22 +40,25 @@ load_dotenv()
 
 config = Config()
 
-cleanup_task = None
+llm_warmup_task = None
+loop_monitor_task = None
+profiler_lock = asyncio.Lock()
 
 
 async def cleanup_old_conversations(conn: aiomysql.Connection):
-    """Executa a limpeza de conversas mais antigas que 3 dias no MySQL."""
-    SQL_CLEANUP_MESSAGES = """
+    """Executa a limpeza (exclusão definitiva) de conversas mais antigas que o período de retenção no MySQL."""
+    retention_days = int(config.CONVERSATION_RETENTION_DAYS)
+    SQL_CLEANUP_MESSAGES = f"""
         DELETE FROM mensagens
         WHERE id_conversa IN (
             SELECT id FROM conversas
-            WHERE data_atualizacao < DATE_SUB(NOW(), INTERVAL 3 DAY)
+            WHERE data_atualizacao < DATE_SUB(NOW(), INTERVAL {retention_days} DAY)
         );
     """
     
-    SQL_CLEANUP_CONVERSATIONS = """
+    SQL_CLEANUP_CONVERSATIONS = f"""
         DELETE FROM conversas
-        WHERE data_atualizacao < DATE_SUB(NOW(), INTERVAL 3 DAY);
+        WHERE data_atualizacao < DATE_SUB(NOW(), INTERVAL {retention_days} DAY);
     """
 
     async with conn.cursor() as cur:
@@ -61,40 +78,58 @@ async def cleanup_old_conversations(conn: aiomysql.Connection):
             logger.error(f"Erro durante a limpeza de conversas antigas: {e}", exc_info=True)
 
 
-async def schedule_cleanup():
-    """Agenda a tarefa de limpeza para rodar a cada 24 horas."""
- 
-    from db.dependencies import get_db_connection 
-    
-    interval_seconds = 24 * 3600 
-    logger.info(f"Agendando tarefa de limpeza para rodar a cada {interval_seconds} segundos (3 dias de retenção).")
+async def run_retention():
+    """Tira das tabelas quentes as conversas além do período de retenção (arquivamento ou exclusão)."""
+    if config.ARCHIVE_ENABLED:
+        await archive_expired_conversations()
+    else:
+        async with acquire_db_connection() as conn:
+            await cleanup_old_conversations(conn)
 
-    await asyncio.sleep(20) 
-    
-    while True:
-        try:
-            async for conn in get_db_connection():
-                await cleanup_old_conversations(conn)
 
-                break 
+def register_scheduled_jobs(scheduler: Scheduler):
+    """Tarefas periódicas do worker; as de escopo "machine" rodam só no worker primário da máquina."""
+    scheduler.add_job(
+        "retention", run_retention,
+        parse_schedule(config.RETENTION_SCHEDULE, first_run_after=20),
+        jitter_seconds=60, timeout_seconds=config.RETENTION_TIMEOUT_SECONDS, scope=MACHINE
+    )
+    if config.CONVERSATION_STATS_BACKFILL_ON_STARTUP:
+        scheduler.add_job("conversation_stats_backfill", backfill_conversation_stats, Once(), scope=MACHINE)
+    # O uso de tokens é somado em memória por worker; o jitter espalha as gravações dos workers.
+    scheduler.add_job(
+        "usage_flush", flush_usage, Every(config.USAGE_FLUSH_INTERVAL_SECONDS),
+        jitter_seconds=config.USAGE_FLUSH_INTERVAL_SECONDS * 0.1, timeout_seconds=config.USAGE_FLUSH_INTERVAL_SECONDS
+    )
+    scheduler.add_job("response_cache_eviction", response_cache.evict_expired, Every(600))
+    # Com o backend compartilhado os buckets são da máquina: basta um worker limpar.
+    scheduler.add_job("rate_limit_prune", limiter.prune, Every(600), scope=MACHINE if limiter.offload else WORKER)
+    if config.SESSION_BACKEND == "server":
+        scheduler.add_job("session_prune", session_store.prune, Every(3600), scope=MACHINE)
 
-        except asyncio.CancelledError:
-            raise
-        except Exception as e:
-            logger.error(f"Erro inesperado na tarefa agendada: {e}")
-            
-        await asyncio.sleep(interval_seconds)
+
+scheduler = Scheduler(config.PRIMARY_LOCK_PATH)
+register_scheduled_jobs(scheduler)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Gerencia o ciclo de vida do pool de conexões do DB e a tarefa de limpeza."""
-    global cleanup_task
+    """Gerencia o ciclo de vida do pool de conexões do DB e das tarefas em segundo plano do worker."""
+    global llm_warmup_task, loop_monitor_task
 
     try:
         await startup_db_pool(config) 
 
-        cleanup_task = asyncio.create_task(schedule_cleanup()) 
+        if config.PROFILER_TRACEMALLOC_ON_STARTUP:
+            start_tracemalloc()
+
+        scheduler.start()
+
+        if config.LOOP_MONITOR_ENABLED:
+            loop_monitor_task = asyncio.create_task(monitor_event_loop())
+
+        if config.LLM_WARMUP_ON_STARTUP:
+            llm_warmup_task = asyncio.create_task(asyncio.to_thread(warm_up_llm_stack))
         
         logger.info("Aplicação iniciada com sucesso (Lifespan).")
     except RuntimeError as e:
@@ -103,23 +138,42 @@ async def lifespan(app: FastAPI):
         
     yield 
 
-    if cleanup_task:
-        logger.info("Cancelando tarefa de limpeza de conversas...")
-        cleanup_task.cancel()
-        try:
-            await cleanup_task
-        except asyncio.CancelledError:
-            logger.info("Tarefa de limpeza cancelada com sucesso.")
-        except Exception as e:
-            logger.error(f"Erro ao cancelar tarefa de limpeza: {e}")
+    logger.info("Parando o agendador de tarefas...")
+    await scheduler.stop()
+    release_primary()
+
+    for task in (loop_monitor_task, llm_warmup_task):
+        if task:
+            # O aquecimento roda em um thread: cancelar só deixa de esperá-lo.
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    try:
+        await flush_usage()
+    except Exception as e:
+        logger.error(f"Erro ao gravar o uso de tokens no encerramento: {e}")
 
     await shutdown_db_pool()
     logger.info("Aplicação encerrada (Lifespan).")
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 
-app.add_middleware(SessionMiddleware, secret_key=config.SESSION_SECRET_KEY)
+if config.SESSION_BACKEND == "server":
+    app.add_middleware(ServerSessionMiddleware, store=session_store)
+else:
+    app.add_middleware(SessionMiddleware, secret_key=config.SESSION_SECRET_KEY, max_age=config.SESSION_MAX_AGE_SECONDS)
+
+if config.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=config.COMPRESSION_MIN_BYTES,
+        gzip_level=config.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=config.COMPRESSION_BROTLI_QUALITY
+    )
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -135,8 +189,44 @@ async def read_root(request: Request):
         {"request": request, "user_id": user_id, "user_name": user_first_name}
     )
 
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_metrics_access)])
+async def metrics_endpoint():
+    """Métricas do worker no formato texto do Prometheus. Sem METRICS_TOKEN nem ADMIN_TOKEN, só administradores logados."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def profile_worker(
+    seconds: float = 10,
+    interval_ms: float = 5,
+    tasks: bool = False,
+    tracemalloc: bool = False
+):
+    """
+    Amostra as pilhas deste worker por `seconds` segundos. Sem extras, devolve o arquivo collapsed
+    (flamegraph.pl/speedscope); com `tasks` ou `tracemalloc`, devolve JSON com o collapsed, o dump
+    das tarefas asyncio e as maiores alocações do período (e as já retidas, se o tracemalloc estava
+    ligado antes; ver utils.profiler).
+    """
+    if not 0 < seconds <= config.PROFILER_MAX_SECONDS or interval_ms < 1:
+        raise HTTPException(status_code=400, detail=f"Use 0 < seconds <= {config.PROFILER_MAX_SECONDS:g} e interval_ms >= 1.")
+    if profiler_lock.locked():
+        raise HTTPException(status_code=409, detail="Já existe um profiling em andamento neste worker.")
+
+    async with profiler_lock:
+        logger.info(f"Profiling do worker {os.getpid()} por {seconds}s (intervalo de {interval_ms}ms).")
+        result = await run_profile(seconds, interval_ms / 1000, tasks, tracemalloc)
+
+    if not tasks and not tracemalloc:
+        return PlainTextResponse(result["collapsed"], headers={"Content-Disposition": f'attachment; filename="profile-{os.getpid()}.collapsed"'})
+
+    result["pid"] = os.getpid()
+    result["cached_conversation_states"] = cached_conversation_state_count()
+    return FastJSONResponse(content=result)
+
 app.include_router(auth_routes.router, tags=["auth"])
 app.include_router(chat_routes.router, tags=["chat"])
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
+    from server import main as run_server
+
+    run_server()
@@ -0,0 +1,248 @@
+"""
+Ponto de entrada do servidor.
+
+- dev (padrão): um worker com recarregamento automático, equivalente a `uvicorn main:app --reload`.
+- prod: um processo mestre importa `main:app` (e o LangChain) uma única vez, abre o socket e faz
+  fork dos workers, que compartilham as páginas já carregadas (copy-on-write). O mestre repõe
+  workers que morrem e, ao receber SIGTERM/SIGINT, encerra todos com o prazo de
+  SERVER_GRACEFUL_TIMEOUT_SECONDS. Rode uma instância por máquina: a quantidade de workers sai dos
+  núcleos disponíveis e o pool do banco de cada worker é dimensionado a partir dela.
+
+Exemplos:
+    python server.py                      # dev
+    python server.py --mode prod          # ou SERVER_MODE=prod
+    python server.py --mode prod --workers 4 --port 8080
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+import importlib.util
+from typing import Dict, Optional
+
+import uvicorn
+
+from settings.config import Config
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("server")
+
+config = Config()
+
+# Código de saída do uvicorn quando o lifespan falha na inicialização (ex.: banco indisponível).
+STARTUP_FAILURE = 3
+RESPAWN_DELAY_SECONDS = 1.0
+
+
+def available_cores() -> int:
+    """Núcleos que este processo pode usar (respeita affinity/cpuset de contêineres)."""
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def resolve_workers(requested: int) -> int:
+    """Workers pedidos (CLI/SERVER_WORKERS/WEB_CONCURRENCY) ou, com 0, um por núcleo: os workers são assíncronos."""
+    workers = requested if requested > 0 else available_cores()
+    return max(1, min(workers, config.SERVER_MAX_WORKERS))
+
+
+def pool_size_per_worker(workers: int) -> int:
+    """Divide DB_MAX_CONNECTIONS entre os workers, entre DB_POOL_MIN_SIZE e DB_POOL_MAX_SIZE por worker."""
+    share = config.DB_MAX_CONNECTIONS // workers if config.DB_MAX_CONNECTIONS > 0 else config.DB_POOL_MAX_SIZE
+    return max(config.DB_POOL_MIN_SIZE, 1, min(config.DB_POOL_MAX_SIZE, share))
+
+
+def apply_worker_sizing(workers: int) -> int:
+    """Fixa o tamanho do pool por worker antes de carregar o app (vale para fork e para spawn)."""
+    pool_size = pool_size_per_worker(workers)
+    Config.DB_POOL_MAX_SIZE = pool_size
+    Config.DB_POOL_MIN_SIZE = min(Config.DB_POOL_MIN_SIZE, pool_size)
+    os.environ["DB_POOL_MAX_SIZE"] = str(pool_size)
+    os.environ["DB_POOL_MIN_SIZE"] = str(Config.DB_POOL_MIN_SIZE)
+    return pool_size
+
+
+def server_options(host: str, port: int) -> dict:
+    """Ajustes do uvicorn para produção; loop/http "auto" escolhem uvloop e httptools quando instalados."""
+    return {
+        "host": host,
+        "port": port,
+        "loop": "auto",
+        "http": "auto",
+        "lifespan": "on",
+        "backlog": config.SERVER_BACKLOG,
+        "timeout_keep_alive": config.SERVER_KEEPALIVE_SECONDS,
+        "timeout_graceful_shutdown": config.SERVER_GRACEFUL_TIMEOUT_SECONDS,
+        "proxy_headers": True,
+        "forwarded_allow_ips": config.SERVER_FORWARDED_ALLOW_IPS,
+        "server_header": False,
+    }
+
+
+def _implementations() -> str:
+    loop = "uvloop" if _importable("uvloop") else "asyncio"
+    http = "httptools" if _importable("httptools") else "h11"
+    return f"loop={loop}, http={http}"
+
+
+def _importable(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def preload_app():
+    """Importa o app (e, com SERVER_PRELOAD_LLM, o LangChain) no mestre. Não cria threads nem conexões."""
+    start = time.perf_counter()
+    import main
+    if config.SERVER_PRELOAD_LLM:
+        from chat.llm_config import import_llm_modules
+        import_llm_modules()
+    logger.info(f"App pré-carregado no processo mestre em {time.perf_counter() - start:.2f}s.")
+    return main.app
+
+
+def _run_worker(uv_config: uvicorn.Config, sock: socket.socket):
+    """Corpo do processo filho: volta os sinais ao padrão (o uvicorn instala os seus) e serve no socket herdado."""
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(sig, signal.SIG_DFL)
+    server = uvicorn.Server(uv_config)
+    exit_code = 0
+    try:
+        server.run(sockets=[sock])
+        if not server.started:
+            exit_code = STARTUP_FAILURE
+    except BaseException:
+        logger.exception(f"Worker {os.getpid()} encerrado por erro.")
+        exit_code = 1
+    finally:
+        logging.shutdown()
+        os._exit(exit_code)
+
+
+class PreforkSupervisor:
+    """Mantém `workers` processos filhos servindo o mesmo socket e os encerra de forma graciosa."""
+
+    def __init__(self, uv_config: uvicorn.Config, sock: socket.socket, workers: int):
+        self.uv_config = uv_config
+        self.sock = sock
+        self.workers = workers
+        self.children: Dict[int, int] = {}
+        self.stopping = False
+        self.exit_code = 0
+
+    def spawn(self, index: int):
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(self.uv_config, self.sock)
+        self.children[pid] = index
+        logger.info(f"Worker {index} iniciado (pid {pid}).")
+
+    def handle_signal(self, signum, frame):
+        if not self.stopping:
+            logger.info(f"Sinal {signal.Signals(signum).name} recebido; encerrando {len(self.children)} workers...")
+        self.stopping = True
+
+    def run(self) -> int:
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, self.handle_signal)
+
+        for index in range(self.workers):
+            self.spawn(index)
+
+        while not self.stopping:
+            self._reap(respawn=True)
+            time.sleep(0.5)
+
+        self._shutdown()
+        return self.exit_code
+
+    def _reap(self, respawn: bool):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+            index = self.children.pop(pid, None)
+            if index is None or not respawn or self.stopping:
+                continue
+
+            code = os.waitstatus_to_exitcode(status)
+            if code == STARTUP_FAILURE:
+                # Sem banco (ou outro erro do lifespan) repor o worker só repetiria a falha.
+                logger.error(f"Worker {index} (pid {pid}) falhou na inicialização; encerrando o servidor.")
+                self.exit_code = STARTUP_FAILURE
+                self.stopping = True
+                return
+            logger.warning(f"Worker {index} (pid {pid}) saiu com código {code}; iniciando outro.")
+            time.sleep(RESPAWN_DELAY_SECONDS)
+            self.spawn(index)
+
+    def _shutdown(self):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.children.pop(pid, None)
+
+        # O uvicorn espera as requisições em andamento por até timeout_graceful_shutdown e depois roda o lifespan.
+        deadline = time.monotonic() + config.SERVER_GRACEFUL_TIMEOUT_SECONDS + 10
+        while self.children and time.monotonic() < deadline:
+            self._reap(respawn=False)
+            time.sleep(0.1)
+
+        for pid in list(self.children):
+            logger.warning(f"Worker pid {pid} não encerrou no prazo; enviando SIGKILL.")
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.children.clear()
+        self.sock.close()
+        logger.info("Servidor encerrado.")
+
+
+def run_production(host: str, port: int, workers: int) -> int:
+    pool_size = apply_worker_sizing(workers)
+    options = server_options(host, port)
+    logger.info(
+        f"Modo prod: {workers} workers em {host}:{port} ({_implementations()}), "
+        f"pool de até {pool_size} conexões por worker, keep-alive de {config.SERVER_KEEPALIVE_SECONDS}s, "
+        f"backlog {config.SERVER_BACKLOG}."
+    )
+
+    if not hasattr(os, "fork"):
+        # Sem fork (Windows): o uvicorn sobe os workers por spawn e cada um importa o app.
+        uvicorn.run("main:app", workers=workers, **options)
+        return 0
+
+    uv_config = uvicorn.Config(preload_app(), **options)
+    sock = uv_config.bind_socket()
+    return PreforkSupervisor(uv_config, sock, workers).run()
+
+
+def run_development(host: str, port: int):
+    uvicorn.run("main:app", host=host, port=port, reload=True)
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Inicia o servidor do Fala AI.")
+    parser.add_argument("--mode", choices=("dev", "prod"), default=config.SERVER_MODE, help="Padrão: SERVER_MODE.")
+    parser.add_argument("--host", default=config.SERVER_HOST, help="Padrão: 127.0.0.1 em dev, 0.0.0.0 em prod.")
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=config.SERVER_WORKERS, help="0 = um por núcleo (só em prod).")
+    args = parser.parse_args(argv)
+
+    if args.mode == "prod":
+        sys.exit(run_production(args.host or "0.0.0.0", args.port, resolve_workers(args.workers)))
+    run_development(args.host or "127.0.0.1", args.port)
+
+
+if __name__ == "__main__":
+    main()
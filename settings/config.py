@@ -18,6 +18,12 @@ class Config:
     """
 
     SESSION_SECRET_KEY = os.getenv("SESSION_SECRET_KEY", "SUA_CHAVE_DE_FALLBACK")
+    # Sessões: "cookie" (dados no cookie assinado, padrão) ou "server" (ID opaco no cookie, dados no SQLite local
+    # compartilhado pelos workers, com LRU em memória; permite encerrar sessões no logout e na troca de email/senha).
+    SESSION_BACKEND = os.getenv("SESSION_BACKEND", "cookie").lower()
+    SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", ".falaai-sessions.sqlite3")
+    SESSION_MAX_AGE_SECONDS = int(os.getenv("SESSION_MAX_AGE_SECONDS", 14 * 24 * 3600))
+    SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", 10_000))
   
     DB_HOST = os.getenv("DB_HOST", "SEU_HOST_TIDB_AQUI")
     
@@ -26,6 +32,126 @@ class Config:
     DB_PASSWORD = os.getenv("DB_PASSWORD", "SUA_SENHA_LOCAL")
     DB_NAME = os.getenv("DB_NAME", "falaai_db")
     DB_PORT = int(os.getenv("DB_PORT", 4000))
+    # Conexões do pool de cada worker; no modo prod o launcher divide DB_MAX_CONNECTIONS entre os workers
+    # (sem passar de DB_POOL_MAX_SIZE por worker).
+    DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+    DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+    DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", 40))
+
+    # Servidor (server.py): "dev" (um worker com reload) ou "prod" (workers pré-forkados, uvloop/httptools).
+    SERVER_MODE = os.getenv("SERVER_MODE", "dev").lower()
+    SERVER_HOST = os.getenv("SERVER_HOST", "")
+    SERVER_PORT = int(os.getenv("SERVER_PORT", os.getenv("PORT", 8000)))
+    # 0 = um worker por núcleo disponível ao processo.
+    SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", os.getenv("WEB_CONCURRENCY", 0)))
+    SERVER_MAX_WORKERS = int(os.getenv("SERVER_MAX_WORKERS", 16))
+    SERVER_BACKLOG = int(os.getenv("SERVER_BACKLOG", 2048))
+    # Acima do tempo ocioso de 60s dos balanceadores, para que o proxy feche a conexão antes do worker.
+    SERVER_KEEPALIVE_SECONDS = int(os.getenv("SERVER_KEEPALIVE_SECONDS", 65))
+    SERVER_GRACEFUL_TIMEOUT_SECONDS = int(os.getenv("SERVER_GRACEFUL_TIMEOUT_SECONDS", 30))
+    SERVER_FORWARDED_ALLOW_IPS = os.getenv("SERVER_FORWARDED_ALLOW_IPS", "127.0.0.1")
+    # Importa o LangChain no processo mestre antes do fork (páginas compartilhadas entre os workers).
+    SERVER_PRELOAD_LLM = os.getenv("SERVER_PRELOAD_LLM", "true").lower() in ("1", "true", "yes")
+    # Lock de arquivo que elege o worker que roda as tarefas únicas por máquina (limpeza, preenchimentos).
+    PRIMARY_LOCK_PATH = os.getenv("PRIMARY_LOCK_PATH", ".falaai-primary.lock")
     
+    # Pré-carrega o LangChain/Gemini em segundo plano no lifespan (reduz a latência da primeira mensagem).
+    LLM_WARMUP_ON_STARTUP = os.getenv("LLM_WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+    # Memória da conversa: "summary_buffer" (resumo pelo LLM acima de 4000 tokens, dentro do turno),
+    # "background_summary" (o mesmo resumo, feito em segundo plano após a resposta) ou "retrieval"
+    # (últimas trocas na íntegra + trocas antigas mais relevantes via BM25 local, sem chamadas extras).
+    MEMORY_MODE = os.getenv("MEMORY_MODE", "summary_buffer").lower()
+    MEMORY_RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", 4))
+    MEMORY_RETRIEVED_TURNS = int(os.getenv("MEMORY_RETRIEVED_TURNS", 3))
+    # Mensagens em cache com pelo menos N caracteres ficam comprimidas com zlib (0 desliga).
+    HISTORY_COMPRESS_MIN_CHARS = int(os.getenv("HISTORY_COMPRESS_MIN_CHARS", 512))
+    # Estados de conversa (chain + memória) mantidos por usuário, para alternar entre conversas recentes sem recarregar do DB.
+    CONVERSATION_STATES_PER_USER = max(1, int(os.getenv("CONVERSATION_STATES_PER_USER", 4)))
+    # Usuários com estados em cache por worker (LRU): o menos recente perde seus estados ao passar do limite.
+    CONVERSATION_STATE_MAX_USERS = max(1, int(os.getenv("CONVERSATION_STATE_MAX_USERS", 2000)))
+
+    # Proteções das chamadas ao Gemini: prazo por chamada, retentativas do cliente, hedge e circuit breaker.
+    LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 30))
+    LLM_TITLE_TIMEOUT_SECONDS = float(os.getenv("LLM_TITLE_TIMEOUT_SECONDS", 10))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+    LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+    LLM_HEDGE_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DELAY_SECONDS", 4))
+    LLM_BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", 0.5))
+    LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", 10))
+    LLM_BREAKER_WINDOW_SECONDS = float(os.getenv("LLM_BREAKER_WINDOW_SECONDS", 60))
+    LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", 30))
+
+    # Cota diária de tokens por usuário logado / sessão anônima (0 = ilimitado) e intervalo de gravação do uso.
+    USAGE_DAILY_TOKENS_USER = int(os.getenv("USAGE_DAILY_TOKENS_USER", 0))
+    USAGE_DAILY_TOKENS_ANONYMOUS = int(os.getenv("USAGE_DAILY_TOKENS_ANONYMOUS", 0))
+    USAGE_FLUSH_INTERVAL_SECONDS = int(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", 60))
+
+    # Cache de respostas do primeiro turno (conversa sem histórico), por entrada normalizada.
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+    RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 6 * 3600))
+    RESPONSE_CACHE_MAX_INPUT_CHARS = int(os.getenv("RESPONSE_CACHE_MAX_INPUT_CHARS", 200))
+
+    # Acesso às rotas administrativas (/admin/*): token Bearer e/ou IDs de usuários administradores.
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+    ADMIN_USER_IDS = {int(uid) for uid in os.getenv("ADMIN_USER_IDS", "").split(",") if uid.strip()}
+    PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", 60))
+    # Liga o tracemalloc no lifespan, para o /admin/profile mostrar também as alocações já retidas (custa CPU e memória).
+    PROFILER_TRACEMALLOC_ON_STARTUP = os.getenv("PROFILER_TRACEMALLOC_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
+    # Monitor de atraso do event loop; com LOOP_BLOCKING_DEBUG, captura a pilha de callbacks que bloqueiam além do limite.
+    LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() in ("1", "true", "yes")
+    LOOP_MONITOR_INTERVAL_SECONDS = float(os.getenv("LOOP_MONITOR_INTERVAL_SECONDS", 0.5))
+    LOOP_BLOCKING_THRESHOLD_SECONDS = float(os.getenv("LOOP_BLOCKING_THRESHOLD_SECONDS", 0.1))
+    LOOP_BLOCKING_DEBUG = os.getenv("LOOP_BLOCKING_DEBUG", "false").lower() in ("1", "true", "yes")
+
+    # Compressão negociada (brotli se o pacote Brotli estiver instalado, senão gzip) das respostas acima de N bytes.
+    COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+    COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))
+    COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+
+    # Limite de taxa (token bucket) das rotas de autenticação e envio de email: "chave:N/segundos", chaves ip, email e user.
+    # Backend "memory" (por worker) ou "shared" (SQLite local compartilhado pelos workers da máquina).
+    # As regras "ip" só contam IPs públicos: atrás de um proxy, configure SERVER_FORWARDED_ALLOW_IPS, senão elas
+    # são ignoradas (todos os clientes teriam o IP do proxy) e valem só as regras de email/user.
+    RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+    RATE_LIMIT_SHARED_PATH = os.getenv("RATE_LIMIT_SHARED_PATH", ".falaai-ratelimit.sqlite3")
+    RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100_000))
+    RATE_LIMIT_LOGIN = os.getenv("RATE_LIMIT_LOGIN", "ip:20/60,email:10/300")
+    RATE_LIMIT_REGISTER = os.getenv("RATE_LIMIT_REGISTER", "ip:5/600,email:3/600")
+    RATE_LIMIT_RESEND_VERIFICATION = os.getenv("RATE_LIMIT_RESEND_VERIFICATION", "ip:5/600,email:3/900")
+    RATE_LIMIT_PROFILE_UPDATE = os.getenv("RATE_LIMIT_PROFILE_UPDATE", "ip:30/600,user:10/600")
+
+    # Token aceito em /metrics (Authorization: Bearer <token>), além do acesso de administrador (ADMIN_TOKEN/ADMIN_USER_IDS).
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+    # Busca no histórico: "auto" usa o índice FULLTEXT do MySQL/TiDB se existir, senão o índice invertido local.
+    SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto").lower()
+    SEARCH_INDEX_MAX_USERS = int(os.getenv("SEARCH_INDEX_MAX_USERS", 500))
+
+    # Conversas sem atualização há mais de N dias saem das tabelas quentes (arquivadas ou apagadas).
+    CONVERSATION_RETENTION_DAYS = int(os.getenv("CONVERSATION_RETENTION_DAYS", 3))
+    ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() in ("1", "true", "yes")
+    ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+    ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 200))
+    ARCHIVE_SEGMENT_MAX_BYTES = int(os.getenv("ARCHIVE_SEGMENT_MAX_BYTES", 64 * 1024 * 1024))
+    # Agenda da retenção (utils.scheduler.parse_schedule: "@every 24h", "@daily", "30 3 * * *"...) e prazo
+    # por execução; o arquivamento grava em lotes, então uma execução interrompida continua na próxima.
+    RETENTION_SCHEDULE = os.getenv("RETENTION_SCHEDULE", "@every 24h")
+    RETENTION_TIMEOUT_SECONDS = float(os.getenv("RETENTION_TIMEOUT_SECONDS", 3600))
+
+    # Importação em massa do histórico: linhas lidas e mensagens gravadas por lote (INSERT de múltiplas linhas).
+    IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 1000))
+    # Tamanho máximo do arquivo importado (descompactado; 0 desliga): a importação roda em uma única
+    # transação, que precisa caber no limite do TiDB (txn-total-size-limit, 100 MB por padrão).
+    IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", 50 * 1024 * 1024))
+
+    # Preenche as colunas de resumo de `conversas` (total de mensagens, prévia...) nas linhas antigas ao iniciar.
+    CONVERSATION_STATS_BACKFILL_ON_STARTUP = os.getenv("CONVERSATION_STATS_BACKFILL_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+    CONVERSATION_STATS_BACKFILL_BATCH_SIZE = int(os.getenv("CONVERSATION_STATS_BACKFILL_BATCH_SIZE", 500))
+
     EMAIL_USER = os.getenv("EMAIL_USER")
     EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD") 
\ No newline at end of file
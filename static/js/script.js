@@ -79,12 +79,168 @@ document.addEventListener("DOMContentLoaded", () => {
         });
     }
 
+    // --- Cache local do histórico (localStorage + ETag/If-None-Match) ---
+    const currentUserId = document.body.getAttribute('data-user-id') || "";
+    const CACHE_PREFIX = `falaai:${currentUserId}:`;
+
+    function cacheKeyFor(name) {
+        // Apenas usuários logados têm histórico persistido para cachear.
+        return currentUserId ? `${CACHE_PREFIX}${name}` : null;
+    }
+
+    function readCache(key) {
+        if (!key) return null;
+        try {
+            return JSON.parse(localStorage.getItem(key));
+        } catch (error) {
+            return null;
+        }
+    }
+
+    function writeCache(key, value) {
+        if (!key) return;
+        try {
+            localStorage.setItem(key, JSON.stringify(value));
+        } catch (error) {
+            // Cota do localStorage excedida: descarta os caches de conversas e tenta de novo.
+            clearConversationCaches();
+            try {
+                localStorage.setItem(key, JSON.stringify(value));
+            } catch (retryError) {
+                console.warn("Não foi possível salvar o cache do histórico:", retryError);
+            }
+        }
+    }
+
+    function removeCache(key) {
+        if (key) localStorage.removeItem(key);
+    }
+
+    // Dados iniciais embutidos pelo servidor em /chat (lista de conversas e conversa ativa).
+    // Cada parte é usada uma única vez, no lugar da primeira requisição correspondente.
+    let initialChatState = null;
+    try {
+        const initialStateElement = document.getElementById("initial-chat-state");
+        initialChatState = initialStateElement ? JSON.parse(initialStateElement.textContent) : null;
+    } catch (error) {
+        console.warn("Dados iniciais do chat inválidos:", error);
+    }
+
+    const ACTIVE_CONVERSATION_COOKIE = "falaai_active_conversation";
+
+    // Guarda a conversa ativa no localStorage e em um cookie, para o servidor embuti-la no próximo /chat.
+    function setActiveConversation(conversationId) {
+        if (conversationId) {
+            localStorage.setItem('lastActiveConversationId', conversationId);
+            document.cookie = `${ACTIVE_CONVERSATION_COOKIE}=${conversationId}; path=/; max-age=31536000; SameSite=Lax`;
+        } else {
+            localStorage.removeItem('lastActiveConversationId');
+            document.cookie = `${ACTIVE_CONVERSATION_COOKIE}=; path=/; max-age=0; SameSite=Lax`;
+        }
+    }
+
+    // Depois de "Novo Chat", a próxima mensagem pede uma conversa nova ao servidor (new_conversation):
+    // o estado "vazio" do /reset_chat fica só no worker que o atendeu.
+    let startsNewConversation = false;
+
+    function getActiveConversationId() {
+        const conversationId = parseInt(localStorage.getItem('lastActiveConversationId'), 10);
+        return Number.isNaN(conversationId) ? null : conversationId;
+    }
+
+    // Avisa o servidor da troca de conversa; as recentes já estão em memória e trocam sem recarga do DB.
+    // Para conversas arquivadas, é esta chamada que as restaura: espere por ela antes de buscar as mensagens.
+    function activateConversationOnServer(conversationId) {
+        return fetch(`/conversation/${conversationId}/activate`, { method: "POST" })
+            .catch(error => console.warn("Não foi possível ativar a conversa no servidor:", error));
+    }
+
+    function clearConversationCaches() {
+        Object.keys(localStorage)
+            .filter(key => key.startsWith(`${CACHE_PREFIX}conversation:`))
+            .forEach(key => localStorage.removeItem(key));
+    }
+
+    // Busca as mensagens de uma conversa usando o cache local: envia If-None-Match e,
+    // se já houver mensagens em cache, pede apenas as novas (?since_id=).
+    async function fetchConversationMessages(conversationId) {
+        const cacheKey = cacheKeyFor(`conversation:${conversationId}`);
+
+        const inlined = initialChatState && initialChatState.conversation;
+        if (inlined && String(inlined.id) === String(conversationId)) {
+            initialChatState.conversation = null;
+            writeCache(cacheKey, { etag: inlined.etag, messages: inlined.messages });
+            return inlined.messages;
+        }
+
+        const cached = readCache(cacheKey);
+        const headers = {};
+        let url = `/conversation/${conversationId}`;
+        let lastCachedId = null;
+
+        if (cached && cached.etag && Array.isArray(cached.messages)) {
+            headers["If-None-Match"] = cached.etag;
+            const lastMessage = cached.messages[cached.messages.length - 1];
+            if (lastMessage && lastMessage.id) {
+                lastCachedId = lastMessage.id;
+                url += `?since_id=${lastCachedId}`;
+            }
+        }
+
+        const response = await fetch(url, { headers, cache: "no-store" });
+        if (response.status === 304) {
+            return cached.messages;
+        }
+        if (!response.ok) {
+            if (response.status === 404) removeCache(cacheKey);
+            const errorData = await response.json();
+            throw new Error(errorData.detail || "Falha ao carregar a conversa.");
+        }
+
+        const received = await response.json();
+        const messages = lastCachedId !== null ? cached.messages.concat(received) : received;
+        const etag = response.headers.get("ETag");
+        if (etag) writeCache(cacheKey, { etag, messages });
+        return messages;
+    }
+
+    // Busca a lista de conversas, reaproveitando a cópia local quando o servidor responde 304.
+    async function fetchConversationList() {
+        const cacheKey = cacheKeyFor("conversations");
+
+        const inlined = initialChatState && initialChatState.conversations;
+        if (inlined) {
+            initialChatState.conversations = null;
+            writeCache(cacheKey, { etag: inlined.etag, conversations: inlined.conversations });
+            return inlined.conversations;
+        }
+
+        const cached = readCache(cacheKey);
+        const headers = {};
+        if (cached && cached.etag) headers["If-None-Match"] = cached.etag;
+
+        const response = await fetch("/conversations", { headers, cache: "no-store" });
+        if (response.status === 304) {
+            return cached.conversations;
+        }
+        if (!response.ok) {
+            throw new Error(`Falha ao buscar histórico de conversas. Status: ${response.status}`);
+        }
+
+        const conversations = await response.json();
+        const etag = response.headers.get("ETag");
+        if (etag) writeCache(cacheKey, { etag, conversations });
+        return conversations;
+    }
+
     // Função para carregar uma conversa específica
     async function loadConversation(conversationId) {
         if (!conversationId || !chatBox) return;
 
-        // 🛑 NOVIDADE: Salva o ID da conversa ativa no localStorage
-        localStorage.setItem('lastActiveConversationId', conversationId);
+        // 🛑 NOVIDADE: Salva o ID da conversa ativa no localStorage (e no cookie lido pelo servidor)
+        setActiveConversation(conversationId);
+        startsNewConversation = false;
+        activateConversationOnServer(conversationId);
 
         chatBox.innerHTML = ''; // Limpa o chat atual
         addLoadingIndicator(chatBox);
@@ -100,12 +256,7 @@ document.addEventListener("DOMContentLoaded", () => {
                 clickedItem.classList.add('active');
             }
 
-            const response = await fetch(`/conversation/${conversationId}`);
-            if (!response.ok) {
-                const errorData = await response.json();
-                throw new Error(errorData.detail || "Falha ao carregar a conversa.");
-            }
-            const messages = await response.json();
+            const messages = await fetchConversationMessages(conversationId);
 
             removeLoadingIndicator();
 
@@ -123,6 +274,42 @@ document.addEventListener("DOMContentLoaded", () => {
         }
     }
 
+    // Lista as conversas arquivadas; abrir uma delas a restaura no servidor.
+    async function appendArchivedConversations() {
+        if (!historyList || !currentUserId) return;
+
+        try {
+            const response = await fetch("/conversations/archived");
+            if (!response.ok) return;
+            const archived = await response.json();
+
+            archived.forEach(conv => {
+                const listItem = document.createElement("li");
+                listItem.classList.add("conversation-item", "archived");
+                listItem.dataset.conversationId = conv.id;
+
+                const formattedDate = new Date(conv.data_atualizacao).toLocaleDateString('pt-BR', {
+                    day: '2-digit',
+                    month: '2-digit',
+                    year: 'numeric'
+                });
+                listItem.innerHTML = `
+                    <span class="conv-title">${escapeHtml(conv.titulo_conversa)}</span>
+                    <span class="conv-date">Arquivada · ${formattedDate}</span>
+                `;
+                listItem.addEventListener("click", async (event) => {
+                    event.preventDefault();
+                    await activateConversationOnServer(conv.id);
+                    await loadConversation(conv.id);
+                    renderConversationHistory();
+                });
+                historyList.appendChild(listItem);
+            });
+        } catch (error) {
+            console.warn("Não foi possível carregar as conversas arquivadas:", error);
+        }
+    }
+
     // FUNÇÃO DE RENDERIZAÇÃO DO HISTÓRICO CORRIGIDA
     async function renderConversationHistory() {
         if (!historyList || !chatBox) {
@@ -133,12 +320,7 @@ document.addEventListener("DOMContentLoaded", () => {
         historyList.innerHTML = '<li class="loading-history">Carregando histórico...</li>';
 
         try {
-            const response = await fetch("/conversations");
-            if (!response.ok) {
-                throw new Error(`Falha ao buscar histórico de conversas. Status: ${response.status}`);
-            }
-
-            const rawConversations = await response.json();
+            const rawConversations = await fetchConversationList();
 
             const conversations = Array.isArray(rawConversations) ? rawConversations : [];
 
@@ -153,6 +335,9 @@ document.addEventListener("DOMContentLoaded", () => {
                 }
             }
 
+            // Conversas arquivadas entram no fim da lista assim que chegarem (não bloqueia o histórico).
+            appendArchivedConversations();
+
             if (conversations.length === 0) {
                 historyList.innerHTML = '<li class="no-history">Nenhum histórico disponível.</li>';
                 return;
@@ -187,10 +372,14 @@ document.addEventListener("DOMContentLoaded", () => {
                         year: 'numeric'
                     });
 
+                    const messageCount = conv.total_mensagens ? ` · ${conv.total_mensagens} mensagens` : '';
                     listItem.innerHTML = `
-                        <span class="conv-title">${conv.titulo_conversa}</span>
-                        <span class="conv-date">${formattedDate}</span>
+                        <span class="conv-title">${escapeHtml(conv.titulo_conversa)}</span>
+                        <span class="conv-date">${formattedDate}${messageCount}</span>
                     `;
+                    if (conv.previa_ultima_mensagem) {
+                        listItem.title = conv.previa_ultima_mensagem;
+                    }
 
                     listItem.dataset.conversationId = conv.id;
 
@@ -241,6 +430,71 @@ document.addEventListener("DOMContentLoaded", () => {
     // Chamada inicial para carregar o histórico
     renderConversationHistory();
 
+    // --- Busca no Histórico (/conversations/search) ---
+    const historySearchInput = document.getElementById("history-search-input");
+
+    function escapeHtml(text) {
+        return String(text)
+            .replace(/&/g, "&amp;")
+            .replace(/</g, "&lt;")
+            .replace(/>/g, "&gt;")
+            .replace(/"/g, "&quot;")
+            .replace(/'/g, "&#039;");
+    }
+
+    async function renderSearchResults(query) {
+        if (!historyList) return;
+        historyList.innerHTML = '<li class="loading-history">Buscando...</li>';
+
+        try {
+            const response = await fetch(`/conversations/search?q=${encodeURIComponent(query)}`);
+            if (!response.ok) {
+                const errorData = await response.json();
+                throw new Error(errorData.detail || `Erro HTTP! status: ${response.status}`);
+            }
+            const data = await response.json();
+
+            historyList.innerHTML = '';
+            if (data.results.length === 0) {
+                historyList.innerHTML = '<li class="no-history">Nenhuma mensagem encontrada.</li>';
+                return;
+            }
+
+            data.results.forEach(result => {
+                const listItem = document.createElement("li");
+                listItem.classList.add("conversation-item");
+                listItem.dataset.conversationId = result.conversation_id;
+                listItem.innerHTML = `
+                    <span class="conv-title">${escapeHtml(result.titulo_conversa || "Conversa")}</span>
+                    <span class="conv-snippet">${escapeHtml(result.snippet)}</span>
+                `;
+                listItem.addEventListener("click", (event) => {
+                    event.preventDefault();
+                    loadConversation(result.conversation_id);
+                });
+                historyList.appendChild(listItem);
+            });
+        } catch (error) {
+            console.error("Erro na busca do histórico:", error);
+            historyList.innerHTML = `<li class="error-history">Erro na busca: ${escapeHtml(error.message)}</li>`;
+        }
+    }
+
+    if (historySearchInput) {
+        let searchDebounce = null;
+        historySearchInput.addEventListener("input", () => {
+            clearTimeout(searchDebounce);
+            const query = historySearchInput.value.trim();
+            searchDebounce = setTimeout(() => {
+                if (query.length === 0) {
+                    renderConversationHistory();
+                } else {
+                    renderSearchResults(query);
+                }
+            }, 300);
+        });
+    }
+
     // --- Pop-up de Confirmação de Cópia (Mantida) ---
     function showCopyConfirmation() {
         let confirmationDiv = document.getElementById("copy-confirmation");
@@ -357,6 +611,143 @@ document.addEventListener("DOMContentLoaded", () => {
         chatBox.scrollTop = chatBox.scrollHeight;
     }
 
+    // --- Mensagem do bot atualizada token a token (WebSocket) ---
+    function addStreamingBotMessage() {
+        const messageDiv = document.createElement("div");
+        messageDiv.classList.add("message", "bot");
+
+        const contentDiv = document.createElement("div");
+        contentDiv.classList.add("message-content");
+        messageDiv.appendChild(contentDiv);
+
+        let fullText = "";
+        let attached = false;
+
+        return {
+            update(text) {
+                fullText = text;
+                if (!attached && chatBox) {
+                    chatBox.appendChild(messageDiv);
+                    attached = true;
+                }
+                contentDiv.innerHTML = convertMarkdownToHtml(fullText);
+                if (chatBox) chatBox.scrollTop = chatBox.scrollHeight;
+            },
+            finish(text) {
+                if (!attached) {
+                    addMessage("bot", text);
+                    return;
+                }
+                this.update(text);
+
+                const copyIcon = document.createElement("i");
+                copyIcon.classList.add("bi", "bi-copy", "copy-icon");
+                copyIcon.title = "Copiar";
+                copyIcon.addEventListener("click", () => {
+                    navigator.clipboard
+                        .writeText(fullText)
+                        .then(() => {
+                            showCopyConfirmation();
+                        })
+                        .catch((err) => {
+                            console.error("Falha ao copiar texto: ", err);
+                        });
+                });
+                messageDiv.appendChild(copyIcon);
+            },
+        };
+    }
+
+    // --- Canal WebSocket do Chat (com fallback para HTTP) ---
+    let chatSocket = null;
+    let pendingSocketTurn = null;
+    let socketReconnectAttempts = 0;
+    const MAX_SOCKET_RECONNECT_ATTEMPTS = 3;
+
+    function connectChatSocket() {
+        if (!("WebSocket" in window)) return;
+
+        const protocol = window.location.protocol === "https:" ? "wss" : "ws";
+        const socket = new WebSocket(`${protocol}://${window.location.host}/chat/ws`);
+
+        socket.addEventListener("open", () => {
+            socketReconnectAttempts = 0;
+        });
+
+        socket.addEventListener("message", (event) => {
+            if (!pendingSocketTurn) return;
+            const data = JSON.parse(event.data);
+
+            if (data.type === "token") {
+                pendingSocketTurn.text += data.content;
+                pendingSocketTurn.onToken(pendingSocketTurn.text);
+            } else if (data.type === "end") {
+                pendingSocketTurn.resolve(data);
+                pendingSocketTurn = null;
+            } else if (data.type === "error") {
+                pendingSocketTurn.reject(new Error(data.detail || "Erro no canal de chat."));
+                pendingSocketTurn = null;
+            }
+        });
+
+        socket.addEventListener("close", () => {
+            if (pendingSocketTurn) {
+                pendingSocketTurn.reject(new Error("Conexão com o chat encerrada."));
+                pendingSocketTurn = null;
+            }
+            chatSocket = null;
+            if (socketReconnectAttempts < MAX_SOCKET_RECONNECT_ATTEMPTS) {
+                socketReconnectAttempts++;
+                setTimeout(connectChatSocket, 1000 * socketReconnectAttempts);
+            }
+        });
+
+        chatSocket = socket;
+    }
+
+    function isChatSocketReady() {
+        return chatSocket !== null && chatSocket.readyState === WebSocket.OPEN && pendingSocketTurn === null;
+    }
+
+    function sendMessageViaSocket(message, language, onToken) {
+        return new Promise((resolve, reject) => {
+            pendingSocketTurn = { text: "", onToken, resolve, reject };
+            chatSocket.send(JSON.stringify({
+                message: message,
+                language: language,
+                conversation_id: getActiveConversationId(),
+                new_conversation: startsNewConversation,
+            }));
+        });
+    }
+
+    async function sendMessageViaHttp(message, language) {
+        const response = await fetch("/chat/message", {
+            method: "POST",
+            headers: {
+                "Content-Type": "application/json",
+            },
+            body: JSON.stringify({
+                message: message,
+                language: language,
+                conversation_id: getActiveConversationId(),
+                new_conversation: startsNewConversation,
+            }),
+        });
+
+        if (!response.ok) {
+            const errorData = await response.json();
+            // 503 (LLM indisponível) e 403 trazem a mensagem amigável em "response".
+            throw new Error(
+                errorData.detail || errorData.response || `Erro HTTP! status: ${response.status}`
+            );
+        }
+
+        return response.json();
+    }
+
+    connectChatSocket();
+
     // --- Rota de Envio de Mensagem ---
     chatForm.addEventListener("submit", async (e) => {
         e.preventDefault();
@@ -387,26 +778,27 @@ document.addEventListener("DOMContentLoaded", () => {
         const currentLanguage = "pt";
 
         try {
-            const response = await fetch("/chat/message", {
-                method: "POST",
-                headers: {
-                    "Content-Type": "application/json",
-                },
-                body: JSON.stringify({
-                    message: message,
-                    language: currentLanguage,
-                }),
-            });
-
-            if (!response.ok) {
-                const errorData = await response.json();
-                throw new Error(
-                    errorData.detail || `Erro HTTP! status: ${response.status}`
-                );
+            let result;
+            if (isChatSocketReady()) {
+                const streamingMessage = addStreamingBotMessage();
+                result = await sendMessageViaSocket(message, currentLanguage, (partialText) => {
+                    if (currentLoadingIndicator) {
+                        currentLoadingIndicator.remove();
+                        currentLoadingIndicator = null;
+                    }
+                    streamingMessage.update(partialText);
+                });
+                streamingMessage.finish(result.response);
+            } else {
+                result = await sendMessageViaHttp(message, currentLanguage);
+                addMessage("bot", result.response);
             }
 
-            const data = await response.json();
-            addMessage("bot", data.response);
+            // Primeira mensagem de um chat novo: a conversa criada no servidor passa a ser a ativa.
+            startsNewConversation = false;
+            if (result.conversation_id && !getActiveConversationId()) {
+                setActiveConversation(result.conversation_id);
+            }
 
             // Recarrega o histórico após a primeira mensagem
             setTimeout(renderConversationHistory, 500);
@@ -426,8 +818,9 @@ document.addEventListener("DOMContentLoaded", () => {
     // --- Botão Novo Chat (CORRIGIDO) ---
     if (newChatButton && chatBox) {
         newChatButton.addEventListener("click", async () => {
-            // 🛑 NOVIDADE: Limpa o ID ativo no localStorage
-            localStorage.removeItem('lastActiveConversationId');
+            // 🛑 NOVIDADE: Limpa o ID ativo no localStorage (e o cookie lido pelo servidor)
+            setActiveConversation(null);
+            startsNewConversation = true;
 
             // 1. Limpa a seleção visual ativa na barra lateral
             document.querySelectorAll('.conversation-item').forEach(item => {
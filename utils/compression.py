@@ -0,0 +1,129 @@
+"""
+Middleware ASGI de compressão negociada (brotli ou gzip) para respostas acima de um limite.
+
+Só comprime respostas de corpo único (JSON, HTML, arquivos estáticos pequenos): respostas em
+streaming (exportação, arquivos grandes) passam sem alteração, assim como 304 e corpos que já
+têm Content-Encoding. Corpos grandes são comprimidos em uma thread para não travar o event loop.
+O brotli é opcional: sem o pacote `Brotli` instalado, apenas gzip é oferecido.
+"""
+import gzip
+import asyncio
+from typing import List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.metrics import Counter
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depende do ambiente
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml", "application/x-ndjson")
+# Acima deste tamanho a compressão roda em uma thread.
+OFFLOAD_BYTES = 256 * 1024
+
+compressed_responses = Counter("falaai_http_compressed_responses_total", "Respostas comprimidas por codificação.", ["encoding"])
+compression_saved_bytes = Counter("falaai_http_compression_saved_bytes_total", "Bytes economizados pela compressão de respostas.")
+
+
+def _parse_accept_encoding(value: str) -> List[Tuple[str, float]]:
+    codings = []
+    for part in value.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            codings.append((coding.strip().lower(), quality))
+    return codings
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Melhor codificação aceita pelo cliente: brotli (se disponível), depois gzip."""
+    accepted = {coding: quality for coding, quality in _parse_accept_encoding(accept_encoding)}
+    wildcard = accepted.get("*", 0.0)
+    candidates = (("br", "gzip") if brotli is not None else ("gzip",))
+    best, best_quality = None, 0.0
+    for coding in candidates:
+        quality = accepted.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class CompressionMiddleware:
+    """Comprime com a melhor codificação aceita pelo cliente as respostas de corpo único acima de `minimum_size` bytes."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start_message["headers"])
+            if (message.get("more_body", False) or len(body) < self.minimum_size
+                    or "content-encoding" in headers
+                    or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)):
+                # Streaming, pequeno demais ou não comprimível: envia como está.
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            if len(body) >= OFFLOAD_BYTES:
+                compressed = await asyncio.to_thread(self._compress, encoding, body)
+            else:
+                compressed = self._compress(encoding, body)
+
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # O corpo enviado muda com a codificação: o ETag deixa de ser forte.
+                headers["ETag"] = f"W/{etag}"
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            compressed_responses.inc(encoding=encoding)
+            compression_saved_bytes.inc(len(body) - len(compressed))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
+
+    def _compress(self, encoding: str, body: bytes) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
@@ -0,0 +1,39 @@
+"""
+Lock exclusivo e não bloqueante em um arquivo aberto, usado pela eleição do worker primário e pelo
+arquivamento. Usa fcntl.flock no Linux/macOS e msvcrt.locking (primeiro byte do arquivo) no Windows,
+onde o fcntl não existe; nos dois casos o sistema libera o lock junto com o processo.
+"""
+from typing import IO
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+
+def try_lock_file(lock_file: IO) -> bool:
+    """Tenta travar o arquivo sem esperar; False se outro processo já segura o lock."""
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    lock_file.seek(0)
+    try:
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def unlock_file(lock_file: IO):
+    """Libera o lock obtido por `try_lock_file`."""
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return
+
+    lock_file.seek(0)
+    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,94 @@
+"""
+Monitor de atraso (lag) do event loop e detector de chamadas bloqueantes.
+
+Uma corrotina de batimento dorme LOOP_MONITOR_INTERVAL_SECONDS e mede quanto acordou atrasada:
+esse atraso é o tempo em que o loop ficou ocupado com código síncrono. Com LOOP_BLOCKING_DEBUG,
+uma thread vigia o batimento e, se ele passar de LOOP_BLOCKING_THRESHOLD_SECONDS sem acontecer,
+captura a pilha da thread do loop naquele instante, ou seja, do callback que está bloqueando.
+"""
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from settings.config import Config
+from utils.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+config = Config()
+
+# Quadros mais internos mantidos na pilha capturada (onde o bloqueio realmente acontece).
+STACK_DEPTH = 30
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+loop_lag_seconds = Histogram("falaai_event_loop_lag_seconds", "Atraso do event loop medido pelo batimento.", buckets=LAG_BUCKETS)
+loop_lag_last = Gauge("falaai_event_loop_lag_last_seconds", "Último atraso medido do event loop.")
+loop_blocking_events = Counter("falaai_event_loop_blocking_total", "Bloqueios do event loop acima do limite configurado.")
+
+# Últimas pilhas capturadas pelo vigia (modo debug), da mais antiga para a mais recente.
+recent_blocking_stacks: Deque[Dict[str, Any]] = deque(maxlen=20)
+
+# Instante (time.monotonic) em que o batimento deveria acordar; 0 quando o monitor está parado.
+_beat_due = 0.0
+
+
+class _BlockingWatchdog(threading.Thread):
+    """Thread que captura a pilha do loop quando o batimento atrasa além do limite."""
+
+    def __init__(self, loop_thread_id: int, threshold: float):
+        super().__init__(name="loop-blocking-watchdog", daemon=True)
+        self.loop_thread_id = loop_thread_id
+        self.threshold = threshold
+        self.stopped = threading.Event()
+        self._reported_due = 0.0
+
+    def run(self):
+        while not self.stopped.wait(self.threshold / 2):
+            due = _beat_due
+            stalled_for = time.monotonic() - due
+            if not due or stalled_for < self.threshold or due == self._reported_due:
+                continue
+
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            self._reported_due = due
+            stack = "".join(traceback.format_stack(frame, limit=STACK_DEPTH))
+            recent_blocking_stacks.append({"at": time.time(), "stalled_for": round(stalled_for, 3), "stack": stack})
+            logger.warning(f"Event loop bloqueado há {stalled_for * 1000:.0f}ms. Pilha do callback em execução:\n{stack}")
+
+
+async def monitor_event_loop():
+    """Mede continuamente o atraso do event loop; no modo debug, liga o vigia de chamadas bloqueantes."""
+    global _beat_due
+    interval = config.LOOP_MONITOR_INTERVAL_SECONDS
+    threshold = config.LOOP_BLOCKING_THRESHOLD_SECONDS
+
+    watchdog: Optional[_BlockingWatchdog] = None
+    if config.LOOP_BLOCKING_DEBUG:
+        watchdog = _BlockingWatchdog(threading.get_ident(), threshold)
+        watchdog.start()
+        logger.info(f"Detector de chamadas bloqueantes ativo (limite de {threshold * 1000:.0f}ms).")
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            _beat_due = time.monotonic() + interval
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            lag = max(0.0, loop.time() - expected)
+
+            loop_lag_seconds.observe(lag)
+            loop_lag_last.set(lag)
+            if lag >= threshold:
+                loop_blocking_events.inc()
+                logger.warning(f"Event loop atrasado em {lag * 1000:.0f}ms (limite de {threshold * 1000:.0f}ms).")
+    finally:
+        _beat_due = 0.0
+        if watchdog is not None:
+            watchdog.stopped.set()
@@ -0,0 +1,57 @@
+"""
+Eleição do worker "primário" da máquina por lock de arquivo (utils.file_lock: fcntl, ou msvcrt no Windows).
+
+Com vários workers (server.py no modo prod, `uvicorn --workers N`, benchmarks), cada um roda o
+próprio lifespan e o próprio agendador. Tarefas que devem rodar uma vez por máquina (limpeza/
+arquivamento, preenchimento das colunas de resumo) só executam no worker que segura o lock; os
+demais tentam pegá-lo a cada disparo e assumem se o primário morrer (o kernel libera o lock junto
+com o processo).
+"""
+import os
+import logging
+from typing import Optional, TextIO
+
+from utils.file_lock import try_lock_file, unlock_file
+
+logger = logging.getLogger(__name__)
+
+_lock_file: Optional[TextIO] = None
+
+
+def try_become_primary(path: str) -> bool:
+    """Tenta pegar o lock sem bloquear; o lock fica com este processo até `release_primary` ou a saída."""
+    global _lock_file
+    if _lock_file is not None:
+        return True
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # "a": não trunca o PID gravado pelo primário atual antes de conseguir o lock.
+    lock_file = open(path, "a")
+    if not try_lock_file(lock_file):
+        lock_file.close()
+        return False
+
+    lock_file.truncate(0)
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    _lock_file = lock_file
+    logger.info(f"Worker {os.getpid()} assumiu as tarefas únicas da máquina.")
+    return True
+
+
+def is_primary() -> bool:
+    return _lock_file is not None
+
+
+def release_primary():
+    global _lock_file
+    if _lock_file is None:
+        return
+    try:
+        unlock_file(_lock_file)
+    finally:
+        _lock_file.close()
+        _lock_file = None
+
@@ -0,0 +1,112 @@
+"""
+Profiler por amostragem para o worker em produção.
+
+Uma thread lê `sys._current_frames()` a cada intervalo durante N segundos e agrega as pilhas no
+formato "collapsed" (uma linha `quadro;quadro;... contagem`), aceito por flamegraph.pl e speedscope.
+Opcionalmente inclui um dump das tarefas asyncio e as maiores alocações do tracemalloc.
+
+O tracemalloc só enxerga o que foi alocado depois de ligado. Se ele não estiver ativo, o profiling
+o liga apenas durante a janela e o relatório mostra só o crescimento daqueles N segundos
+("tracemalloc_scope": "window"). Para ver também o que já está retido (ex.: estados de conversa
+acumulados em cache), ligue-o antes: PROFILER_TRACEMALLOC_ON_STARTUP=true (a partir do lifespan de
+cada worker) ou PYTHONTRACEMALLOC=10 no ambiente (desde o início do processo). Nesse caso o
+relatório traz também "tracemalloc_live", as maiores alocações vivas ("tracemalloc_scope": "process").
+"""
+import os
+import sys
+import time
+import asyncio
+import threading
+import tracemalloc
+from collections import Counter as CounterDict
+from typing import Any, Dict, List, Optional
+
+TRACEMALLOC_FRAMES = 10
+TASK_STACK_LIMIT = 8
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)})"
+
+
+def _collapse(frame, thread_name: str) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ";".join(reversed(labels))
+
+
+def sample_stacks(duration: float, interval: float) -> Dict[str, Any]:
+    """Amostra as pilhas de todas as threads (menos a própria) por `duration` segundos (síncrona)."""
+    own_ident = threading.get_ident()
+    stacks: CounterDict = CounterDict()
+    samples = 0
+    deadline = time.monotonic() + duration
+
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident != own_ident:
+                stacks[_collapse(frame, names.get(ident, f"thread-{ident}"))] += 1
+        samples += 1
+        time.sleep(interval)
+
+    collapsed = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+    return {"samples": samples, "collapsed": collapsed + "\n" if collapsed else ""}
+
+
+def dump_asyncio_tasks() -> List[Dict[str, Any]]:
+    """Estado de cada tarefa asyncio viva: nome, corrotina e onde está suspensa."""
+    tasks = []
+    for task in asyncio.all_tasks():
+        stack = [_frame_label(frame) + f":{frame.f_lineno}" for frame in task.get_stack(limit=TASK_STACK_LIMIT)]
+        tasks.append({"name": task.get_name(), "coro": repr(task.get_coro()), "done": task.done(), "stack": stack})
+    return tasks
+
+
+def tracemalloc_top(before: Optional[tracemalloc.Snapshot], limit: int) -> List[Dict[str, Any]]:
+    """Maiores alocações por linha; com `before`, o crescimento desde aquele snapshot."""
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    if before is not None:
+        stats = snapshot.compare_to(before, "lineno")[:limit]
+        return [{"location": str(stat.traceback), "size_kb": round(stat.size / 1024, 1),
+                 "size_diff_kb": round(stat.size_diff / 1024, 1), "count": stat.count} for stat in stats]
+    stats = snapshot.statistics("lineno")[:limit]
+    return [{"location": str(stat.traceback), "size_kb": round(stat.size / 1024, 1), "count": stat.count} for stat in stats]
+
+
+def start_tracemalloc():
+    """Liga o tracemalloc para o resto da vida do processo (PROFILER_TRACEMALLOC_ON_STARTUP)."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+
+
+async def run_profile(duration: float, interval: float, include_tasks: bool, include_tracemalloc: bool, tracemalloc_limit: int = 25) -> Dict[str, Any]:
+    """Executa a amostragem em uma thread, sem bloquear o event loop que está sendo medido."""
+    started_tracing = False
+    before = None
+    if include_tracemalloc:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            started_tracing = True
+        before = tracemalloc.take_snapshot()
+
+    try:
+        result = await asyncio.to_thread(sample_stacks, duration, interval)
+        if include_tasks:
+            result["tasks"] = dump_asyncio_tasks()
+        if include_tracemalloc:
+            result["tracemalloc"] = await asyncio.to_thread(tracemalloc_top, before, tracemalloc_limit)
+            result["tracemalloc_scope"] = "window" if started_tracing else "process"
+            if not started_tracing:
+                result["tracemalloc_live"] = await asyncio.to_thread(tracemalloc_top, None, tracemalloc_limit)
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+    return result
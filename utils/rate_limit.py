@@ -0,0 +1,247 @@
+"""
+Limite de taxa (token bucket) para as rotas que custam CPU ou cota de email.
+
+`/login`, `/register` e `/profile/update` calculam ou verificam um hash Argon2 (dezenas de ms de
+CPU do worker) e `/register`, `/resend_verification_code` e `/profile/update` podem disparar um
+envio pelo SendGrid. A dependência `rate_limit(...)` entra em `dependencies=[...]` da rota, que o
+FastAPI resolve antes das dependências dos parâmetros: a requisição é recusada com 429 antes de
+pegar uma conexão do pool, consultar o banco ou calcular hashes.
+
+Regras em texto: "ip:20/60,email:10/300" = até 20 requisições por IP a cada 60s (rajada de 20,
+reposição contínua) e 10 por email a cada 300s. Chaves: `ip` (request.client, já corrigido pelos
+proxy headers do uvicorn), `email` (campo `email` do JSON ou do formulário) e `user` (sessão).
+
+A chave `ip` só vale para endereços públicos. Atrás de um balanceador cujo IP não está em
+SERVER_FORWARDED_ALLOW_IPS, todo cliente aparece com o endereço (privado) do proxy, e uma regra por
+IP viraria um limite global do site: nesse caso as regras `ip` são ignoradas e valem só as de
+`email`/`user` da rota, até o proxy ser configurado como confiável.
+
+Backends (RATE_LIMIT_BACKEND):
+- memory: buckets no processo; com N workers o limite efetivo por máquina fica até N vezes maior.
+- shared: SQLite local (RATE_LIMIT_SHARED_PATH) compartilhado pelos workers da máquina.
+Falhas do backend compartilhado liberam a requisição (fail-open) e ficam registradas no log.
+"""
+import time
+import asyncio
+import sqlite3
+import logging
+import ipaddress
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from settings.config import Config
+from utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+config = Config()
+
+SCOPES = ("ip", "email", "user")
+
+rate_limit_rejections = Counter("falaai_rate_limit_rejections_total", "Requisições recusadas pelo limite de taxa.", ["route", "scope"])
+
+
+class RateLimitRule:
+    """`capacity` requisições em rajada, repostas à taxa de capacity/period por segundo."""
+
+    def __init__(self, scope: str, capacity: int, period_seconds: float):
+        if scope not in SCOPES:
+            raise ValueError(f"Chave de limite desconhecida: {scope!r} (use {', '.join(SCOPES)})")
+        if capacity <= 0 or period_seconds <= 0:
+            raise ValueError("Capacidade e período do limite devem ser positivos.")
+        self.scope = scope
+        self.capacity = capacity
+        self.period_seconds = period_seconds
+        self.rate = capacity / period_seconds
+
+    def __repr__(self) -> str:
+        return f"{self.scope}:{self.capacity}/{self.period_seconds:g}"
+
+
+def parse_rules(text: str) -> List[RateLimitRule]:
+    rules = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        scope, _, limit = part.partition(":")
+        capacity, _, period = limit.partition("/")
+        rules.append(RateLimitRule(scope.strip(), int(capacity), float(period)))
+    return rules
+
+
+def _refill(tokens: float, updated: float, capacity: int, rate: float, now: float) -> float:
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+
+def _take(tokens: float, capacity: int, rate: float) -> Tuple[float, float]:
+    """Consome uma ficha; devolve (fichas restantes, segundos até poder tentar de novo ou 0)."""
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class MemoryBucketStore:
+    """Buckets em um OrderedDict com despejo LRU acima de `max_keys`."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def hit(self, key: str, capacity: int, rate: float, now: float) -> float:
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens, retry_after = _take(_refill(tokens, updated, capacity, rate, now), capacity, rate)
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    def prune(self, idle_before: float) -> int:
+        stale = [key for key, (_, updated) in self._buckets.items() if updated < idle_before]
+        for key in stale:
+            del self._buckets[key]
+        return len(stale)
+
+
+class SQLiteBucketStore:
+    """Buckets em um SQLite local; BEGIN IMMEDIATE serializa a leitura e a escrita entre os workers."""
+
+    def __init__(self, path: str, busy_timeout_seconds: float = 0.2):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=busy_timeout_seconds, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS buckets (chave TEXT PRIMARY KEY, fichas REAL NOT NULL, atualizado REAL NOT NULL)")
+
+    def hit(self, key: str, capacity: int, rate: float, now: float) -> float:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT fichas, atualizado FROM buckets WHERE chave = ?", (key,)).fetchone()
+                tokens, updated = row if row else (capacity, now)
+                tokens, retry_after = _take(_refill(tokens, updated, capacity, rate, now), capacity, rate)
+                self._conn.execute("INSERT OR REPLACE INTO buckets (chave, fichas, atualizado) VALUES (?, ?, ?)", (key, tokens, now))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return retry_after
+
+    def prune(self, idle_before: float) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM buckets WHERE atualizado < ?", (idle_before,)).rowcount
+
+
+class RateLimiter:
+    def __init__(self, backend: str):
+        self.backend = backend
+        # O backend compartilhado faz I/O (e pode esperar o lock do SQLite): roda em uma thread.
+        self.offload = backend == "shared"
+        self.max_period_seconds = 0.0
+        self._store = None
+
+    @property
+    def store(self):
+        # Criado no primeiro uso, já dentro do worker: a conexão SQLite não pode atravessar o fork do server.py.
+        if self._store is None:
+            if self.offload:
+                self._store = SQLiteBucketStore(config.RATE_LIMIT_SHARED_PATH)
+            else:
+                self._store = MemoryBucketStore(config.RATE_LIMIT_MAX_KEYS)
+        return self._store
+
+    async def hit(self, key: str, rule: RateLimitRule) -> float:
+        now = time.time()
+        if not self.offload:
+            return self.store.hit(key, rule.capacity, rule.rate, now)
+        try:
+            return await asyncio.to_thread(self.store.hit, key, rule.capacity, rule.rate, now)
+        except sqlite3.Error as e:
+            logger.warning(f"Limite de taxa indisponível ({e}); liberando a requisição.")
+            return 0.0
+
+    async def prune(self) -> int:
+        """Remove buckets parados há mais que o maior período das regras (já estariam cheios)."""
+        idle_before = time.time() - max(self.max_period_seconds, 60)
+        if self.offload:
+            return await asyncio.to_thread(self.store.prune, idle_before)
+        return self.store.prune(idle_before)
+
+
+limiter = RateLimiter(config.RATE_LIMIT_BACKEND)
+
+
+_warned_untrusted_proxy = False
+
+
+def client_ip(request: Request) -> Optional[str]:
+    """IP público do cliente, ou None se o endereço não identifica o cliente (privado, loopback, proxy)."""
+    global _warned_untrusted_proxy
+    if not request.client:
+        return None
+    try:
+        is_public = ipaddress.ip_address(request.client.host).is_global
+    except ValueError:
+        return None
+    if is_public:
+        return request.client.host
+
+    if not _warned_untrusted_proxy and "x-forwarded-for" in request.headers:
+        _warned_untrusted_proxy = True
+        logger.warning(
+            f"X-Forwarded-For recebido do proxy {request.client.host}, que não está em SERVER_FORWARDED_ALLOW_IPS: "
+            "as regras de limite por IP ficam desativadas até ele ser configurado como confiável."
+        )
+    return None
+
+
+async def _request_email(request: Request) -> Optional[str]:
+    """Email do corpo já lido pelo FastAPI (JSON ou formulário), sem validar o resto."""
+    content_type = request.headers.get("content-type", "")
+    try:
+        if content_type.startswith("application/json"):
+            body = await request.json()
+            email = body.get("email") if isinstance(body, dict) else None
+        elif content_type.startswith(("application/x-www-form-urlencoded", "multipart/form-data")):
+            email = (await request.form()).get("email")
+        else:
+            return None
+    except Exception:
+        return None
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+
+def rate_limit(route: str, rules_text: str) -> Callable:
+    """Dependência que aplica as regras à rota; use em `dependencies=[Depends(rate_limit(...))]`."""
+    rules = parse_rules(rules_text)
+    limiter.max_period_seconds = max([limiter.max_period_seconds] + [rule.period_seconds for rule in rules])
+
+    async def check_rate_limit(request: Request):
+        if not config.RATE_LIMIT_ENABLED:
+            return
+        for rule in rules:
+            if rule.scope == "ip":
+                identity = client_ip(request)
+            elif rule.scope == "email":
+                identity = await _request_email(request)
+            else:
+                identity = request.session.get("user_id")
+            if identity is None:
+                continue
+
+            retry_after = await limiter.hit(f"{route}:{rule.scope}:{identity}", rule)
+            if retry_after > 0:
+                rate_limit_rejections.inc(route=route, scope=rule.scope)
+                logger.warning(f"Limite de taxa de '{route}' atingido ({rule.scope}={identity}).")
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Muitas tentativas. Aguarde alguns instantes e tente novamente.",
+                    headers={"Retry-After": str(max(1, int(retry_after + 0.999)))}
+                )
+
+    return check_rate_limit
@@ -0,0 +1,34 @@
+"""
+Resposta JSON do projeto, serializada com orjson.
+
+O orjson é várias vezes mais rápido que o encoder da biblioteca padrão e serializa `datetime`,
+`date` e `uuid` nativamente (ISO 8601), então as rotas não precisam converter linha a linha.
+"""
+import decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    # Agregações do MySQL (SUM, AVG) chegam como Decimal.
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Tipo não serializável em JSON: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Serializa para JSON (UTF-8) com as mesmas regras de FastJSONResponse."""
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse serializada com orjson (datetime nativo, Decimal como número)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
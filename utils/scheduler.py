@@ -0,0 +1,239 @@
+"""
+Agendador de tarefas periódicas em processo, iniciado e parado pelo lifespan de cada worker.
+
+Cada tarefa tem uma agenda (intervalo, cron de 5 campos ou execução única), jitter, prazo por
+execução e nunca se sobrepõe a si mesma: se a execução anterior ainda estiver rodando na hora da
+próxima, a próxima é pulada. Tarefas com escopo "machine" só rodam no worker primário da máquina
+(utils.primary_worker); nos demais workers a execução é pulada, e o primeiro a disparar depois da
+morte do primário assume o papel.
+
+Agendas em texto (parse_schedule):
+    "@every 30s" / "@every 15m" / "@every 24h"   intervalo
+    "@hourly", "@daily", "@weekly"                 atalhos de cron
+    "30 3 * * *"                                   cron (minuto hora dia mês dia-da-semana, hora local)
+"""
+import time
+import random
+import asyncio
+import inspect
+import logging
+import datetime
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from utils.metrics import Counter, Gauge, Histogram
+from utils.primary_worker import try_become_primary
+
+logger = logging.getLogger(__name__)
+
+WORKER = "worker"
+MACHINE = "machine"
+
+job_runs = Counter("falaai_scheduler_job_runs_total", "Execuções de tarefas agendadas por resultado.", ["job", "outcome"])
+job_skips = Counter("falaai_scheduler_job_skips_total", "Execuções de tarefas agendadas puladas, por motivo.", ["job", "reason"])
+job_duration = Histogram(
+    "falaai_scheduler_job_duration_seconds", "Duração das execuções de tarefas agendadas.", ["job"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)
+)
+job_last_success = Gauge("falaai_scheduler_job_last_success_timestamp_seconds", "Horário (epoch) do último sucesso de cada tarefa.", ["job"])
+
+
+class Every:
+    """A cada `seconds` segundos; a primeira execução ocorre após `first_run_after` (padrão: um intervalo)."""
+
+    def __init__(self, seconds: float, first_run_after: Optional[float] = None):
+        if seconds <= 0:
+            raise ValueError("O intervalo deve ser positivo.")
+        self.seconds = seconds
+        self.first_run_after = seconds if first_run_after is None else first_run_after
+
+    def next_run(self, now: float, previous: Optional[float]) -> Optional[float]:
+        if previous is None:
+            return now + self.first_run_after
+        # Conta a partir do horário previsto (sem deriva); se ficou para trás, roda assim que possível.
+        return max(previous + self.seconds, now)
+
+    def __repr__(self) -> str:
+        return f"Every({self.seconds:g}s)"
+
+
+class Once:
+    """Uma única execução, `delay` segundos após o início do agendador."""
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+
+    def next_run(self, now: float, previous: Optional[float]) -> Optional[float]:
+        return now + self.delay if previous is None else None
+
+    def __repr__(self) -> str:
+        return f"Once({self.delay:g}s)"
+
+
+def _parse_cron_field(field: str, low: int, high: int) -> Set[int]:
+    values: Set[int] = set()
+    for part in field.split(","):
+        part, _, step_text = part.partition("/")
+        step = int(step_text) if step_text else 1
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(value) for value in part.split("-", 1))
+        else:
+            start = int(part)
+            end = high if step_text else start
+        if step <= 0 or start < low or end > high or start > end:
+            raise ValueError(f"Campo de cron inválido: {field!r}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class Cron:
+    """Expressão cron de 5 campos (hora local). Dia do mês e dia da semana restritos combinam com OU, como no cron."""
+
+    ALIASES = {"@hourly": "0 * * * *", "@daily": "0 0 * * *", "@midnight": "0 0 * * *", "@weekly": "0 0 * * 0"}
+
+    def __init__(self, expression: str):
+        self.expression = self.ALIASES.get(expression.strip(), expression.strip())
+        fields = self.expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"A expressão cron deve ter 5 campos: {expression!r}")
+        self.minutes = _parse_cron_field(fields[0], 0, 59)
+        self.hours = _parse_cron_field(fields[1], 0, 23)
+        self.days = _parse_cron_field(fields[2], 1, 31)
+        self.months = _parse_cron_field(fields[3], 1, 12)
+        # 0 e 7 são domingo; convertido para o weekday() do Python (segunda = 0).
+        self.weekdays = {(day - 1) % 7 for day in _parse_cron_field(fields[4], 0, 7)}
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment: datetime.datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = moment.weekday() in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_run(self, now: float, previous: Optional[float]) -> Optional[float]:
+        start = max(now, previous or 0)
+        moment = datetime.datetime.fromtimestamp(start).replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = moment + datetime.timedelta(days=366 * 4)
+        while moment < limit:
+            if moment.month not in self.months or not self._day_matches(moment):
+                moment = (moment + datetime.timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + datetime.timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += datetime.timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ValueError(f"A expressão cron nunca dispara: {self.expression!r}")
+
+    def __repr__(self) -> str:
+        return f"Cron({self.expression!r})"
+
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_schedule(text: str, first_run_after: Optional[float] = None):
+    """Converte a agenda em texto (ver o topo do módulo); `first_run_after` vale só para intervalos."""
+    text = text.strip()
+    if text.startswith("@every"):
+        amount = text[len("@every"):].strip()
+        unit = amount[-1:] if amount[-1:] in _UNITS else "s"
+        seconds = float(amount[:-1] if amount[-1:] in _UNITS else amount) * _UNITS[unit]
+        return Every(seconds, first_run_after)
+    return Cron(text)
+
+
+class Job:
+    """Tarefa registrada no agendador."""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], Any],
+        schedule,
+        jitter_seconds: float = 0,
+        timeout_seconds: Optional[float] = None,
+        scope: str = WORKER
+    ):
+        if scope not in (WORKER, MACHINE):
+            raise ValueError(f"Escopo de tarefa inválido: {scope!r}")
+        self.name = name
+        self.func = func
+        self.schedule = schedule
+        self.jitter_seconds = jitter_seconds
+        self.timeout_seconds = timeout_seconds
+        self.scope = scope
+        self.running: Optional[asyncio.Task] = None
+
+
+class Scheduler:
+    """Executa as tarefas registradas, cada uma em sua própria tarefa asyncio."""
+
+    def __init__(self, primary_lock_path: str):
+        self.primary_lock_path = primary_lock_path
+        self.jobs: Dict[str, Job] = {}
+        self._loops: List[asyncio.Task] = []
+
+    def add_job(self, name: str, func: Callable[[], Any], schedule, **options) -> Job:
+        if name in self.jobs:
+            raise ValueError(f"Tarefa já registrada: {name}")
+        job = self.jobs[name] = Job(name, func, schedule, **options)
+        return job
+
+    def start(self):
+        for job in self.jobs.values():
+            self._loops.append(asyncio.create_task(self._job_loop(job), name=f"scheduler:{job.name}"))
+        logger.info("Agendador iniciado: " + ", ".join(f"{job.name} {job.schedule!r} ({job.scope})" for job in self.jobs.values()))
+
+    async def stop(self):
+        """Cancela os laços e as execuções em andamento e espera todos terminarem."""
+        tasks = list(self._loops)
+        tasks.extend(job.running for job in self.jobs.values() if job.running is not None and not job.running.done())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loops.clear()
+        for job in self.jobs.values():
+            job.running = None
+
+    async def _job_loop(self, job: Job):
+        due = None
+        while True:
+            due = job.schedule.next_run(time.time(), due)
+            if due is None:
+                return
+            delay = due - time.time()
+            if job.jitter_seconds:
+                delay += random.uniform(0, job.jitter_seconds)
+            await asyncio.sleep(max(0.0, delay))
+
+            if job.running is not None and not job.running.done():
+                job_skips.inc(job=job.name, reason="overlap")
+                logger.warning(f"Tarefa '{job.name}' ainda em execução; pulando este disparo.")
+                continue
+            if job.scope == MACHINE and not try_become_primary(self.primary_lock_path):
+                job_skips.inc(job=job.name, reason="not_primary")
+                continue
+            job.running = asyncio.create_task(self._run(job), name=f"job:{job.name}")
+
+    async def _run(self, job: Job):
+        start = time.perf_counter()
+        outcome = "success"
+        try:
+            result = job.func()
+            if inspect.isawaitable(result):
+                await asyncio.wait_for(result, job.timeout_seconds)
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            logger.error(f"Tarefa '{job.name}' excedeu o prazo de {job.timeout_seconds}s e foi cancelada.")
+        except Exception as e:
+            outcome = "error"
+            logger.error(f"Erro na tarefa agendada '{job.name}': {e}", exc_info=True)
+
+        job_duration.observe(time.perf_counter() - start, job=job.name)
+        job_runs.inc(job=job.name, outcome=outcome)
+        if outcome == "success":
+            job_last_success.set(time.time(), job=job.name)
@@ -0,0 +1,231 @@
+"""
+Sessões guardadas no servidor (SESSION_BACKEND=server), no lugar do cookie assinado do SessionMiddleware.
+
+O cookie leva só um ID opaco (token aleatório de 256 bits), então o tamanho do cookie e o custo por
+resposta não dependem do conteúdo da sessão, e o Set-Cookie só é enviado quando a sessão é criada,
+muda de dono ou tem a validade renovada. Os dados ficam em um SQLite local (WAL) compartilhado pelos
+workers da máquina, com um LRU em memória por worker: cada requisição faz uma leitura por chave
+primária que devolve só a versão quando o cache está atualizado, e o dicionário carregado vale para
+toda a requisição (`request.session`). Como a leitura sempre confere o SQLite, apagar as linhas
+(logout, troca de email/senha) invalida a sessão em todos os workers na requisição seguinte.
+"""
+import json
+import time
+import asyncio
+import sqlite3
+import secrets
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from settings.config import Config
+
+logger = logging.getLogger(__name__)
+
+config = Config()
+
+COOKIE_NAME = "falaai_sid"
+# A validade (linha e cookie) é renovada no máximo uma vez por intervalo, não a cada resposta.
+TOUCH_INTERVAL_SECONDS = 24 * 3600
+
+
+def _valid_session_id(value: str) -> bool:
+    return 20 <= len(value) <= 64 and all(char.isalnum() or char in "-_" for char in value)
+
+
+class SessionStore:
+    """SQLite local + LRU por worker. Leituras rodam no event loop (WAL não bloqueia leitores); escritas, em threads."""
+
+    def __init__(self, path: str, max_age_seconds: int, cache_max_entries: int):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.cache_max_entries = cache_max_entries
+        self._cache: "OrderedDict[str, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+        self._read_conn: Optional[sqlite3.Connection] = None
+        self._write_conn: Optional[sqlite3.Connection] = None
+        self._write_lock = threading.Lock()
+        self._open_lock = threading.Lock()
+
+    def _connections(self) -> Tuple[sqlite3.Connection, sqlite3.Connection]:
+        # Abertas no primeiro uso, já dentro do worker: conexões SQLite não podem atravessar o fork do server.py.
+        with self._open_lock:
+            if self._read_conn is None:
+                self._open()
+        return self._read_conn, self._write_conn
+
+    def _open(self):
+        write_conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+        write_conn.execute("PRAGMA journal_mode=WAL")
+        write_conn.execute("PRAGMA synchronous=NORMAL")
+        write_conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessoes ("
+            "id TEXT PRIMARY KEY, dados TEXT NOT NULL, versao INTEGER NOT NULL, "
+            "id_usuario INTEGER, expira REAL NOT NULL)"
+        )
+        write_conn.execute("CREATE INDEX IF NOT EXISTS idx_sessoes_usuario ON sessoes (id_usuario)")
+        self._write_conn = write_conn
+        self._read_conn = sqlite3.connect(self.path, timeout=0.2, isolation_level=None, check_same_thread=False)
+
+    def load(self, session_id: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """(dados, expira) da sessão, ou None se não existir ou tiver expirado. Só decodifica o JSON se o cache estiver velho."""
+        read_conn, _ = self._connections()
+        cached = self._cache.get(session_id)
+        row = read_conn.execute(
+            "SELECT versao, expira, CASE WHEN versao = ? THEN NULL ELSE dados END FROM sessoes WHERE id = ?",
+            (cached[0] if cached else -1, session_id)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            self._cache.pop(session_id, None)
+            return None
+
+        version, expires_at, raw = row
+        if raw is None:
+            self._cache.move_to_end(session_id)
+            data = cached[1]
+        else:
+            data = json.loads(raw)
+            self._cache[session_id] = (version, data)
+            while len(self._cache) > self.cache_max_entries:
+                self._cache.popitem(last=False)
+        return dict(data), expires_at
+
+    def _write_save(self, session_id: str, data: Dict[str, Any], replaces: Optional[str]):
+        _, write_conn = self._connections()
+        user_id = data.get("user_id")
+        with self._write_lock:
+            write_conn.execute("BEGIN IMMEDIATE")
+            try:
+                if replaces:
+                    write_conn.execute("DELETE FROM sessoes WHERE id = ?", (replaces,))
+                write_conn.execute(
+                    "INSERT INTO sessoes (id, dados, versao, id_usuario, expira) VALUES (?, ?, 1, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET dados = excluded.dados, versao = sessoes.versao + 1, "
+                    "id_usuario = excluded.id_usuario, expira = excluded.expira",
+                    (session_id, json.dumps(data), user_id if isinstance(user_id, int) else None, time.time() + self.max_age_seconds)
+                )
+                write_conn.execute("COMMIT")
+            except BaseException:
+                write_conn.execute("ROLLBACK")
+                raise
+
+    def _write(self, sql: str, params: tuple) -> int:
+        _, write_conn = self._connections()
+        with self._write_lock:
+            return write_conn.execute(sql, params).rowcount
+
+    # As escritas rodam em threads; o LRU só é alterado aqui, de volta ao event loop (o mesmo thread de `load`).
+
+    async def save(self, session_id: str, data: Dict[str, Any], replaces: Optional[str] = None):
+        await asyncio.to_thread(self._write_save, session_id, data, replaces)
+        self._cache.pop(session_id, None)
+        if replaces:
+            self._cache.pop(replaces, None)
+
+    async def touch(self, session_id: str):
+        await asyncio.to_thread(self._write, "UPDATE sessoes SET expira = ? WHERE id = ?", (time.time() + self.max_age_seconds, session_id))
+
+    async def delete(self, session_id: str):
+        await asyncio.to_thread(self._write, "DELETE FROM sessoes WHERE id = ?", (session_id,))
+        self._cache.pop(session_id, None)
+
+    async def delete_user_sessions(self, user_id: int, keep_session_id: Optional[str] = None) -> int:
+        removed = await asyncio.to_thread(
+            self._write, "DELETE FROM sessoes WHERE id_usuario = ? AND id != ?", (user_id, keep_session_id or "")
+        )
+        for session_id in [sid for sid, (_, data) in self._cache.items() if data.get("user_id") == user_id and sid != keep_session_id]:
+            del self._cache[session_id]
+        return removed
+
+    async def prune(self) -> int:
+        return await asyncio.to_thread(self._write, "DELETE FROM sessoes WHERE expira < ?", (time.time(),))
+
+
+session_store = SessionStore(config.SESSION_STORE_PATH, config.SESSION_MAX_AGE_SECONDS, config.SESSION_CACHE_MAX_ENTRIES)
+
+
+class ServerSessionMiddleware:
+    """Substitui o SessionMiddleware: `scope["session"]` vem do SessionStore e `scope["session_id"]` guarda o ID."""
+
+    def __init__(self, app: ASGIApp, store: SessionStore, same_site: str = "lax", https_only: bool = False):
+        self.app = app
+        self.store = store
+        self.security_flags = "httponly; samesite=" + same_site + ("; secure" if https_only else "")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        session_id = HTTPConnection(scope).cookies.get(COOKIE_NAME)
+        loaded = None
+        if session_id and _valid_session_id(session_id):
+            try:
+                loaded = self.store.load(session_id)
+            except sqlite3.Error as e:
+                logger.error(f"Erro ao ler a sessão do armazenamento local: {e}")
+        if loaded is None:
+            session_id = None
+        initial, expires_at = loaded if loaded else ({}, 0.0)
+        scope["session"] = dict(initial)
+        scope["session_id"] = session_id
+
+        # WebSockets não enviam cabeçalhos de resposta: como no SessionMiddleware, alterações não são gravadas.
+        if scope["type"] == "websocket":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                cookie_value = await self._persist(scope["session"], initial, session_id, expires_at)
+                if cookie_value is not None:
+                    MutableHeaders(scope=message).append("Set-Cookie", cookie_value)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _persist(self, session: Dict[str, Any], initial: Dict[str, Any], session_id: Optional[str], expires_at: float) -> Optional[str]:
+        """Grava a sessão se ela mudou e devolve o Set-Cookie necessário (ou None)."""
+        try:
+            if session == initial:
+                if session_id and expires_at - time.time() < self.store.max_age_seconds - TOUCH_INTERVAL_SECONDS:
+                    await self.store.touch(session_id)
+                    return self._cookie(session_id)
+                return None
+
+            if not session:
+                if session_id:
+                    await self.store.delete(session_id)
+                    return self._cookie("null", expire=True)
+                return None
+
+            # Novo ID ao criar a sessão e sempre que ela muda de dono (login): evita fixação de sessão.
+            if session_id is None or session.get("user_id") != initial.get("user_id"):
+                new_id = secrets.token_urlsafe(32)
+                await self.store.save(new_id, dict(session), session_id)
+                return self._cookie(new_id)
+
+            await self.store.save(session_id, dict(session))
+            return None
+        except sqlite3.Error as e:
+            logger.error(f"Erro ao gravar a sessão no armazenamento local: {e}")
+            return None
+
+    def _cookie(self, value: str, expire: bool = False) -> str:
+        lifetime = "expires=Thu, 01 Jan 1970 00:00:00 GMT; " if expire else f"Max-Age={self.store.max_age_seconds}; "
+        return f"{COOKIE_NAME}={value}; path=/; {lifetime}{self.security_flags}"
+
+
+async def invalidate_user_sessions(user_id: int, keep_session_id: Optional[str] = None) -> int:
+    """Encerra as sessões do usuário em todos os workers (menos `keep_session_id`). Sem efeito no modo cookie."""
+    if config.SESSION_BACKEND != "server":
+        return 0
+    removed = await session_store.delete_user_sessions(user_id, keep_session_id)
+    if removed:
+        logger.info(f"{removed} sessão(ões) do usuário {user_id} encerrada(s).")
+    return removed
+